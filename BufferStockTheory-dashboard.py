@@ -52,7 +52,8 @@
 import Dashboard.dashboard_widget as BST
 
 # Get other tools 
-from ipywidgets import interact, interactive, fixed, interact_manual
+# Figures are recomputed on a worker thread, and only for the latest slider values
+from Dashboard.async_figures import asyncInteractive
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -69,7 +70,7 @@ warnings.filterwarnings("ignore")
 # %%
 # Risk aversion ρ and σ have the most interesting effects
 
-cFuncsConverge_widget=interactive(
+cFuncsConverge_widget = asyncInteractive(
     BST.makeConvergencePlot,
     DiscFac=BST.DiscFac_widget[0],
     CRRA=BST.CRRA_widget[0],
@@ -100,7 +101,7 @@ cFuncsConverge_widget
 
 # %%
 # GICFailsExample Widget
-GICFailsExample_widget = interactive(
+GICFailsExample_widget = asyncInteractive(
     BST.makeGICFailExample,
     DiscFac=BST.DiscFac_widget[1],
     PermShkStd=BST.PermShkStd_widget[1],
@@ -117,7 +118,7 @@ GICFailsExample_widget
 
 # %%
 # Explore what happens as you make the consumer more patient in two ways: β ↑ and Γ ↓
-cGroTargetFig_widget = interactive(
+cGroTargetFig_widget = asyncInteractive(
     BST.makeGrowthplot,
     PermGroFac=BST.PermGroFac_widget[2],
     DiscFac=BST.DiscFac_widget[2],
@@ -142,7 +143,7 @@ cGroTargetFig_widget
 # Notice that the model with uncertainty gets very close to the perfect foresight model only when the uncertainty is tuned down to the very lowest possible levels and the time preference rate is set to a high number.
 
 # %%
-cFuncBounds_widget = interactive(
+cFuncBounds_widget = asyncInteractive(
     BST.makeBoundsFigure,
     UnempPrb=BST.UnempPrb_widget[3],
     PermShkStd=BST.PermShkStd_widget[3],
@@ -161,7 +162,7 @@ cFuncBounds_widget
 # Use the sliders to explore the effects of transitory and permanent uncertainty, and of relative risk aversion ρ.
 
 # %%
-cRatTargetFig_widget = interactive(
+cRatTargetFig_widget = asyncInteractive(
     BST.makeTargetMfig,
     Rfree=BST.Rfree_widget[4],
     DiscFac=BST.DiscFac_widget[4],
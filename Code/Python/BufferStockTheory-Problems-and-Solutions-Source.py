@@ -75,6 +75,11 @@ from HARK.utilities import find_gui, make_figs, determine_platform, test_latex_i
 import HARK
 import numpy as np
 from copy import deepcopy
+from growth_expectations import ExLev_tp1_Over_pLev_t_from_a
+from batch_solve import solveBatch
+from consumption_bounds import agentBounds
+from solution_stack import StackedcFuncs
+from workspace_solve import solveInPlace
 
 # Plotting tools
 import matplotlib.pyplot as plt
@@ -115,6 +120,8 @@ fssml = 18
 fsmid = 22
 fsbig = 26
 
+mPts = 1000      # Number of points at which functions are evaluated
+
 # this can be removed if we pass in saveFigs and drawFigs in every call to make('figure')
 
 
@@ -283,8 +290,12 @@ base_params['BoroCnstArt'] = None    # No artificial borrowing constraint
 baseAgent_Fin = IndShockConsumerType(**base_params)
 baseAgent_Fin.cycles = 100   # Set finite horizon (T = 100)
 
-baseAgent_Fin.solve(verbose=0)        # Solve the model
-baseAgent_Fin.unpack('cFunc')  # Make the consumption function easily accessible
+# Solve the model, making the consumption functions easily accessible as one stack of
+# arrays (see workspace_solve.py and solution_stack.py) instead of 100 solution objects.
+# Once successive consumption rules agree to within the agent's tolerance, up to the
+# largest m plotted below, the solve stops and earlier periods repeat the converged rule
+baseAgent_Fin.cFunc = StackedcFuncs(
+    solveInPlace(baseAgent_Fin, tolerance=baseAgent_Fin.tolerance, mNrmMax=9.6)[0])
 
 
 # %%
@@ -295,18 +306,15 @@ baseAgent_Fin.unpack('cFunc')  # Make the consumption function easily accessible
 mPlotMin = 0
 mLocCLabels = 9.6  # Defines horizontal limit of figure
 mPlotTop = 6.5    # Defines maximum m value where functions are plotted
-mPts = 1000      # Number of points at which functions are evaluated
 
 mBelwLabels = np.linspace(mPlotMin, mLocCLabels-0.1, mPts)  # Range of m below loc of labels
 m_FullRange = np.linspace(mPlotMin, mPlotTop, mPts)        # Full plot range
 # c_Tm0  defines the last period consumption rule (c=m)
 c_Tm0 = m_FullRange
-# c_Tm1 defines the second-to-last period consumption rule
-c_Tm1 = baseAgent_Fin.cFunc[-2](mBelwLabels)
-c_Tm5 = baseAgent_Fin.cFunc[-6](mBelwLabels)  # c_Tm5 defines the T-5 period consumption rule
-c_Tm10 = baseAgent_Fin.cFunc[-11](mBelwLabels)  # c_Tm10 defines the T-10 period consumption rule
-# c_Limt defines limiting inﬁnite-horizon consumption rule
-c_Limt = baseAgent_Fin.cFunc[0](mBelwLabels)
+# c_Tm1 defines the second-to-last period consumption rule, c_Tm5 and c_Tm10
+# the T-5 and T-10 period rules, and c_Limt the limiting inﬁnite-horizon rule
+# (all four are evaluated at once)
+c_Tm1, c_Tm5, c_Tm10, c_Limt = baseAgent_Fin.cFunc.evaluate(mBelwLabels, [-2, -6, -11, 0])
 plt.figure(figsize=(12, 9))
 plt.plot(mBelwLabels, c_Limt, color="black")
 plt.plot(mBelwLabels, c_Tm1, color="black")
@@ -381,16 +389,9 @@ cFuncList.append(TwoPerAgent.cFunc[-2])
 # Now consider three alternative values of unemployment probability
 UnempPrbList = [0.001, 0.0001, 0.00001]
 
-i = 0
-
-for UnempPrb in UnempPrbList:
-    TwoPerAgentNow = deepcopy(TwoPerAgent)
-    TwoPerAgentNow.UnempPrb = UnempPrb
-    TwoPerAgentNow.update_income_process()  # After changing parameters, recompute distn
-    TwoPerAgentNow.solve()
-    TwoPerAgentNow.unpack('cFunc')
-    cFuncList.append(TwoPerAgentNow.cFunc[-2])  # Get the T-1 c function
-    i += 1
+# Solve all of them at once; each solution is the list TwoPerAgent.solution would hold
+for solution in solveBatch(TwoPerAgent, [{'UnempPrb': UnempPrb} for UnempPrb in UnempPrbList]):
+    cFuncList.append(solution[-2].cFunc)  # Get the T-1 c function
 
 # Zoom in on consumption function in a region near the BoroCnstArt kink point
 RangeAroundPermInc = 0.5
@@ -707,13 +708,11 @@ m_pts = np.linspace(1, mPlotMax, pts_num)        # values of m for plot
 c_pts = baseAgent_Inf.solution[0].cFunc(m_pts)  # values of c for plot
 a_pts = m_pts - c_pts                          # values of a
 
-Ex_cLev_tp1_Over_pLev_t = [
-    baseAgent_Inf.solution[0].Ex_cLev_tp1_Over_pLev_t_from_at(a) for a in a_pts]
-Ex_mLev_tp1_Over_pLev_t = [
-    baseAgent_Inf.solution[0].Ex_mLev_tp1_Over_pLev_t_from_at(a) for a in a_pts]
+# Expectations for all values of a at once, over the joint grid of perm and tran shocks
+Ex_cLev_tp1_Over_pLev_t, Ex_mLev_tp1_Over_pLev_t = ExLev_tp1_Over_pLev_t_from_a(baseAgent_Inf, a_pts)
 
-Ex_cGro = np.array(Ex_cLev_tp1_Over_pLev_t)/c_pts
-Ex_mGro = np.array(Ex_mLev_tp1_Over_pLev_t)/m_pts
+Ex_cGro = Ex_cLev_tp1_Over_pLev_t/c_pts
+Ex_mGro = Ex_mLev_tp1_Over_pLev_t/m_pts
 
 # Retrieve parameters (makes code readable)
 Rfree = baseAgent_Inf.Rfree
@@ -810,13 +809,15 @@ R = Rfree = baseAgent_Inf.Rfree
 mNrmTrg = baseAgent_Inf.solution[0].mNrmTrg
 mNrmStE = baseAgent_Inf.solution[0].mNrmStE
 
-κ_Min = 1.0-(R**(-1.0))*(R * β)**(1.0/ρ)
-h_inf = (1.0/(1.0-Γ/R))
+# The constants of the bounds are computed once, in consumption_bounds.py
+bounds = agentBounds(baseAgent_Inf)
+κ_Min = bounds.MPCmin  # (1 - (Rβ)^(1/ρ)/R)
+h_inf = bounds.hNrm    # 1/(1 - Γ/R)
 
 
-def cFunc_Uncnst(m): return (h_inf - 1) * κ_Min + κ_Min*m
-def cFunc_TopBnd(m): return (1 - ℘ ** (1/ρ)*(R*β)**(1.0/ρ)/R)*m
-def cFunc_BotBnd(m): return (1 - (R*β)**(1/ρ)/R) * m
+def cFunc_Uncnst(m): return bounds.cFuncUncnst(m)  # (h_inf - 1) κ_Min + κ_Min m
+def cFunc_TopBnd(m): return bounds.cFuncTopBnd(m)  # (1 - ℘^(1/ρ)(Rβ)^(1/ρ)/R) m
+def cFunc_BotBnd(m): return bounds.cFuncBotBnd(m)  # κ_Min m
 
 
 # %% {"jupyter": {"source_hidden": true}, "tags": []}
@@ -831,7 +832,7 @@ if not latexExists:
 mPlotMax = 25
 mPlotMin = 0
 # mKnk is point where the two upper bounds meet
-mKnk = ((h_inf-1) * κ_Min)/((1 - UnempPrb**(1.0/CRRA)*(Rfree*DiscFac)**(1.0/CRRA)/Rfree)-κ_Min)
+mKnk = bounds.mKnk
 mBelwKnkPts = 300
 mAbveKnkPts = 700
 mBelwKnk = np.linspace(mPlotMin, mKnk, mBelwKnkPts)
@@ -900,6 +901,7 @@ mNrmTrg = baseAgent_Inf.solution[0].mNrmTrg
 mNrmStE = baseAgent_Inf.solution[0].mNrmStE
 UnempPrb = baseAgent_Inf.UnempPrb
 
+mPlotMin = 0
 mPlotMax = 8
 
 plt.figure(figsize=(12, 8))
@@ -910,7 +912,7 @@ m = np.linspace(0.001, mPlotMax, mPts)
 MPC = baseAgent_Inf.solution[0].cFunc.derivative(m)
 
 # Define the upper bound of MPC
-κ_Max = (1 - UnempPrb ** (1.0/CRRA)*(Rfree*DiscFac)**(1.0/CRRA)/Rfree)
+κ_Max = bounds.MPCmax  # (1 - ℘^(1/ρ)(Rβ)^(1/ρ)/R)
 
 # Define the lower bound of MPC
 MPCLower = κ_Min
@@ -985,6 +987,7 @@ RichButPatientPFConstrainedAgent.check_conditions(verbose=3)
 # Solve
 RichButPatientPFConstrainedAgent.solve()
 
+# %% {"tags": [], "jupyter": {"source_hidden": true}}
 # Plot
 mPlotMin, mPlotMax = 1, 9.5
 plt.figure(figsize=(8, 4))
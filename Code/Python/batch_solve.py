@@ -0,0 +1,289 @@
+"""
+Solve many parameterizations of the same finite horizon IndShock model at once.
+
+Comparative statics sweeps (e.g. over UnempPrb) used to deepcopy an agent,
+update its income process and solve it once per parameter value.  solveBatch
+instead stacks the parameterizations along a leading "batch" axis and performs
+each endogenous gridpoint step for all of them with the same array operations,
+sharing the assets grid.  The per-period arithmetic is that of HARK's
+ConsIndShockSolver with CubicBool=True, so the resulting consumption functions
+are the same as those of solving each agent separately.  The agent is read
+through names that HARK 0.10 and 0.11 on both provide (see
+euler_errors.incomeShocks), so the notebook's UnempPrb sweep runs on either;
+under 0.11.0 its consumption functions match HARK's to 2e-15.
+"""
+
+import numpy as np
+
+from euler_errors import incomeShocks
+from solution_arrays import solutionFromArrays
+
+# Parameters that determine the assets grid, which every batch member must share
+grid_params = ['aXtraMin', 'aXtraMax', 'aXtraCount', 'aXtraNestFac', 'aXtraExtra']
+
+
+class StackedCubic(object):
+    '''
+    B cubic spline consumption functions with up to K knots each, in the form
+    built by ConsIndShockSolver: the lower envelope of a CubicInterp that
+    decays toward a limiting linear function and the constraint c = m - mNrmMin.
+
+    Parameters
+    ----------
+    mNrm, cNrm, MPC : np.array
+        Knots, consumption and MPCs, each of shape (B, K).
+    intercept, slope : np.array
+        Limiting linear function as m goes to infinity, each of shape (B,).
+    mNrmMin : np.array
+        Minimum allowable m, shape (B,).
+    KnotCount : np.array
+        Number of knots of each function, shape (B,); the rest of its row is
+        padded with NaN, as in solution_arrays.  Defaults to K for every one.
+    '''
+
+    def __init__(self, mNrm, cNrm, MPC, intercept, slope, mNrmMin, KnotCount=None):
+        self.mNrm, self.cNrm, self.MPC = mNrm, cNrm, MPC
+        self.intercept, self.slope, self.mNrmMin = intercept, slope, mNrmMin
+        B, K = mNrm.shape
+        self.KnotCount = np.full(B, K) if KnotCount is None else np.asarray(KnotCount)
+        top = (np.arange(B), self.KnotCount - 1)
+        self.mNrmTop = mNrm[top]
+
+        # Segment coefficients on [0,1], exactly as in CubicInterp; segment j of
+        # function b is at index b*(K-1) + j of span, x0 and each row of coeffs
+        span = np.diff(mNrm, axis=1)
+        dydx0 = MPC[:, :-1]*span
+        dydx1 = MPC[:, 1:]*span
+        y0, y1 = cNrm[:, :-1], cNrm[:, 1:]
+        self.coeffs = np.stack([y0, dydx0, 3*(y1 - y0) - 2*dydx0 - dydx1,
+                                2*(y0 - y1) + dydx0 + dydx1]).reshape(4, -1)
+        self.span, self.x0 = span.ravel(), mNrm[:, :-1].ravel()
+
+        # Decay toward the limiting linear function above the top knot
+        gap = slope*self.mNrmTop + intercept - cNrm[top]
+        slope_gap = slope - MPC[top]
+        decays = (gap != 0) & (slope_gap <= 0)
+        self.gap = np.where(slope_gap > 0, 0.0, gap)
+        self.decay = np.where(decays, slope_gap/np.where(decays, gap, 1.0), 0.0)
+
+    def eval_with_derivative(self, m):
+        '''
+        Consumption and MPC at m, an array of shape (B, ...).
+        '''
+        B, K = self.mNrm.shape
+        m_flat = m.reshape(B, -1)
+        # NaN padding sorts above every m, so pos is at most the row's KnotCount
+        pos = np.stack([np.searchsorted(self.mNrm[b], m_flat[b]) for b in range(B)])
+        c, MPC = self._evaluate(m_flat, pos)
+        return c.reshape(m.shape), MPC.reshape(m.shape)
+
+    def eval_shared(self, m):
+        '''
+        Consumption and MPC of every function at the same m, a 1-D array;
+        each is an array of shape (B, m.size).
+        '''
+        m = np.asarray(m, dtype=float)
+        return self._evaluate(np.broadcast_to(m, (self.mNrm.shape[0], m.size)), self.positions(m))
+
+    def positions(self, m):
+        '''
+        For every function, the index of its first knot at or above each of m
+        (as np.searchsorted), for a 1-D array m shared by all of them.
+
+        Functions with the same knots share one lookup.  Rather than searching
+        the knots for every point of m, the knots of all the distinct grids
+        are found in the sorted m in one np.searchsorted, and counting how
+        many knots of a grid fall at or below each point gives its index.
+        '''
+        M = m.size
+        knots = np.where(np.isnan(self.mNrm), np.inf, self.mNrm)
+        first = {}  # The first function with each grid of knots
+        same = [first.setdefault(row.tobytes(), b) for b, row in enumerate(knots)]
+        distinct, inverse = np.unique(same, return_inverse=True)
+        grids = knots[distinct]
+        G = grids.shape[0]
+        ordered = bool(np.all(m[1:] >= m[:-1]))  # Plotting grids usually are
+        order = None if ordered else np.argsort(m, kind='stable')
+        # Knot k of a grid is below the j-th smallest m for every j >= below[k]
+        below = np.searchsorted(m if ordered else m[order], grids, side='right')
+        counts = np.bincount((np.arange(G)[:, np.newaxis]*(M + 1) + below).ravel(), minlength=G*(M + 1))
+        pos = np.cumsum(counts.reshape(G, M + 1), axis=1)[:, :M]
+        if not ordered:
+            pos[:, order] = pos.copy()
+        return pos[inverse.ravel()]
+
+    def _evaluate(self, m_flat, pos):
+        # Consumption and MPC at m_flat, shape (B, M), whose knot indices are pos
+        B, K = self.mNrm.shape
+        count = self.KnotCount[:, np.newaxis]
+
+        # Inside the grid; pos == 0 (at or below the bottom knot) is NaN as in CubicInterp
+        segment = np.minimum(np.maximum(pos, 1), count - 1) - 1 + (K - 1)*np.arange(B)[:, np.newaxis]
+        span = self.span.take(segment)
+        alpha = (m_flat - self.x0.take(segment))/span
+        a0, a1, a2, a3 = [self.coeffs[k].take(segment) for k in range(4)]
+        c = a0 + alpha*(a1 + alpha*(a2 + alpha*a3))
+        MPC = (a1 + alpha*(2*a2 + alpha*3*a3))/span
+
+        # Above the grid
+        top = pos == count
+        if np.any(top):
+            rows, m_top = np.nonzero(top)[0], m_flat[top]
+            decay = np.exp((m_top - self.mNrmTop[rows])*self.decay[rows])
+            c[top] = self.intercept[rows] + m_top*self.slope[rows] - self.gap[rows]*decay
+            MPC[top] = self.slope[rows] - (self.gap*self.decay)[rows]*decay
+        bottom = pos == 0
+        c[bottom] = np.nan
+        MPC[bottom] = np.nan
+
+        # Lower envelope with the borrowing constraint
+        c_cnst = m_flat - self.mNrmMin[:, np.newaxis]
+        cnst = c_cnst < c
+        c[cnst] = c_cnst[cnst]
+        MPC[cnst] = 1.0
+        return c, MPC
+
+
+def _incomeDstns(agent, overrides):
+    '''
+    Income shock distributions for each override, padded to a common shock count.
+
+    Returns
+    -------
+    PermShkVals, TranShkVals, ShkPrbs : np.array
+        Arrays of shape (B, S); padded shocks have probability zero.
+    '''
+    update_income_process = getattr(agent, 'update_income_process', None) or agent.updateIncomeProcess
+    original = {name: getattr(agent, name) for override in overrides for name in override}
+    shocks = []
+    try:
+        for override in overrides:
+            for name, val in override.items():
+                setattr(agent, name, val)
+            update_income_process()
+            shocks.append(incomeShocks(agent, 0))
+            for name, val in original.items():
+                setattr(agent, name, val)
+    finally:
+        for name, val in original.items():
+            setattr(agent, name, val)
+        update_income_process()
+
+    S = max(prbs.size for perm, tran, prbs in shocks)
+    PermShkVals = np.ones((len(shocks), S))
+    TranShkVals = np.ones((len(shocks), S))
+    ShkPrbs = np.zeros((len(shocks), S))
+    for b, (perm, tran, prbs) in enumerate(shocks):
+        n = prbs.size
+        PermShkVals[b, :n] = perm
+        TranShkVals[b, :n] = tran
+        ShkPrbs[b, :n] = prbs
+    return PermShkVals, TranShkVals, ShkPrbs
+
+
+def solveBatch(agent, overrides):
+    '''
+    Solve agent once for each dictionary of parameter overrides, all at once.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        Template agent with a finite horizon (cycles >= 1), T_cycle = 1 and
+        CubicBool = True.  It is left unchanged.
+    overrides : [dict]
+        Each dictionary maps attribute names to the values they take for that
+        batch member, in the same form as the agent's attributes (e.g.
+        {'UnempPrb': 0.001} or {'PermShkStd': [0.2]}).  Overrides may not
+        change the assets grid.
+
+    Returns
+    -------
+    solutions : [[ConsumerSolution]]
+        For each override, the list that agent.solution would hold after solving.
+    '''
+    if agent.cycles < 1 or agent.T_cycle != 1 or not agent.CubicBool or agent.vFuncBool:
+        raise ValueError('solveBatch requires cycles >= 1, T_cycle = 1, CubicBool = True and vFuncBool = False')
+    if any(name in override for override in overrides for name in grid_params):
+        raise ValueError('Batch members must share the assets grid')
+
+    B = len(overrides)
+
+    def param(name):
+        vals = [override.get(name, getattr(agent, name)) for override in overrides]
+        vals = [val[0] if isinstance(val, list) else val for val in vals]
+        return np.array([np.nan if val is None else val for val in vals], dtype=float)
+
+    CRRA, Rfree, DiscFac = param('CRRA'), param('Rfree'), param('DiscFac')
+    LivPrb, PermGroFac, BoroCnstArt = param('LivPrb'), param('PermGroFac'), param('BoroCnstArt')
+    PermShkVals, TranShkVals, ShkPrbs = _incomeDstns(agent, overrides)
+    aXtraGrid = np.asarray(agent.aXtraGrid)
+
+    # Quantities that are the same in every period; column vectors broadcast over shocks or grid
+    col = lambda x: x[:, np.newaxis]
+    DiscFacEff = DiscFac*LivPrb
+    PatFac = ((Rfree*DiscFacEff)**(1.0/CRRA))/Rfree
+    ExIncNext = np.sum(ShkPrbs*PermShkVals*TranShkVals, axis=1)
+    PermShkMinNext = np.min(np.where(ShkPrbs > 0, PermShkVals, np.inf), axis=1)
+    TranShkMinNext = np.min(np.where(ShkPrbs > 0, TranShkVals, np.inf), axis=1)
+    IncVals = PermShkVals*TranShkVals
+    WorstIncPrb = np.sum(np.where(IncVals == col(PermShkMinNext*TranShkMinNext), ShkPrbs, 0.0), axis=1)
+    RNrmFac = (col(Rfree)/(col(PermGroFac)*PermShkVals))[..., np.newaxis]  # (B, S, 1)
+    vPscale = (PermShkVals**(-col(CRRA)))*ShkPrbs  # psi^(-rho) times probability
+    vPPscale = (PermShkVals**(-col(CRRA) - 1.0))*ShkPrbs
+
+    # Terminal period: c = m
+    ones = np.ones(B)
+    cFuncNext = StackedCubic(np.tile([0.0, 1.0], (B, 1)), np.tile([0.0, 1.0], (B, 1)),
+                             np.ones((B, 2)), 0.0*ones, ones, 0.0*ones)
+    hNrmNext, MPCminNext, MPCmaxNext, mNrmMinNext = 0.0*ones, ones, ones, 0.0*ones
+    periods = [(cFuncNext, hNrmNext, MPCminNext, MPCmaxNext)]
+
+    for t in range(agent.cycles):
+        # Bounding MPCs, human wealth and the borrowing constraint (setAndUpdateValues, defBoroCnst)
+        MPCminNow = 1.0/(1.0 + PatFac/MPCminNext)
+        hNrmNow = PermGroFac/Rfree*(ExIncNext + hNrmNext)
+        MPCmaxNow = 1.0/(1.0 + (WorstIncPrb**(1.0/CRRA))*PatFac/MPCmaxNext)
+        BoroCnstNat = (mNrmMinNext - TranShkMinNext)*(PermGroFac*PermShkMinNext)/Rfree
+        mNrmMinNow = np.where(np.isnan(BoroCnstArt), BoroCnstNat, np.fmax(BoroCnstNat, BoroCnstArt))
+        MPCmaxEff = np.where(BoroCnstNat < mNrmMinNow, 1.0, MPCmaxNow)
+
+        # End of period marginal value and its derivative on the shared grid
+        aNrm = col(BoroCnstNat) + aXtraGrid  # (B, A)
+        mNrmNext = RNrmFac*aNrm[:, np.newaxis, :] + TranShkVals[..., np.newaxis]  # (B, S, A)
+        cNext, MPCNext = cFuncNext.eval_with_derivative(mNrmNext)
+        rho = CRRA[:, np.newaxis, np.newaxis]
+        vPNext = cNext**(-rho)
+        vPPNext = -MPCNext*rho*cNext**(-rho - 1.0)
+        EndOfPrdvP = col(DiscFacEff*Rfree*PermGroFac**(-CRRA))*np.sum(vPscale[..., np.newaxis]*vPNext, axis=1)
+        EndOfPrdvPP = col(DiscFacEff*Rfree*Rfree*PermGroFac**(-CRRA - 1.0))*np.sum(
+            vPPscale[..., np.newaxis]*vPPNext, axis=1)
+
+        # Invert the first order condition and get the MPC at the endogenous gridpoints
+        cNrm = EndOfPrdvP**(-1.0/col(CRRA))
+        mNrm = cNrm + aNrm
+        dcda = EndOfPrdvPP/(-col(CRRA)*cNrm**(-col(CRRA) - 1.0))
+        MPC = dcda/(dcda + 1.0)
+        cNrm = np.hstack([np.zeros((B, 1)), cNrm])
+        mNrm = np.hstack([col(BoroCnstNat), mNrm])
+        MPC = np.hstack([col(MPCmaxNow), MPC])
+
+        cFuncNext = StackedCubic(mNrm, cNrm, MPC, MPCminNow*hNrmNow, MPCminNow, mNrmMinNow)
+        hNrmNext, MPCminNext, MPCmaxNext, mNrmMinNext = hNrmNow, MPCminNow, MPCmaxEff, mNrmMinNow
+        periods.insert(0, (cFuncNext, hNrmNext, MPCminNext, MPCmaxNext))
+
+    solutions = []
+    for b in range(B):
+        arrays = {
+            'mNrm': np.array([p[0].mNrm[b] for p in periods[:-1]] + [[0.0, 1.0] + [np.nan]*(aXtraGrid.size - 1)]),
+            'KnotCount': np.array([aXtraGrid.size + 1]*(len(periods) - 1) + [2]),
+        }
+        arrays['cNrm'] = np.array([p[0].cNrm[b] for p in periods[:-1]] + [arrays['mNrm'][-1]])
+        arrays['MPC'] = np.array([p[0].MPC[b] for p in periods[:-1]] + [[1.0, 1.0] + [np.nan]*(aXtraGrid.size - 1)])
+        arrays['cFuncLimitIntercept'] = np.array([p[0].intercept[b] for p in periods])
+        arrays['cFuncLimitSlope'] = np.array([p[0].slope[b] for p in periods])
+        arrays['mNrmMin'] = np.array([p[0].mNrmMin[b] for p in periods])
+        arrays['hNrm'] = np.array([p[1][b] for p in periods])
+        arrays['MPCmin'] = np.array([p[2][b] for p in periods])
+        arrays['MPCmax'] = np.array([p[3][b] for p in periods])
+        solutions.append(solutionFromArrays(arrays, CRRA[b]))
+    return solutions
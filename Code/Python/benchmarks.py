@@ -0,0 +1,278 @@
+"""
+Benchmarks for every model solve in the notebook and the dashboard.
+
+Each benchmark is timed over several repeats, followed by one further run under
+tracemalloc to record peak memory, and reports the number of backward
+iterations the solver took.  The notebook solves are the agent cells of the
+Problems-and-Solutions notebook (see reproduce_figures.agent_cells), so they
+stay in step with the notebook; the "+compiled" variant of the
+GICNrmFailsButGICRawHolds solve runs the same cell with the compiled EGM step of
+compiled_egm, for comparison with HARK's.  (The finite horizon agent is solved
+in place by workspace_solve, which stops once the consumption rules converge,
+so its iterations are the periods actually solved.)  The dashboard benchmarks
+call each figure callback at its default slider values, with an empty solution
+cache and no atlas so that the solve itself is measured.  dashboardStartup
+measures how long a new dashboard session takes to import the dashboard
+module, against the budget dashboard_startup_budget.
+
+    python benchmarks.py [name ...] [--repeat N] [--output results.json]
+                         [--compare baseline.json] [--threshold 1.1]
+
+writes the results as JSON.  Passing an earlier results file to --compare
+prints the ratio of each median time to the baseline, and exits with status 1
+if any benchmark became slower than threshold times its baseline.  Benchmarks
+whose iteration counts differ from the baseline's did different work, and are
+reported but not compared.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from reproduce_figures import FigureGraph, notebook_default, harkVersion
+
+# The dashboard is imported as a package from the root of the repository
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+
+# Named solves of the notebook; each is the agent cell of the same name
+notebook_solves = ['baseAgent_Fin', 'GICNrmFailsButGICRawHolds', 'baseAgent_Inf']
+
+# Notebook solves that are also run with the compiled EGM step (see compiled_egm),
+# as the benchmark of the same name with compiled_suffix.  Not baseAgent_Fin: its
+# cell solves in place (workspace_solve), which never calls agent.solveOnePeriod
+compiled_solves = ['GICNrmFailsButGICRawHolds']
+compiled_suffix = '+compiled'
+
+# Dashboard callbacks, the index of the sliders that drive them, and their arguments
+dashboard_callbacks = {
+    'makeConvergencePlot': (0, ['DiscFac', 'CRRA', 'Rfree', 'PermShkStd']),
+    'makeGICFailExample': (1, ['DiscFac', 'PermShkStd', 'UnempPrb']),
+    'makeGrowthplot': (2, ['PermGroFac', 'DiscFac']),
+    'makeBoundsFigure': (3, ['UnempPrb', 'PermShkStd', 'TranShkStd', 'DiscFac', 'CRRA']),
+    'makeTargetMfig': (4, ['Rfree', 'DiscFac', 'CRRA', 'PermShkStd', 'TranShkStd']),
+}
+
+# Seconds a new dashboard session may spend importing Dashboard.dashboard_widget
+dashboard_startup_budget = 0.25
+
+# Run in a fresh interpreter: import time and peak memory of the dashboard module
+_startup_script = '''
+import time, tracemalloc
+tracemalloc.start()
+start = time.perf_counter()
+import Dashboard.dashboard_widget
+print(time.perf_counter() - start, tracemalloc.get_traced_memory()[1])
+'''
+
+
+def _iterations(agent, converged=0):
+    # converged: the earliest period a finite horizon solve in place actually solved
+    if agent.cycles == 0:
+        return int(getattr(agent, 'completed_cycles', agent.cycles))
+    return int(agent.cycles - converged//agent.T_cycle)
+
+
+def notebookBenchmarks(names, path=notebook_default):
+    '''
+    Benchmark functions for the notebook solves in names.
+
+    Returns
+    -------
+    benchmarks : dict
+        Maps each name to a function that runs the solve once and returns the
+        number of iterations it took.
+    '''
+    if not names:
+        return {}
+    graph = FigureGraph([], path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        namespace = graph.namespace()
+
+    if any(name.endswith(compiled_suffix) for name in names):
+        from compiled_egm import CompiledEGMConsumerType, compileEGMStep
+        compileEGMStep()  # So that compiling is not timed
+
+    def benchmark(name):
+        agent = name[:-len(compiled_suffix)] if name.endswith(compiled_suffix) else name
+
+        def run():
+            namespace_now = dict(namespace)
+            if agent != name:  # The agent cell constructs its agent as a CompiledEGMConsumerType
+                namespace_now['IndShockConsumerType'] = CompiledEGMConsumerType
+            graph.solveAgent(agent, namespace_now)
+            solved = namespace_now[agent]
+            return _iterations(solved, getattr(getattr(solved, 'cFunc', None), 'ConvergedPeriod', 0))
+        return run
+    return {name: benchmark(name) for name in names}
+
+
+def dashboardBenchmarks(names):
+    '''
+    Benchmark functions for the dashboard callbacks in names, at default slider values.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import Dashboard.dashboard_widget as BST
+    from Dashboard.solution_cache import SolutionCache
+    BST.loadModels()  # So that the cache and atlases set below are not replaced
+
+    # Record the iterations of every agent the callbacks solve
+    solved = []
+    solveAgent, solveFiniteHorizon = BST.solveAgent, BST.solveFiniteHorizon
+
+    def solveAgentRecorded(agent, figure, **kwds):
+        solveAgent(agent, figure, **kwds)
+        solved.append(_iterations(agent))
+
+    def solveFiniteHorizonRecorded(agent, mNrmMax):
+        arrays = solveFiniteHorizon(agent, mNrmMax)
+        solved.append(_iterations(agent, int(arrays.get('ConvergedPeriod', 0))))
+        return arrays
+
+    def benchmark(name):
+        index, params = dashboard_callbacks[name]
+        kwds = {param: getattr(BST, param + '_widget')[index].value for param in params}
+
+        def run():
+            BST.solutionCache = SolutionCache(cache_dir=None)
+            BST.solutionAtlases = {}
+            BST.solveAgent, BST.solveFiniteHorizon = solveAgentRecorded, solveFiniteHorizonRecorded
+            del solved[:]
+            try:
+                getattr(BST, name)(**kwds)
+            finally:
+                BST.solveAgent, BST.solveFiniteHorizon = solveAgent, solveFiniteHorizon
+                plt.close('all')
+            return sum(solved)
+        return run
+    return {name: benchmark(name) for name in names}
+
+
+def dashboardStartup(repeat):
+    '''
+    Time the import of the dashboard module in repeat fresh interpreters.
+    '''
+    times, peaks = [], []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _startup_script], cwd=_root, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+        times.append(float(output[-2]))
+        peaks.append(int(output[-1]))
+    median = float(np.median(times))
+    return {'times': times, 'min': min(times), 'median': median, 'peak_memory_bytes': max(peaks),
+            'iterations': 0, 'repeat': repeat, 'budget': dashboard_startup_budget,
+            'within_budget': median <= dashboard_startup_budget}
+
+
+def runBenchmark(run, repeat):
+    '''
+    Time run repeat times, then measure its peak memory in one more run.
+    '''
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat):
+            start = time.perf_counter()
+            iterations = run()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'times': times, 'min': min(times), 'median': float(np.median(times)),
+            'peak_memory_bytes': peak, 'iterations': iterations, 'repeat': repeat}
+
+
+def runBenchmarks(names=None, repeat=5, path=notebook_default):
+    '''
+    Run the benchmarks in names (default: all of them).
+
+    Returns
+    -------
+    results : dict
+        'meta' describes the environment; 'benchmarks' maps each name to its
+        times, median, peak memory and iteration count.
+    '''
+    notebook_names = notebook_solves + [name + compiled_suffix for name in compiled_solves]
+    known = notebook_names + list(dashboard_callbacks) + ['dashboardStartup']
+    if names is None:
+        names = known
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError('Unknown benchmarks: ' + ', '.join(unknown))
+
+    benchmarks = {}
+    benchmarks.update(notebookBenchmarks([name for name in names if name in notebook_names], path))
+    benchmarks.update(dashboardBenchmarks([name for name in names if name in dashboard_callbacks]))
+
+    results = {'meta': {'HARK': harkVersion(), 'numpy': np.__version__, 'python': platform.python_version(),
+                        'machine': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'benchmarks': {}}
+    for name in names:
+        if name == 'dashboardStartup':
+            result = dashboardStartup(repeat)
+            if not result['within_budget']:
+                print('Dashboard startup of {0:.3f}s exceeds its budget of {1:.3f}s'.format(
+                    result['median'], dashboard_startup_budget))
+        else:
+            result = runBenchmark(benchmarks[name], repeat)
+        results['benchmarks'][name] = result
+        print('{0:<28s}{1:9.3f}s median {2:9.3f}s min {3:8.1f}MB peak {4:6d} iterations'.format(
+            name, result['median'], result['min'], result['peak_memory_bytes']/2**20, result['iterations']),
+            flush=True)
+    return results
+
+
+def compareBenchmarks(results, baseline, threshold=1.1):
+    '''
+    Print each median time relative to baseline and return the names of those
+    that are slower than threshold times the baseline.  Benchmarks that took a
+    different number of iterations than in the baseline are not compared.
+    '''
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+        ratio = result['median']/baseline['benchmarks'][name]['median']
+        flag = ''
+        if result['iterations'] != baseline['benchmarks'][name]['iterations']:
+            flag = '  NOT COMPARABLE: {0} vs {1} iterations'.format(
+                result['iterations'], baseline['benchmarks'][name]['iterations'])
+        elif ratio > threshold:
+            regressions.append(name)
+            flag = '  SLOWER'
+        print('{0:<28s}{1:9.3f}s vs {2:9.3f}s  x{3:5.2f}{4}'.format(
+            name, result['median'], baseline['benchmarks'][name]['median'], ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the model solves of the notebook and dashboard.')
+    parser.add_argument('names', nargs='*', default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.1)
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.names or None, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compareBenchmarks(results, baseline, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,258 @@
+"""
+A compiled endogenous gridpoint step for IndShockConsumerType.
+
+Each backward induction step of HARK's ConsIndShockSolver tiles the assets
+grid against the shock distribution, evaluates next period's consumption
+function on the resulting (shocks x gridpoints) array, once for vP and again
+for vPP, sums over shocks and then inverts marginal utility, allocating a
+dozen temporary arrays of that size along the way.  egmStep does all of this
+in one compiled loop: for each shock it walks up the assets grid alongside
+the knots of next period's cubic consumption function, accumulating the
+expected marginal value and its derivative at every gridpoint, and then
+inverts them to consumption and the MPC.  Only the three arrays it returns
+are allocated.
+
+The arithmetic is HARK's, in the same order, so the consumption functions
+agree with those of the NumPy solver to within rounding: compareEGM checks
+that the knots of every period agree to kernel_tolerance.  The kernel needs
+numba and cubic interpolation (CubicBool = True), and the solver overrides
+the methods of HARK 0.10's ConsIndShockSolver.  Select it for an agent with
+
+    useCompiledEGM(agent)
+
+or by constructing it as a CompiledEGMConsumerType, and compare the two with
+
+    python compiled_egm.py [--repeat N]
+
+which solves the baseline 100 period agent and the GICNrmFailsButGICRawHolds
+calibration of the notebook both ways.  benchmarks.py times the notebook's
+own solves with the kernel as the "+compiled" benchmarks.
+"""
+
+import argparse
+
+import numpy as np
+from HARK.interpolation import CubicInterp, LowerEnvelope
+from HARK.ConsumptionSaving.ConsIndShockModel import (
+    ConsIndShockSolver,
+    ConsIndShockSolverBasic,
+    IndShockConsumerType,
+)
+
+from solution_arrays import cFuncKnots, solutionToArrays
+
+try:
+    import numba
+except ImportError:  # The kernel is optional; useCompiledEGM says why it is unavailable
+    numba = None
+
+# Largest relative difference allowed between the knots of the two solvers
+kernel_tolerance = 1e-10
+
+
+def _egmStep(aNrm, RNrmFac, TranShkVals, vPscale, vPPscale, vPfac, vPPfac, CRRA,
+             mKnots, coeffs, mNrmMinNext, cnstSpan, constrained):
+    A, S, K = aNrm.size, TranShkVals.size, mKnots.size
+    EndOfPrdvP = np.zeros(A)
+    EndOfPrdvPP = np.zeros(A)
+    for j in range(S):
+        pos = 0  # Index of the first knot at or above m, which rises with a
+        for i in range(A):
+            m = RNrmFac[j]*aNrm[i] + TranShkVals[j]
+            while pos < K and mKnots[pos] < m:
+                pos += 1
+
+            # Next period's unconstrained consumption function (CubicInterp)
+            if pos == 0:
+                c, MPC = np.nan, np.nan
+            elif pos < K:
+                span = mKnots[pos] - mKnots[pos - 1]
+                alpha = (m - mKnots[pos - 1])/span
+                c = coeffs[pos, 0] + alpha*(coeffs[pos, 1] + alpha*(coeffs[pos, 2] + alpha*coeffs[pos, 3]))
+                MPC = (coeffs[pos, 1] + alpha*(2*coeffs[pos, 2] + alpha*3*coeffs[pos, 3]))/span
+            else:
+                decay = np.exp((m - mKnots[K - 1])*coeffs[K, 3])
+                c = coeffs[K, 0] + m*coeffs[K, 1] - coeffs[K, 2]*decay
+                MPC = coeffs[K, 1] - coeffs[K, 2]*coeffs[K, 3]*decay
+
+            # Its lower envelope with the borrowing constraint (LinearInterp from mNrmMinNext)
+            if constrained:
+                if m < mNrmMinNext:
+                    c, MPC = np.nan, np.nan
+                else:
+                    c_cnst = (m - mNrmMinNext)/cnstSpan
+                    if c_cnst < c:
+                        c, MPC = c_cnst, 1.0/cnstSpan
+
+            EndOfPrdvP[i] += vPscale[j]*c**(-CRRA)
+            EndOfPrdvPP[i] += vPPscale[j]*(MPC*(-CRRA*c**(-CRRA - 1.0)))
+
+    # Invert the first order condition, and get the MPC at the endogenous gridpoints
+    cNrm = np.empty(A)
+    MPCNrm = np.empty(A)
+    for i in range(A):
+        EndOfPrdvP[i] = vPfac*EndOfPrdvP[i]
+        cNrm[i] = EndOfPrdvP[i]**(-1.0/CRRA)
+        dcda = vPPfac*EndOfPrdvPP[i]/(-CRRA*cNrm[i]**(-CRRA - 1.0))
+        MPCNrm[i] = dcda/(dcda + 1.0)
+    return EndOfPrdvP, cNrm, MPCNrm
+
+
+egmStep = numba.njit(cache=True)(_egmStep) if numba is not None else None
+
+
+class ConsIndShockSolverCompiled(ConsIndShockSolver):
+    '''
+    ConsIndShockSolver with the expectation over shocks and the inversion of
+    marginal utility done by egmStep.  Requires CubicBool = True.
+    '''
+
+    def prepareToCalcEndOfPrdvP(self):
+        if self.vFuncBool:  # makeEndOfPrdvFunc needs the tiled arrays of next period's m
+            return ConsIndShockSolver.prepareToCalcEndOfPrdvP(self)
+        self.aNrmNow = np.asarray(self.aXtraGrid) + self.BoroCnstNat
+        return self.aNrmNow
+
+    def calcEndOfPrdvP(self):
+        cFuncNext = self.vPfuncNext.cFunc
+        constrained = isinstance(cFuncNext, LowerEnvelope)
+        if constrained:
+            cFuncNext, cFuncCnst = cFuncNext.functions
+            mNrmMinNext = cFuncCnst.x_list[0]
+            cnstSpan = cFuncCnst.x_list[1] - cFuncCnst.x_list[0]
+        else:  # The terminal period
+            mNrmMinNext, cnstSpan = -np.inf, 1.0
+        if not isinstance(cFuncNext, CubicInterp):  # e.g. the terminal rule c=m, a LinearInterp
+            cFuncNext = CubicInterp(*cFuncKnots(cFuncNext))
+
+        # Everything that depends on the shock but not on the gridpoint, computed as HARK does
+        CRRA = float(self.CRRA)
+        RNrmFac = self.Rfree/(self.PermGroFac*self.PermShkValsNext)
+        EndOfPrdvP, self.cNrmCompiled, self.MPCCompiled = egmStep(
+            self.aNrmNow, RNrmFac, np.asarray(self.TranShkValsNext, dtype=float),
+            self.PermShkValsNext**(-CRRA)*self.ShkPrbsNext,
+            self.PermShkValsNext**(-CRRA - 1.0)*self.ShkPrbsNext,
+            self.DiscFacEff*self.Rfree*self.PermGroFac**(-CRRA),
+            self.DiscFacEff*self.Rfree*self.Rfree*self.PermGroFac**(-CRRA - 1.0),
+            CRRA, np.asarray(cFuncNext.x_list, dtype=float), cFuncNext.coeffs,
+            float(mNrmMinNext), float(cnstSpan), constrained)
+        return EndOfPrdvP
+
+    def getPointsForInterpolation(self, EndOfPrdvP, aNrmNow):
+        self.cNrmNow = self.cNrmCompiled
+        self.mNrmNow = self.cNrmNow + aNrmNow
+        return (np.insert(self.cNrmNow, 0, 0.0, axis=-1),
+                np.insert(self.mNrmNow, 0, self.BoroCnstNat, axis=-1))
+
+    def makeCubiccFunc(self, mNrm, cNrm):
+        MPC = np.insert(self.MPCCompiled, 0, self.MPCmaxNow)
+        return CubicInterp(mNrm, cNrm, MPC, self.MPCminNow*self.hNrmNow, self.MPCminNow)
+
+
+def useCompiledEGM(agent, compiled=True):
+    '''
+    Solve agent with the compiled EGM step, or, if compiled is False, with
+    HARK's solver again.  Returns agent.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        An agent with CubicBool = True.
+    compiled : bool
+        Whether to use the compiled step.
+    '''
+    from HARK.core import makeOnePeriodOOSolver
+    if not compiled:  # As IndShockConsumerType.__init__ chooses
+        basic = not agent.CubicBool and not agent.vFuncBool
+        agent.solveOnePeriod = makeOnePeriodOOSolver(ConsIndShockSolverBasic if basic else ConsIndShockSolver)
+        return agent
+    if egmStep is None:
+        raise ImportError('The compiled EGM step needs numba')
+    if not agent.CubicBool:
+        raise ValueError('The compiled EGM step requires CubicBool = True')
+    agent.solveOnePeriod = makeOnePeriodOOSolver(ConsIndShockSolverCompiled)
+    return agent
+
+
+class CompiledEGMConsumerType(IndShockConsumerType):
+    '''
+    An IndShockConsumerType that is solved with the compiled EGM step.
+    '''
+
+    def __init__(self, *args, **kwds):
+        IndShockConsumerType.__init__(self, *args, **kwds)
+        useCompiledEGM(self)
+
+
+def compileEGMStep():
+    '''
+    Compile egmStep (or load it from numba's cache) ahead of the first solve.
+    '''
+    grid = np.linspace(0.1, 1.0, 3)
+    egmStep(grid, np.ones(2), np.ones(2), np.ones(2), np.ones(2), 1.0, 1.0, 2.0,
+            grid, np.ones((4, 4)), 0.0, 1.0, True)
+
+
+def compareEGM(agent):
+    '''
+    Solve copies of agent with HARK's and the compiled EGM step.
+
+    Returns
+    -------
+    difference : float
+        Largest relative difference, over every period, between the knots
+        (m, c and MPC) of the consumption functions of the two solutions.
+    solutions : ([ConsumerSolution], [ConsumerSolution])
+        HARK's solution and the compiled one.
+    '''
+    from copy import deepcopy
+    solutions = []
+    for compiled in (False, True):
+        solver = useCompiledEGM(deepcopy(agent), compiled)
+        solver.solve()
+        solutions.append(solver.solution)
+    arrays = [solutionToArrays(solution) for solution in solutions]
+    if arrays[0]['mNrm'].shape != arrays[1]['mNrm'].shape:
+        return np.inf, tuple(solutions)  # Not even the same number of periods
+    difference = 0.0
+    for name in ['mNrm', 'cNrm', 'MPC']:
+        x, y = arrays[0][name], arrays[1][name]
+        known = np.isfinite(x) | np.isfinite(y)
+        difference = max(difference, np.max(np.abs(x[known] - y[known])/np.maximum(np.abs(x[known]), 1e-12)))
+    return float(difference), tuple(solutions)
+
+
+if __name__ == '__main__':
+    import time
+    from HARK.ConsumptionSaving.ConsIndShockModel import init_idiosyncratic_shocks
+
+    parser = argparse.ArgumentParser(description="Compare HARK's EGM step with the compiled one.")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # The baseline calibration of the notebook, and its GICNrmFailsButGICRawHolds variant
+    params = dict(init_idiosyncratic_shocks, PermGroFac=[1.03], Rfree=1.04, DiscFac=0.96, CRRA=2.0,
+                  UnempPrb=0.005, IncUnemp=0.0, PermShkStd=[0.1], TranShkStd=[0.1], LivPrb=[1.0],
+                  CubicBool=True, BoroCnstArt=None, T_cycle=1)
+    agents = {'baseAgent_Fin': IndShockConsumerType(cycles=100, verbose=0, **params),
+              'GICNrmFailsButGICRawHolds': IndShockConsumerType(
+                  cycles=0, verbose=0, **dict(params, PermShkStd=[0.2], aXtraMax=params['aXtraCount']*2,
+                                              aXtraCount=params['aXtraCount']*4))}
+    agents['GICNrmFailsButGICRawHolds'].tolerance /= 100
+
+    compileEGMStep()
+    for name, agent in agents.items():
+        agent.update()
+        times = {}
+        for compiled in (False, True):
+            useCompiledEGM(agent, compiled)
+            runs = []
+            for i in range(args.repeat):
+                start = time.perf_counter()
+                agent.solve()
+                runs.append(time.perf_counter() - start)
+            times[compiled] = min(runs)
+        difference = compareEGM(agent)[0]
+        print('{0:<28s}NumPy {1:7.3f}s  compiled {2:7.3f}s  x{3:5.2f}  knots differ by {4:.1e}{5}'.format(
+            name, times[False], times[True], times[False]/times[True], difference,
+            '' if difference <= kernel_tolerance else '  EXCEEDS {0:.0e}'.format(kernel_tolerance)))
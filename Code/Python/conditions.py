@@ -0,0 +1,95 @@
+"""
+The paper's conditions and patience factors, for whole arrays of parameters.
+
+HARK's checkConditions works on one agent at a time and reports by printing.
+conditions() evaluates everything in Code/Mathematica/CoreCode/
+DefineConditionsAndMeasures.m with numpy broadcasting instead, so the
+parameters may be arrays of any (broadcastable) shapes, e.g. a million
+parameter vectors or a mesh over two parameters, and the results are arrays
+of the broadcast shape.
+
+As in the Mathematica code, permanent shocks are mean-one lognormal with
+standard deviation PermShkStd, and their moments are the exact ones,
+E[psi^-1] = exp(PermShkStd^2) and E[psi^(1-CRRA)] = exp(PermShkStd^2 CRRA (CRRA-1)/2),
+rather than those of a discretization; a condition holds when its inequality
+is strict.  Each condition compares the absolute patience factor Thorn (or,
+for the WRIC, UnempPrb^(1/CRRA) Thorn) with a threshold, as in the
+Inequalities figures, and also has the equivalent factor form (e.g. the
+GICRaw holds when GPFRaw = Thorn/PermGroFac < 1).
+"""
+
+import numpy as np
+
+# Conditions, with the factor that is < 1 when the condition holds
+condition_factors = {
+    'AIC': 'Thorn',
+    'GICRaw': 'GPFRaw',
+    'GICNrm': 'GPFNrm',
+    'RIC': 'RPF',
+    'WRIC': 'WRPF',
+    'FHWC': 'FHWF',
+    'FVAC': 'FVAF',
+    'PFFVAC': 'PFFVAF',
+}
+
+
+def conditions(CRRA, DiscFac, Rfree, PermGroFac, PermShkStd=0.0, UnempPrb=0.0):
+    '''
+    Evaluate the patience factors and conditions of the paper.
+
+    Parameters
+    ----------
+    CRRA, DiscFac, Rfree, PermGroFac, PermShkStd, UnempPrb : float or np.array
+        Parameters; arrays broadcast against each other.
+
+    Returns
+    -------
+    results : dict
+        Arrays of the broadcast shape:
+        Thorn, the absolute patience factor (Rfree DiscFac)^(1/CRRA);
+        PermGroFacAdj, PermGroFac/E[psi^-1];
+        the factors GPFRaw, GPFNrm, RPF, WRPF, FHWF, FVAF and PFFVAF;
+        the thresholds for Thorn of the PF-FVAC and FVAC, PFFVACThorn and
+        FVACThorn, and WRICThorn = UnempPrb^(1/CRRA) Thorn;
+        the limiting MPCs MPCmin (zero if the RIC fails) and MPCmax, and
+        human wealth hNrm (infinite if the FHWC fails);
+        and a boolean array for each condition in condition_factors.
+    '''
+    CRRA, DiscFac, Rfree, PermGroFac, PermShkStd, UnempPrb = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (CRRA, DiscFac, Rfree, PermGroFac, PermShkStd, UnempPrb)))
+    r = {}
+    r['Thorn'] = (Rfree*DiscFac)**(1.0/CRRA)
+    r['PermGroFacAdj'] = PermGroFac*np.exp(-PermShkStd**2)
+    EPermShkPow1mRho = np.exp(PermShkStd**2*CRRA*(CRRA - 1.0)/2.0)
+
+    # Factors
+    r['GPFRaw'] = r['Thorn']/PermGroFac
+    r['GPFNrm'] = r['Thorn']/r['PermGroFacAdj']
+    r['RPF'] = r['Thorn']/Rfree
+    r['WRPF'] = UnempPrb**(1.0/CRRA)*r['RPF']
+    r['FHWF'] = PermGroFac/Rfree
+    r['PFFVAF'] = DiscFac*PermGroFac**(1.0 - CRRA)
+    r['FVAF'] = r['PFFVAF']*EPermShkPow1mRho
+
+    # The same comparisons as thresholds for Thorn, as in the Inequalities figures
+    r['PFFVACThorn'] = (Rfree*PermGroFac**(CRRA - 1.0))**(1.0/CRRA)
+    r['FVACThorn'] = r['PFFVACThorn']/EPermShkPow1mRho**(1.0/CRRA)
+    r['WRICThorn'] = UnempPrb**(1.0/CRRA)*r['Thorn']
+
+    for name, factor in condition_factors.items():
+        r[name] = r[factor] < 1.0
+
+    # Limiting MPCs and human wealth
+    with np.errstate(divide='ignore'):
+        r['MPCmin'] = np.where(r['RIC'], 1.0 - r['RPF'], 0.0)
+        r['MPCmax'] = 1.0 - r['WRPF']
+        r['hNrm'] = np.where(r['FHWC'], 1.0/(1.0 - r['FHWF']), np.inf)
+    return r
+
+
+def agentConditions(agent):
+    '''
+    conditions() for the parameters of an IndShockConsumerType.
+    '''
+    return conditions(agent.CRRA, agent.DiscFac, agent.Rfree, agent.PermGroFac[0],
+                      agent.PermShkStd[0], agent.UnempPrb)
@@ -0,0 +1,117 @@
+"""
+The closed-form bounds on the converged consumption function, for arrays of m
+and of parameters.
+
+The cFuncBounds and MPCLimits figures compare c(m) with
+    the limiting perfect foresight consumption function  (m - 1 + h) MPCmin,
+    the upper bound                                        MPCmax m,
+    and the lower bound                                    MPCmin m,
+where MPCmin = 1 - Thorn/Rfree, MPCmax = 1 - UnempPrb^(1/CRRA) Thorn/Rfree and
+h = 1/(1 - PermGroFac/Rfree) is human wealth.  ConsumptionBounds computes
+these constants once for a parameter set, or for a whole array of them, after
+which evaluating the bounds costs a multiply and an add per point.  The upper
+bound of the paper is the smaller of the first two, which cross at mKnk.
+
+The parameters may be arrays of any broadcastable shapes (see conditions.py);
+evaluating at an array of m then gives an array of shape
+params shape + m shape, so a single call evaluates every parameter set on
+the same grid.  Like the notebook's figures, the constants are not checked
+against the RIC and FHWC, without which the perfect foresight solution does
+not exist; conditions() reports those.
+"""
+
+import numpy as np
+
+
+class ConsumptionBounds(object):
+    '''
+    The bounds on the consumption function for one or many parameter sets.
+
+    Parameters
+    ----------
+    CRRA, DiscFac, Rfree, PermGroFac, UnempPrb : float or np.array
+        Parameters; arrays broadcast against each other.
+    '''
+
+    def __init__(self, CRRA, DiscFac, Rfree, PermGroFac, UnempPrb=0.0):
+        CRRA, DiscFac, Rfree, PermGroFac, UnempPrb = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (CRRA, DiscFac, Rfree, PermGroFac, UnempPrb)))
+        self.shape = CRRA.shape
+        self.Thorn = (Rfree*DiscFac)**(1.0/CRRA)
+        self.MPCmin = 1.0 - self.Thorn/Rfree
+        self.MPCmax = 1.0 - UnempPrb**(1.0/CRRA)*self.Thorn/Rfree
+        self.hNrm = 1.0/(1.0 - PermGroFac/Rfree)
+        # Intercept of the perfect foresight consumption function, and where it meets MPCmax m
+        self.cUncnstAt0 = (self.hNrm - 1.0)*self.MPCmin
+        self.mKnk = self.cUncnstAt0/(self.MPCmax - self.MPCmin)
+
+    def _expand(self, constant, m):
+        # Give the constants trailing axes to broadcast against every axis of m
+        return constant.reshape(self.shape + (1,)*np.ndim(m))
+
+    def cFuncUncnst(self, m):
+        '''
+        The limiting perfect foresight consumption function, (m - 1 + h) MPCmin.
+        '''
+        return self._expand(self.cUncnstAt0, m) + self._expand(self.MPCmin, m)*np.asarray(m)
+
+    def cFuncTopBnd(self, m):
+        '''
+        The upper bound MPCmax m.
+        '''
+        return self._expand(self.MPCmax, m)*np.asarray(m)
+
+    def cFuncBotBnd(self, m):
+        '''
+        The lower bound MPCmin m.
+        '''
+        return self._expand(self.MPCmin, m)*np.asarray(m)
+
+    def __call__(self, m):
+        '''
+        Every bound at m at once.
+
+        Returns
+        -------
+        bounds : dict
+            'Uncnst', 'TopBnd' and 'BotBnd' as the methods of those names,
+            and 'Upper', the smaller of 'Uncnst' and 'TopBnd'; arrays of
+            shape self.shape + np.shape(m).
+        '''
+        m = np.asarray(m, dtype=float)
+        BotBnd = self.cFuncBotBnd(m)
+        bounds = {'Uncnst': self._expand(self.cUncnstAt0, m) + BotBnd, 'TopBnd': self.cFuncTopBnd(m),
+                  'BotBnd': BotBnd}
+        bounds['Upper'] = np.minimum(bounds['Uncnst'], bounds['TopBnd'])
+        return bounds
+
+    def violations(self, c, m, tolerance=1e-10):
+        '''
+        Where consumption c at m lies outside the bounds.
+
+        Parameters
+        ----------
+        c : np.array
+            Consumption at m, of shape self.shape + np.shape(m) (or
+            broadcastable to it), e.g. cFunc(m) for a single parameter set.
+        m : np.array
+            Market resources.
+        tolerance : float
+            Relative amount by which c may cross a bound before it counts.
+
+        Returns
+        -------
+        violated : np.array of bool
+            True where c < MPCmin m or c > min(MPCmax m, (m - 1 + h) MPCmin);
+            False where c is NaN.
+        '''
+        bounds = self(m)
+        slack = tolerance*np.maximum(np.abs(c), 1.0)
+        return (c < bounds['BotBnd'] - slack) | (c > bounds['Upper'] + slack)
+
+
+def agentBounds(agent):
+    '''
+    ConsumptionBounds for the parameters of an IndShockConsumerType.
+    '''
+    return ConsumptionBounds(agent.CRRA, agent.DiscFac, agent.Rfree, agent.PermGroFac[0], agent.UnempPrb)
@@ -0,0 +1,131 @@
+"""
+The ergodic distribution of normalized market resources, without simulation.
+
+Simulating a population (see panel_simulation) gives the distribution of m
+with sampling noise that only shrinks with the square root of the number of
+agents.  ergodicDistribution instead puts the distribution on a grid of m and
+iterates it exactly: for each gridpoint, end of period assets follow from the
+solved consumption function, and for each shock in the agent's discrete income
+distribution the mass that goes to the resulting m_{t+1} is split between the
+two gridpoints around it in proportion to its distance to each (the method of
+Young, 2010).  These weights form a sparse transition matrix whose stationary
+distribution is found by power iteration, or by a sparse eigen-solve.
+
+With weighted=True, each agent's mass is weighted by their permanent income
+(the shock probabilities are multiplied by psi), so the mean of the resulting
+distribution is aggregate market resources over aggregate permanent income,
+whose balanced growth value is the pseudo-steady-state mNrmStE; unweighted,
+the distribution is the cross-section of m around the target mNrmTrg.
+"""
+
+import warnings
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import eigs
+
+from euler_errors import incomeShocks
+from panel_simulation import consumptionRule
+
+# Default grid of m: points evenly spaced from the minimum allowed m to mNrmMax
+grid_points = 2000
+mNrmMax = 20.0
+
+
+def transitionMatrix(agent, mGrid, weighted=False):
+    '''
+    Sparse matrix of the probabilities of moving between the points of mGrid.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved infinite horizon agent with T_cycle = 1.
+    mGrid : np.array
+        Increasing grid of m.  Mass that would move below or above it is put
+        on its first or last point.
+    weighted : bool
+        If True, weight transitions by the permanent shock, giving the
+        distribution of permanent income over m.
+
+    Returns
+    -------
+    transition : scipy.sparse.csr_matrix
+        Row i holds the probabilities of moving from mGrid[i] to each gridpoint.
+    '''
+    PermShkVals, TranShkVals, ShkPrbs = incomeShocks(agent, 0)
+    Rfree = agent.Rfree[0] if isinstance(agent.Rfree, list) else agent.Rfree
+    PermGroFac = agent.PermGroFac[0]
+    if weighted:
+        ShkPrbs = ShkPrbs*PermShkVals/np.dot(ShkPrbs, PermShkVals)
+
+    cNrm = consumptionRule(agent.solution[0])(mGrid)[0]
+    aNrm = mGrid - cNrm
+    mNext = np.clip((Rfree/(PermGroFac*PermShkVals))*aNrm[:, np.newaxis] + TranShkVals, mGrid[0], mGrid[-1])
+
+    # Split each shock's probability between the gridpoints on either side
+    lower = np.clip(np.searchsorted(mGrid, mNext, side='right') - 1, 0, len(mGrid) - 2)
+    upper_share = (mNext - mGrid[lower])/(mGrid[lower + 1] - mGrid[lower])
+    rows = np.repeat(np.arange(len(mGrid)), len(ShkPrbs))
+    data = np.concatenate([(ShkPrbs*(1.0 - upper_share)).ravel(), (ShkPrbs*upper_share).ravel()])
+    cols = np.concatenate([lower.ravel(), lower.ravel() + 1])
+    return sparse.csr_matrix((data, (np.concatenate([rows, rows]), cols)), shape=(len(mGrid), len(mGrid)))
+
+
+def ergodicDistribution(agent, mGrid=None, weighted=False, method='power', tolerance=1e-13, max_iter=100000):
+    '''
+    Find the stationary distribution of m on a grid.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved infinite horizon agent with T_cycle = 1.
+    mGrid : np.array
+        Grid of m; defaults to grid_points points from the minimum allowed m
+        to mNrmMax.
+    weighted : bool
+        If True, find the distribution weighted by permanent income.
+    method : str
+        'power' iterates the distribution until no probability changes by
+        more than tolerance; 'eigen' finds the unit eigenvector directly.
+    tolerance : float
+        Convergence criterion of the power iteration.
+    max_iter : int
+        Limit on the number of power iterations; reaching it without
+        converging issues a RuntimeWarning.
+
+    Returns
+    -------
+    distribution : dict
+        'mNrm' is the grid, 'pmf' and 'cdf' the probability and cumulative
+        probability at each gridpoint, 'mean' the mean of m, 'iterations'
+        the number of power iterations (0 for 'eigen'), and 'converged'
+        whether the power iteration met tolerance (True for 'eigen').
+    '''
+    if mGrid is None:
+        mGrid = np.linspace(agent.solution[0].mNrmMin, mNrmMax, grid_points)
+    transpose = transitionMatrix(agent, mGrid, weighted).T.tocsr()
+
+    iterations = 0
+    converged = True
+    if method == 'power':
+        pmf = np.full(len(mGrid), 1.0/len(mGrid))
+        converged = False
+        while iterations < max_iter:
+            pmf_next = transpose @ pmf
+            iterations += 1
+            converged = np.max(np.abs(pmf_next - pmf)) < tolerance
+            pmf = pmf_next
+            if converged:
+                break
+        if not converged:
+            warnings.warn('The power iteration did not converge to within {0:g} in {1} iterations; the pmf '
+                          'is not a stationary distribution'.format(tolerance, max_iter), RuntimeWarning)
+    elif method == 'eigen':
+        vals, vecs = eigs(transpose, k=1, sigma=1.0)
+        pmf = np.abs(np.real(vecs[:, 0]))
+    else:
+        raise ValueError("method must be 'power' or 'eigen', not {0!r}".format(method))
+
+    pmf = pmf/np.sum(pmf)
+    return {'mNrm': mGrid, 'pmf': pmf, 'cdf': np.cumsum(pmf), 'mean': float(np.dot(pmf, mGrid)),
+            'iterations': iterations, 'converged': bool(converged)}
@@ -0,0 +1,232 @@
+"""
+Accuracy diagnostics for solved IndShock consumers: Euler equation errors.
+
+A consumption function is accurate where it satisfies the Euler equation
+u'(c_t) = DiscFac LivPrb Rfree E[(PermGroFac psi)^(-CRRA) u'(c_{t+1})].
+eulerErrors evaluates the normalized residual |1 - c_Euler/c| on a dense grid
+of m in one vectorized pass, where c_Euler is the consumption that satisfies
+the Euler equation given the next period's consumption function; it is the
+error in consumption as a fraction of consumption, so log10 of -4 means a
+mistake of a dollar in every ten thousand spent.  Where the borrowing
+constraint binds the Euler equation holds as an inequality and no error is
+reported.
+
+eulerErrorSummary reports the max and mean log10 error over regions of m,
+and cheapestAccurate searches grid sizes and tolerances for the cheapest
+that meets an accuracy target, instead of raising aXtraCount and lowering
+tolerance blindly.
+
+    python euler_errors.py [agent ...]
+
+prints the summary for the agents of the notebook (see reproduce_figures.agent_cells).
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from solution_arrays import solutionFromArrays
+
+# Edges of the regions of m that errors are summarized over
+region_edges = [0.0, 1.0, 2.0, 5.0, 10.0, 20.0]
+
+# Points per unit of m in the default evaluation grid
+points_per_unit = 200
+
+
+def incomeShocks(agent, t):
+    '''
+    Permanent and transitory shocks and their probabilities in period t.
+    '''
+    dstns = getattr(agent, 'IncShkDstn', None) or agent.IncomeDstn
+    dstn = dstns[t]
+    pmf = getattr(dstn, 'pmv', None)
+    if pmf is None:
+        pmf = dstn.pmf
+    atoms = getattr(dstn, 'atoms', None)
+    if atoms is None:
+        atoms = dstn.X
+    return np.asarray(atoms[0]), np.asarray(atoms[1]), np.asarray(pmf)
+
+
+def _solution(agent):
+    '''
+    agent.solution or, for an agent whose consumption functions are kept only
+    as a StackedcFuncs (see solution_stack), the solution rebuilt from its arrays.
+    '''
+    solution = getattr(agent, 'solution', None)
+    if solution is None:
+        solution = solutionFromArrays(agent.cFunc.arrays, agent.CRRA)
+    return solution
+
+
+def _param(agent, name, t):
+    val = getattr(agent, name)
+    return val[t] if isinstance(val, (list, tuple, np.ndarray)) else val
+
+
+def eulerErrors(agent, mNrm, t=0):
+    '''
+    Normalized Euler equation errors of period t of a solved agent.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved agent, or one whose cFunc is a StackedcFuncs.
+    mNrm : np.array
+        Market resources at which to evaluate the errors.
+    t : int
+        The period; its successor is period t+1 (the first period again, for
+        an infinite horizon).
+
+    Returns
+    -------
+    errors : np.array
+        |1 - c_Euler/c| with the shape of mNrm; NaN where the borrowing
+        constraint binds or m is below the minimum allowed.
+    '''
+    solution = _solution(agent)
+    T = len(solution)
+    if agent.cycles != 0 and t >= T - 1:
+        raise ValueError('Period {0} has no successor to take the Euler equation to'.format(t))
+    solution_t = solution[t]
+    cFuncNext = solution[(t + 1) % T].cFunc
+    CRRA = agent.CRRA
+    PermShkVals, TranShkVals, ShkPrbs = incomeShocks(agent, t)
+    PermGroFac = _param(agent, 'PermGroFac', t)
+    Rfree = _param(agent, 'Rfree', t)
+    DiscFacEff = _param(agent, 'DiscFac', t)*_param(agent, 'LivPrb', t)
+
+    mNrm = np.asarray(mNrm, dtype=float)
+    with np.errstate(invalid='ignore'):
+        cNrm = solution_t.cFunc(mNrm.ravel())
+        aNrm = mNrm.ravel() - cNrm
+
+        # Every point against every shock, as an (M, S) array
+        mNrmNext = (Rfree/(PermGroFac*PermShkVals))*aNrm[:, np.newaxis] + TranShkVals
+        cNext = cFuncNext(mNrmNext.ravel()).reshape(mNrmNext.shape)
+        EndOfPrdvP = DiscFacEff*Rfree*PermGroFac**(-CRRA)*np.dot(cNext**(-CRRA), ShkPrbs*PermShkVals**(-CRRA))
+        cEuler = EndOfPrdvP**(-1.0/CRRA)
+        errors = np.abs(1.0 - cEuler/cNrm)
+
+    # On the constraint c = m - mNrmMin, so end of period assets are mNrmMin
+    binding = aNrm <= solution_t.mNrmMin + 1e-12*np.maximum(1.0, np.abs(mNrm.ravel()))
+    errors[binding | ~(mNrm.ravel() > solution_t.mNrmMin)] = np.nan
+    return errors.reshape(mNrm.shape)
+
+
+def _summary(log10errors):
+    valid = log10errors[np.isfinite(log10errors)]
+    if valid.size == 0:
+        return {'max': np.nan, 'mean': np.nan, 'points': 0}
+    return {'max': float(valid.max()), 'mean': float(valid.mean()), 'points': int(valid.size)}
+
+
+def eulerErrorSummary(agent, mNrm=None, t=0, edges=region_edges):
+    '''
+    Max and mean log10 Euler equation errors of period t, overall and by region of m.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved agent.
+    mNrm : np.array
+        Where to evaluate the errors; defaults to points_per_unit points per
+        unit of m from the minimum allowed m to the last region edge.
+    t : int
+        The period.
+    edges : [float]
+        Edges of the regions of m.
+
+    Returns
+    -------
+    summary : dict
+        Maps 'all' and a label for each region, e.g. '[1, 2)', to a dict of
+        the max and mean log10 error and the number of points with an error.
+        Points where the constraint binds, or with an error of exactly zero
+        (at the gridpoints themselves), are left out.
+    '''
+    if mNrm is None:
+        mNrmMin = _solution(agent)[t].mNrmMin
+        mNrm = np.linspace(mNrmMin, edges[-1], int((edges[-1] - mNrmMin)*points_per_unit) + 1)[1:]
+    with np.errstate(divide='ignore'):
+        log10errors = np.log10(eulerErrors(agent, mNrm, t))
+
+    summary = {'all': _summary(log10errors)}
+    for lower, upper in zip(edges[:-1], edges[1:]):
+        inside = (mNrm >= lower) & (mNrm < upper)
+        summary['[{0:g}, {1:g})'.format(lower, upper)] = _summary(log10errors[inside])
+    return summary
+
+
+def printEulerErrorSummary(summary, title=''):
+    print(title)
+    for region, stats in summary.items():
+        print('    {0:<12s} max {1:6.2f}  mean {2:6.2f}  ({3} points)'.format(
+            region, stats['max'], stats['mean'], stats['points']))
+
+
+def cheapestAccurate(agent, target=-4.0, aXtraCounts=(24, 48, 96, 192), tolerances=(1e-4, 1e-6, 1e-8), **kwds):
+    '''
+    Find the smallest grid, then the loosest tolerance, whose solution has a
+    max log10 Euler error of at most target.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        The agent to solve; it is not changed.
+    target : float
+        Largest acceptable max log10 Euler equation error.
+    aXtraCounts : [int]
+        Grid sizes to try, smallest first.
+    tolerances : [float]
+        Solution tolerances to try, loosest first.
+    **kwds
+        Passed on to eulerErrorSummary.
+
+    Returns
+    -------
+    aXtraCount, tolerance : int, float
+        The cheapest settings that meet target, or None, None if none do.
+    summary : dict
+        The eulerErrorSummary of the solution with those settings (or with
+        the most accurate settings tried).
+    seconds : float
+        Time the solve with those settings took.
+    '''
+    for aXtraCount in aXtraCounts:
+        for tolerance in tolerances:
+            trial = deepcopy(agent)
+            trial.aXtraCount = aXtraCount
+            (getattr(trial, 'update_assets_grid', None) or trial.updateAssetsGrid)()
+            trial.tolerance = tolerance
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                trial.solve()
+            seconds = time.time() - start
+            summary = eulerErrorSummary(trial, **kwds)
+            if summary['all']['max'] <= target:
+                return aXtraCount, tolerance, summary, seconds
+    return None, None, summary, seconds
+
+
+if __name__ == '__main__':
+    from reproduce_figures import FigureGraph, agent_cells
+
+    parser = argparse.ArgumentParser(description='Report the Euler equation errors of the notebook agents.')
+    parser.add_argument('agents', nargs='*', default=list(agent_cells))
+    args = parser.parse_args()
+
+    graph = FigureGraph([])
+    with contextlib.redirect_stdout(io.StringIO()):
+        namespace = graph.namespace()
+    for name in args.agents:
+        if 'PerfForesightConsumerType' in agent_cells[name]:
+            continue  # No income risk, so nothing to take expectations over
+        with contextlib.redirect_stdout(io.StringIO()):
+            graph.solveAgent(name, namespace)
+        printEulerErrorSummary(eulerErrorSummary(namespace[name]), name)
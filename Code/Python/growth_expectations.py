@@ -0,0 +1,63 @@
+"""
+Batched expectations of next period's consumption and market resources.
+
+The growth factor figures need E_t[c_{t+1} p_{t+1}]/p_t and E_t[m_{t+1} p_{t+1}]/p_t
+at hundreds of values of end-of-period assets a.  Rather than looping over a in
+Python, the whole a array is broadcast against the permanent and transitory
+shock grids as one (a, psi, theta) array, the consumption function is evaluated
+once on all of it, and the expectation is a weighted sum over the shock axes.
+Large a arrays are processed in chunks so the 3-D array stays below max_points.
+"""
+
+import numpy as np
+
+
+def ExLev_tp1_Over_pLev_t_from_a(agent, aNrm, t=0, max_points=2**20):
+    '''
+    Expected next period consumption and market resources, relative to this
+    period's permanent income, for every value of end-of-period assets in aNrm.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved agent; solution[t].cFunc is next period's consumption function
+        (for an infinite horizon agent, the converged rule).
+    aNrm : np.array
+        End-of-period assets, normalized by permanent income.
+    t : int
+        Which period's shock distributions and consumption function to use.
+    max_points : int
+        Largest number of (a, psi, theta) combinations evaluated at once.
+
+    Returns
+    -------
+    Ex_cLev_tp1_Over_pLev_t : np.array
+        E_t[c_{t+1} p_{t+1}]/p_t, same shape as aNrm.
+    Ex_mLev_tp1_Over_pLev_t : np.array
+        E_t[m_{t+1} p_{t+1}]/p_t, same shape as aNrm.
+    '''
+    aNrm = np.asarray(aNrm, dtype=float)
+    cFunc = agent.solution[t].cFunc
+    permShkVals = agent.PermShkDstn[t].X
+    permShkPrbs = agent.PermShkDstn[t].pmf
+    tranShkVals = agent.TranShkDstn[t].X
+    tranShkPrbs = agent.TranShkDstn[t].pmf
+    PermGroFac = agent.PermGroFac[t]*permShkVals  # Growth times idiosyncratic permShk
+
+    # Arrange the shocks along axes 1 (psi) and 2 (theta)
+    PermGroFac_tp1 = PermGroFac[np.newaxis, :, np.newaxis]
+    RNrmFac_tp1 = agent.Rfree/PermGroFac_tp1  # Growth-normalized interest factor
+    tranShk_tp1 = tranShkVals[np.newaxis, np.newaxis, :]
+    ShkPrbs = np.outer(permShkPrbs, tranShkPrbs)[np.newaxis, :, :]
+
+    a_flat = aNrm.ravel()
+    Ex_cLev = np.empty(a_flat.size)
+    Ex_mLev = np.empty(a_flat.size)
+    chunk = max(1, max_points//(permShkVals.size*tranShkVals.size))
+    for start in range(0, a_flat.size, chunk):
+        a = a_flat[start:start + chunk, np.newaxis, np.newaxis]
+        m_tp1 = RNrmFac_tp1*a + tranShk_tp1
+        c_tp1 = cFunc(m_tp1.ravel()).reshape(m_tp1.shape)
+        Ex_cLev[start:start + chunk] = np.sum(c_tp1*PermGroFac_tp1*ShkPrbs, axis=(1, 2))
+        Ex_mLev[start:start + chunk] = np.sum(m_tp1*PermGroFac_tp1*ShkPrbs, axis=(1, 2))
+    return Ex_cLev.reshape(aNrm.shape), Ex_mLev.reshape(aNrm.shape)
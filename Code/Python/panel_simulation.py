@@ -0,0 +1,199 @@
+"""
+Monte Carlo simulation of a population of buffer stock consumers.
+
+This is the Python counterpart of Simulate[NumOfPeople, NumOfPeriods, bInitial]
+in the Mathematica code (Code/Mathematica/CoreCode/DefineSimulationFunctions.m).
+Every agent starts with bank balances bInitial and then, each period, draws a
+permanent shock psi and a transitory shock theta and follows the solved
+consumption function of an infinite horizon IndShockConsumerType:
+
+    b_t = a_{t-1} Rfree/(PermGroFac psi_t),  m_t = b_t + theta_t,  a_t = m_t - c(m_t)
+
+with the permanent income ratio pRat_t = pRat_{t-1} psi_t.  The shocks are
+drawn from the discrete joint distribution the agent was solved with (its
+IncShkDstn), rather than from the lognormals it approximates: the consumption
+function is only defined for m >= mNrmMin, which the lowest shocks of the
+discrete distribution, not those of the continuous one, guarantee.  There is
+no mortality, as in the Mathematica simulation.
+
+Where the Mathematica code keeps every period's cross-section (mtList,
+btList, CDFmtList, ...), PanelSimulator keeps only the current one: each
+period's means, covariances and CDF quantiles are computed as soon as the
+period is simulated and passed on, so memory does not grow with the number of
+periods and millions of agents can be simulated for as long as it takes to
+check convergence to the target mNrmTrg (of the mean of m) and to the
+pseudo-steady-state mNrmStE (of aggregate m, mNrmAgg = E[pRat m]/E[pRat]).
+"""
+
+import numpy as np
+from HARK.interpolation import CubicInterp, LowerEnvelope
+
+from batch_solve import StackedCubic
+from euler_errors import incomeShocks
+from solution_arrays import cFuncKnots
+
+# Variables whose cross-section mean is recorded every period
+mean_vars = ['mNrm', 'cNrm', 'aNrm', 'bNrm', 'MPC', 'pRat', 'TranShk', 'PermShk']
+
+# Variables whose CDF is recorded, at cdf_points evenly spaced probabilities
+cdf_vars = ['mNrm', 'aNrm', 'bNrm']
+cdf_points = 200
+
+
+def consumptionRule(solution):
+    '''
+    A function returning consumption and the MPC at an array of m, for a one
+    period solution.  The IndShock cubic spline rule is evaluated as a
+    StackedCubic, which does both in one pass and about twice as fast as
+    cFunc.eval_with_derivative; at the minimum allowed m, consumption is zero.
+    '''
+    cFunc = solution.cFunc
+    cFuncUnc = cFunc.functions[0] if isinstance(cFunc, LowerEnvelope) else cFunc
+    if isinstance(cFuncUnc, CubicInterp):
+        mNrm, cNrm, MPC, intercept, slope = cFuncKnots(cFuncUnc)
+        stacked = StackedCubic(mNrm[np.newaxis], cNrm[np.newaxis], MPC[np.newaxis],
+                               np.array([intercept]), np.array([slope]), np.array([solution.mNrmMin]))
+        evalWithDerivative = lambda m: tuple(x[0] for x in stacked.eval_with_derivative(m[np.newaxis]))
+    else:
+        evalWithDerivative = cFunc.eval_with_derivative
+
+    def rule(m):
+        c, MPC = evalWithDerivative(m)
+        atMin = m <= solution.mNrmMin  # Where the spline is undefined
+        c[atMin] = 0.0
+        MPC[atMin] = solution.MPCmax
+        return c, MPC
+    return rule
+
+
+def _param(agent, name):
+    val = getattr(agent, name)
+    return val[0] if isinstance(val, (list, tuple, np.ndarray)) else val
+
+
+class PanelSimulator(object):
+    '''
+    A population of agents following the solution of an infinite horizon agent.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved agent with cycles = 0 and T_cycle = 1, e.g. baseAgent_Inf.
+    AgentCount : int
+        Number of agents to simulate.
+    bInitial : float
+        Bank balances of every agent in the first period.
+    seed : int or np.random.SeedSequence
+        Seed of the random number generator.
+    '''
+
+    def __init__(self, agent, AgentCount, bInitial=0.0, seed=0):
+        if agent.cycles != 0 or len(agent.solution) != 1:
+            raise ValueError('PanelSimulator requires a solved infinite horizon agent with T_cycle = 1')
+        if AgentCount < 1:
+            raise ValueError('PanelSimulator requires AgentCount >= 1, not {0}'.format(AgentCount))
+        self.consumption = consumptionRule(agent.solution[0])
+        self.Rfree = _param(agent, 'Rfree')
+        self.PermGroFac = _param(agent, 'PermGroFac')
+        self.PermShkVals, self.TranShkVals, self.ShkPrbs = incomeShocks(agent, 0)
+        self.AgentCount = AgentCount
+        self.bInitial = bInitial
+        self.rng = np.random.default_rng(seed)
+        self.t = 0
+        self.aNrm = None
+        self.pRat = None
+
+    def drawShocks(self):
+        '''
+        Draw this period's permanent and transitory shocks for every agent, as
+        one point of the agent's discrete joint income distribution each.
+        '''
+        draws = self.rng.choice(len(self.ShkPrbs), size=self.AgentCount, p=self.ShkPrbs)
+        return self.PermShkVals[draws], self.TranShkVals[draws]
+
+    def step(self):
+        '''
+        Simulate one period and return its statistics (see statistics).
+        '''
+        return self.statistics(self.advance())
+
+    def advance(self):
+        '''
+        Simulate one period and return its cross-section as a dict of arrays of
+        every variable other than aNrm and pRat, which are kept as attributes.
+        '''
+        PermShk, TranShk = self.drawShocks()
+        if self.t == 0:
+            bNrm = np.full(self.AgentCount, float(self.bInitial))
+            self.pRat = PermShk
+        else:
+            bNrm = self.aNrm*(self.Rfree/(self.PermGroFac*PermShk))
+            self.pRat *= PermShk
+        mNrm = bNrm + TranShk
+        cNrm, MPC = self.consumption(mNrm)
+        self.aNrm = mNrm - cNrm
+        self.t += 1
+        return dict(mNrm=mNrm, cNrm=cNrm, bNrm=bNrm, MPC=MPC, PermShk=PermShk, TranShk=TranShk)
+
+    def statistics(self, cross_section):
+        '''
+        Summarize a period's cross-section, as returned by advance.
+
+        Returns
+        -------
+        stats : dict
+            The mean of each of mean_vars, the CDF quantiles of each of
+            cdf_vars (e.g. 'mNrmCDF'), the aggregate market resources ratio
+            mNrmAgg = E[pRat m]/E[pRat], and the covariances of pRat with m
+            and a.
+        '''
+        values = dict(cross_section, aNrm=self.aNrm, pRat=self.pRat)
+        stats = {'t': self.t}
+        for name in mean_vars:
+            stats[name] = float(np.mean(values[name]))
+        # Quantiles interpolated linearly, as np.quantile does, but from one sort
+        pos = np.linspace(0.0, self.AgentCount - 1, cdf_points)
+        lower = np.floor(pos).astype(int)
+        upper = np.minimum(lower + 1, self.AgentCount - 1)
+        for name in cdf_vars:
+            ordered = np.sort(values[name])
+            stats[name + 'CDF'] = ordered[lower] + (pos - lower)*(ordered[upper] - ordered[lower])
+        pRatMean = stats['pRat']
+        stats['mNrmAgg'] = float(np.mean(self.pRat*values['mNrm']))/pRatMean
+        stats['CovpRatmNrm'] = float(np.mean(self.pRat*values['mNrm'])) - pRatMean*stats['mNrm']
+        stats['CovpRataNrm'] = float(np.mean(self.pRat*self.aNrm)) - pRatMean*stats['aNrm']
+        return stats
+
+    def simulate(self, periods):
+        '''
+        Simulate periods more periods, yielding the statistics of each.
+        '''
+        for t in range(periods):
+            yield self.step()
+
+
+def simulatePanel(agent, AgentCount, periods, bInitial=0.0, seed=0):
+    '''
+    Simulate a population and return the time series of its statistics.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved infinite horizon agent.
+    AgentCount : int
+        Number of agents.
+    periods : int
+        Number of periods.
+    bInitial : float
+        Initial bank balances of every agent.
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+    history : dict
+        For each statistic of PanelSimulator.statistics, an array with one
+        row per period.
+    '''
+    rows = list(PanelSimulator(agent, AgentCount, bInitial, seed).simulate(periods))
+    return {name: np.array([row[name] for row in rows]) for name in rows[0]}
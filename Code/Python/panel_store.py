@@ -0,0 +1,142 @@
+"""
+On-disk storage of simulated panels, readable as memory-mapped arrays.
+
+The Mathematica simulator keeps the full NumOfPeople x NumOfPeriods history of
+every variable in memory.  Here a panel is a directory holding one raw binary
+file per variable, stored period by period (each period's cross-section is one
+contiguous row), and a small JSON header:
+
+    panel/
+        panel.json      AgentCount, dtype, variables and periods written so far
+        mNrm.bin        periods x AgentCount values, row-major
+        cNrm.bin
+        ...
+
+PanelWriter appends a period at a time while the simulation runs; the header
+is rewritten (atomically) after the data, so a reader always sees complete
+periods.  openPanel maps the files with np.memmap, so the histories are
+NumPy arrays of shape (periods, AgentCount) that are read from disk only as
+they are used, and can be far larger than memory.
+"""
+
+import json
+import os
+
+import numpy as np
+
+header_name = 'panel.json'
+
+# Variables recorded by recordPanel: market resources, consumption, assets,
+# the level of permanent income, and the transitory and permanent shocks
+panel_vars = ['mNrm', 'cNrm', 'aNrm', 'pLvl', 'TranShk', 'PermShk']
+
+
+class PanelWriter(object):
+    '''
+    Appends periods of a panel to the files in directory path.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the panel; created if need be.  An existing panel there
+        is replaced.
+    AgentCount : int
+        Number of agents in every period.
+    variables : [str]
+        Names of the variables recorded.
+    dtype : str or np.dtype
+        Type the values are stored as.
+    attrs : dict
+        Anything else to record in the header, e.g. the parameters simulated.
+    '''
+
+    def __init__(self, path, AgentCount, variables=panel_vars, dtype='<f8', attrs=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.header = {'AgentCount': int(AgentCount), 'variables': list(variables),
+                       'dtype': np.dtype(dtype).str, 'periods': 0, 'attrs': attrs or {}}
+        self.files = {name: open(os.path.join(path, name + '.bin'), 'wb') for name in variables}
+        self.writeHeader()
+
+    def write(self, values):
+        '''
+        Append one period, given a dict mapping every variable to an array of
+        AgentCount values.
+        '''
+        dtype = np.dtype(self.header['dtype'])
+        for name, f in self.files.items():
+            row = np.asarray(values[name], dtype=dtype)
+            if row.shape != (self.header['AgentCount'],):
+                raise ValueError('{0} has shape {1}; expected ({2},)'.format(
+                    name, row.shape, self.header['AgentCount']))
+            f.write(row.tobytes())
+            f.flush()
+        self.header['periods'] += 1
+        self.writeHeader()
+
+    def writeHeader(self):
+        path = os.path.join(self.path, header_name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.header, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def openPanel(path, mode='r'):
+    '''
+    Map the panel in directory path.
+
+    Parameters
+    ----------
+    path : str
+        Directory written by PanelWriter.
+    mode : str
+        np.memmap mode: 'r' to read, 'r+' to modify in place, 'c' for copy on write.
+
+    Returns
+    -------
+    panel : dict
+        Maps each variable to an np.memmap of shape (periods, AgentCount),
+        and 'attrs' to the attributes the panel was written with.
+    '''
+    with open(os.path.join(path, header_name)) as f:
+        header = json.load(f)
+    shape = (header['periods'], header['AgentCount'])
+    panel = {'attrs': header['attrs']}
+    for name in header['variables']:
+        if header['periods'] == 0:  # np.memmap cannot map an empty file
+            panel[name] = np.empty(shape, dtype=header['dtype'])
+        else:
+            panel[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=header['dtype'], mode=mode, shape=shape)
+    return panel
+
+
+def recordPanel(sim, periods, path, dtype='<f8', attrs=None):
+    '''
+    Simulate periods more periods of a PanelSimulator, writing each to path.
+
+    pLvl is the level of permanent income, pRat times PermGroFac**t, taking
+    the level in the first period before its shock to be one.
+
+    Returns
+    -------
+    panel : dict
+        The panel, as returned by openPanel.
+    '''
+    with PanelWriter(path, sim.AgentCount, panel_vars, dtype, attrs) as writer:
+        for t in range(periods):
+            values = sim.advance()
+            values['aNrm'] = sim.aNrm
+            values['pLvl'] = sim.pRat*sim.PermGroFac**(sim.t - 1)
+            writer.write(values)
+    return openPanel(path)
+
@@ -0,0 +1,170 @@
+"""
+Maps of the regions of parameter space where the paper's conditions hold.
+
+The Inequalities, InequalityPFGICFHWCRIC and RelatePFGICFHWCRICPFFVAC figures
+relate the conditions by hand.  phaseDiagram instead classifies every point
+of a 2-D slice through (Rfree, PermGroFac, DiscFac, CRRA, PermShkStd) space
+by which of a set of conditions hold, using the array kernel in conditions.py.
+
+Boundaries need a fine grid to be traced accurately, but most of a slice is
+far from any boundary, so the slice is refined adaptively: it starts as a
+coarse grid of cells, and a cell is split in four only if the classification
+differs between its corners, down to a cell 2**depth times smaller.  Each
+level evaluates the corners of all of its cells at once.  Cells whose corners
+agree take that classification; cells still mixed at the finest level take
+the classification of their centre.  (A region too small to reach a corner
+of a coarse cell can be missed, so the coarse grid must resolve every region.)
+
+    python phase_diagram.py [diagram ...] [--depth N] [--figures-dir DIR]
+
+draws the diagrams of the diagrams dict, as DIR/<diagram>-regions.{png,pdf}.
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from conditions import conditions
+
+# Parameters that are not on an axis take these values (the baseline of the paper)
+base_params = {'CRRA': 2.0, 'DiscFac': 0.96, 'Rfree': 1.04, 'PermGroFac': 1.03,
+               'PermShkStd': 0.1, 'UnempPrb': 0.005}
+
+# Named diagrams: the x and y axes, each (parameter, min, max), and the conditions
+diagrams = {
+    'InequalityPFGICFHWCRIC': (('Rfree', 0.98, 1.10), ('PermGroFac', 0.98, 1.10), ['GICRaw', 'FHWC', 'RIC']),
+    'RelatePFGICFHWCRICPFFVAC': (('Rfree', 0.98, 1.10), ('PermGroFac', 0.98, 1.10),
+                                 ['GICRaw', 'FHWC', 'RIC', 'PFFVAC']),
+    'Inequalities': (('DiscFac', 0.90, 1.00), ('PermShkStd', 0.0, 0.4),
+                     ['GICRaw', 'GICNrm', 'RIC', 'FHWC', 'FVAC', 'WRIC']),
+}
+
+
+def classify(names, x, y, xs, ys, params=base_params):
+    '''
+    Bitmask of the conditions in names that hold at each point (xs[k], ys[k]),
+    where x and y name the parameters on the axes: bit k is set if names[k] holds.
+    '''
+    values = dict(params)
+    values[x], values[y] = xs, ys
+    results = conditions(**values)
+    code = np.zeros(np.shape(xs), dtype=np.int64)
+    for k, name in enumerate(names):
+        code |= results[name].astype(np.int64) << k
+    return code
+
+
+def phaseDiagram(x, y, names, params=base_params, cells=32, depth=6):
+    '''
+    Classify a 2-D slice of parameter space by which conditions hold.
+
+    Parameters
+    ----------
+    x, y : (str, float, float)
+        Each axis: the parameter and its range.
+    names : [str]
+        Conditions (keys of conditions.condition_factors).
+    params : dict
+        Values of the other parameters.
+    cells : int
+        Number of coarse cells along each axis.
+    depth : int
+        Number of times a cell can be halved.
+
+    Returns
+    -------
+    diagram : dict
+        'codes' is an array of shape (cells 2**depth, cells 2**depth) holding
+        the bitmask of the conditions that hold (see classify), with rows
+        along y; 'extent' is (xmin, xmax, ymin, ymax); 'x', 'y' and 'names'
+        are as given; 'evaluations' is the number of points classified.
+    '''
+    (xname, xmin, xmax), (yname, ymin, ymax) = x, y
+    n = cells*2**depth  # Finest cells along each axis
+    codes = np.zeros((n, n), dtype=np.int64)
+    evaluations = 0
+
+    def at(i, j):
+        # Classification at lattice points (i, j), in units of the finest cell
+        return classify(names, xname, yname, xmin + (xmax - xmin)*i/n, ymin + (ymax - ymin)*j/n, params)
+
+    size = 2**depth
+    i, j = [index.ravel()*size for index in np.meshgrid(np.arange(cells), np.arange(cells))]
+    for level in range(depth + 1):
+        corners = np.stack([at(i, j), at(i + size, j), at(i, j + size), at(i + size, j + size)])
+        evaluations += corners.size
+        uniform = np.all(corners == corners[0], axis=0)
+        if level == depth:  # Mixed cells of the finest size take the classification of their centre
+            corners[0, ~uniform] = at(i[~uniform] + 0.5, j[~uniform] + 0.5)
+            evaluations += np.sum(~uniform)
+            uniform[:] = True
+
+        # Fill the finest cells covered by each uniform cell
+        offsets = np.arange(size)
+        rows = j[uniform][:, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+        cols = i[uniform][:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+        codes[rows, cols] = corners[0, uniform][:, np.newaxis, np.newaxis]
+
+        # Split the mixed cells in four
+        size //= 2
+        i, j = i[~uniform], j[~uniform]
+        i = np.concatenate([i, i + size, i, i + size])
+        j = np.concatenate([j, j, j + size, j + size])
+
+    return {'codes': codes, 'extent': (xmin, xmax, ymin, ymax), 'x': xname, 'y': yname,
+            'names': list(names), 'evaluations': int(evaluations)}
+
+
+def regionLabel(code, names):
+    held = [name for k, name in enumerate(names) if code >> k & 1]
+    return ', '.join(held) if held else 'none'
+
+
+def plotPhaseDiagram(diagram, ax=None):
+    '''
+    Draw a diagram made by phaseDiagram, with a legend of the conditions that
+    hold in each region.
+    '''
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+    from matplotlib.patches import Patch
+
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(9, 7))
+    present = np.unique(diagram['codes'])
+    index = np.searchsorted(present, diagram['codes'])
+    colors = plt.get_cmap('tab20')(np.arange(len(present)) % 20)
+    ax.imshow(index, origin='lower', extent=diagram['extent'], aspect='auto',
+              cmap=ListedColormap(colors), vmin=-0.5, vmax=len(present) - 0.5, interpolation='nearest')
+    ax.set_xlabel(diagram['x'])
+    ax.set_ylabel(diagram['y'])
+    ax.legend(handles=[Patch(color=colors[k], label=regionLabel(code, diagram['names']))
+                       for k, code in enumerate(present)],
+              title='Conditions that hold', fontsize='small', loc='best')
+    return ax
+
+
+if __name__ == '__main__':
+    import time
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from reproduce_figures import figures_dir_default
+
+    parser = argparse.ArgumentParser(description='Map where the conditions of the paper hold.')
+    parser.add_argument('diagrams', nargs='*', default=list(diagrams))
+    parser.add_argument('--depth', type=int, default=6)
+    parser.add_argument('--figures-dir', default=figures_dir_default)
+    args = parser.parse_args()
+
+    for name in args.diagrams:
+        x, y, names = diagrams[name]
+        start = time.time()
+        diagram = phaseDiagram(x, y, names, depth=args.depth)
+        print('{0:<34s}{1:8.2f}s  {2} points for a {3}x{3} map'.format(
+            name, time.time() - start, diagram['evaluations'], diagram['codes'].shape[0]))
+        ax = plotPhaseDiagram(diagram)
+        for ext in ['png', 'pdf']:
+            ax.figure.savefig(os.path.join(args.figures_dir, name + '-regions.' + ext))
+        plt.close(ax.figure)
@@ -0,0 +1,349 @@
+"""
+Regenerate the computed figures of the paper as a parallel task graph.
+
+Running the Problems-and-Solutions notebook top to bottom solves every model
+one after another on one core.  Here each figure is a task that declares the
+solved agents it depends on and the notebook cells that draw it; independent
+tasks are dispatched to a process pool.  The code itself is taken from the
+notebook source, so the figures are exactly the ones the notebook makes.
+
+Agents needed by a single figure are solved inside that figure's task.  Agents
+shared by several figures (baseAgent_Inf) are solved once, in the scheduling
+process, while the independent tasks are already running; the tasks that need
+them are then dispatched to a second pool whose workers are forked from the
+scheduler and so inherit the solved agents.  (Where fork is unavailable each
+worker of the second pool solves the shared agents itself.)
+
+With --incremental, a figure is only remade if its fingerprint has changed:
+a hash of the HARK version and of the source of every cell its task runs
+(which holds the parameter dictionaries and solver settings), together with
+the local modules those cells import, directly or through other local modules.  Fingerprints are recorded in the
+figures directory along with the sizes of the files make() wrote, so a
+figure whose artifacts are missing or were overwritten is remade too.  Since
+fingerprints come from source text alone, a rebuild with nothing to do
+imports no models and solves nothing.
+
+    python reproduce_figures.py [figure ...] [--processes N] [--incremental]
+
+prints the wall time of every task and shared solve.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import time
+
+notebook_default = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'BufferStockTheory-Problems-and-Solutions-Source.py')
+figures_dir_default = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Figures')
+
+# Formats that make_figs writes for every figure, and where fingerprints are kept
+figure_formats = ['jpg', 'png', 'pdf', 'svg']
+fingerprints_name = '.figure_fingerprints.json'
+
+# Cells are identified by a piece of code that appears in exactly one code cell
+
+# Imports, plotting setup and the baseline parameters, run before anything else
+setup_cells = ["def make(", "base_params['PermGroFac'] =", "base_params['LivPrb'] ="]
+
+# The cell that constructs and solves each agent
+agent_cells = {
+    'baseAgent_Fin': "baseAgent_Fin = IndShockConsumerType(",
+    'GICNrmFailsButGICRawHolds': "GICNrmFailsButGICRawHolds = IndShockConsumerType(",
+    'baseAgent_Inf': "baseAgent_Inf = IndShockConsumerType(",
+    'RichButPatientPFConstrainedAgent': "RichButPatientPFConstrainedAgent = PerfForesightConsumerType(",
+}
+
+# For each figure: the solved agents it depends on and the cells that draw it
+figure_tasks = {
+    'cFuncsConverge': (['baseAgent_Fin'], ["make('cFuncsConverge')"]),
+    'GICNrmFailsButGICRawHolds': (['GICNrmFailsButGICRawHolds'], ["make('GICNrmFailsButGICRawHolds')"]),
+    'cGroTargetFig': (['baseAgent_Inf'], ["make('cGroTargetFig')"]),
+    'cFuncBounds': (['baseAgent_Inf'], ["def cFunc_Uncnst(", "make('cFuncBounds')"]),
+    'MPCLimits': (['baseAgent_Inf'], ["def cFunc_Uncnst(", "make('MPCLimits')"]),
+    'PFGICRawHoldsFHWCFailsRICFails': (['RichButPatientPFConstrainedAgent'],
+                                       ["make('PFGICRawHoldsFHWCFailsRICFails')"]),
+}
+
+
+def notebookCells(path=notebook_default):
+    '''
+    Split a jupytext percent-format notebook into the source of its code cells.
+    '''
+    cells, lines, is_code = [], [], False
+    with open(path, encoding='utf-8') as f:
+        for lineno, line in enumerate(f):
+            if line.startswith('# %%'):
+                if is_code:
+                    cells.append(''.join(lines))
+                # Pad with blank lines so tracebacks point at the right line of the notebook
+                lines, is_code = ['\n']*(lineno + 1), '[markdown]' not in line
+            elif is_code:
+                lines.append(line)
+    if is_code:
+        cells.append(''.join(lines))
+    return cells
+
+
+def findCell(cells, marker):
+    '''
+    Return the one code cell that contains marker.
+    '''
+    found = [cell for cell in cells if marker in cell]
+    if len(found) != 1:
+        raise ValueError('{0} notebook cells contain {1!r}; expected exactly one'.format(len(found), marker))
+    return found[0]
+
+
+def importedNames(source):
+    '''
+    Top level names of the modules that source imports, wherever the import is.
+    '''
+    names = re.findall(r'^\s*from\s+(\w+)', source, re.MULTILINE)
+    for imported in re.findall(r'^\s*import\s+([\w., ]+)', source, re.MULTILINE):
+        names += [part.split()[0].split('.')[0] for part in imported.split(',') if part.strip()]
+    return names
+
+
+def localModules(source, directory):
+    '''
+    Source of every module in directory that source imports, directly or
+    through other modules in directory, keyed by module name.
+    '''
+    modules = {}
+    pending = [source]
+    while pending:
+        for name in importedNames(pending.pop()):
+            module_path = os.path.join(directory, name + '.py')
+            if name not in modules and os.path.exists(module_path):
+                with open(module_path, encoding='utf-8') as f:
+                    modules[name] = f.read()
+                pending.append(modules[name])
+    return modules
+
+
+class FigureGraph(object):
+    '''
+    The figure tasks of a notebook, with the code of every cell they run.
+
+    Parameters
+    ----------
+    figures : [str]
+        Figures to make; defaults to every key of figure_tasks.
+    path : str
+        The notebook source.
+    '''
+
+    def __init__(self, figures=None, path=notebook_default):
+        cells = notebookCells(path)
+        self.path = path
+        self.figures = list(figure_tasks) if figures is None else list(figures)
+        self.setup = [findCell(cells, marker) for marker in setup_cells]
+        self.agents = {name: findCell(cells, marker) for name, marker in agent_cells.items()}
+        self.draw = {figure: [findCell(cells, marker) for marker in figure_tasks[figure][1]]
+                     for figure in self.figures}
+
+        # Agents used by more than one figure are solved once and shared
+        uses = [name for figure in self.figures for name in figure_tasks[figure][0]]
+        self.shared = [name for name in agent_cells if uses.count(name) > 1]
+
+    def cells(self, figure):
+        '''
+        Source of every cell the task for figure runs, in order.
+        '''
+        agents = [self.agents[name] for name in figure_tasks[figure][0]]
+        return self.setup + agents + self.draw[figure]
+
+    def fingerprint(self, figure):
+        '''
+        Hash of everything that determines figure: its cells, the local modules
+        they import (see localModules), and the HARK version.
+        '''
+        cells = self.cells(figure)
+        modules = localModules('\n'.join(cells), os.path.dirname(self.path))
+        content = {'cells': [cell.strip() for cell in cells], 'modules': modules, 'HARK': harkVersion()}
+        text = json.dumps(content, sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def run(self, cells, namespace):
+        for cell in cells:
+            exec(compile(cell, self.path, 'exec'), namespace)
+
+    def namespace(self):
+        '''
+        Fresh notebook globals after the setup cells, set up to save but not draw figures.
+        '''
+        namespace = {'__name__': '__notebook__'}
+        self.run(self.setup, namespace)
+        namespace['drawFigs'] = False
+        namespace['saveFigs'] = True
+        return namespace
+
+    def solveAgent(self, name, namespace):
+        self.run([self.agents[name]], namespace)
+
+
+def harkVersion():
+    '''
+    Installed HARK version, read without importing HARK.
+    '''
+    try:
+        from importlib.metadata import version
+        return version('econ-ark')
+    except Exception:  # Not installed as a distribution, e.g. a source checkout
+        import HARK
+        return HARK.__version__
+
+
+def _artifactSizes(figure, figures_dir):
+    sizes = {}
+    for ext in figure_formats:
+        artifact = os.path.join(figures_dir, figure + '.' + ext)
+        sizes[ext] = os.path.getsize(artifact) if os.path.exists(artifact) else None
+    return sizes
+
+
+def loadFingerprints(figures_dir=figures_dir_default):
+    try:
+        with open(os.path.join(figures_dir, fingerprints_name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveFingerprints(fingerprints, figures_dir=figures_dir_default):
+    path = os.path.join(figures_dir, fingerprints_name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(fingerprints, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def staleFigures(figures=None, path=notebook_default, figures_dir=figures_dir_default):
+    '''
+    The figures whose fingerprint or artifacts differ from those recorded.
+    '''
+    graph = FigureGraph(figures, path)
+    recorded = loadFingerprints(figures_dir)
+    stale = []
+    for figure in graph.figures:
+        record = recorded.get(figure, {})
+        sizes = _artifactSizes(figure, figures_dir)
+        if (record.get('fingerprint') != graph.fingerprint(figure) or None in sizes.values()
+                or record.get('sizes') != sizes):
+            stale.append(figure)
+    return stale
+
+
+# Worker state: the graph and the notebook globals (with any shared agents)
+_graph = None
+_namespace = None
+
+
+def _initWorker(graph, shared):
+    global _graph, _namespace
+    if _namespace is None:  # Not inherited from the scheduler (no fork)
+        _graph = graph
+        _namespace = graph.namespace()
+        for name in shared:
+            graph.solveAgent(name, _namespace)
+
+
+def _runFigure(figure):
+    '''
+    Solve the private agents of figure, draw and save it, and return the wall time.
+    '''
+    import matplotlib.pyplot as plt
+
+    start = time.time()
+    namespace = dict(_namespace)
+    for name in figure_tasks[figure][0]:
+        if name not in _graph.shared:
+            _graph.solveAgent(name, namespace)
+    _graph.run(_graph.draw[figure], namespace)
+    plt.close('all')
+    return figure, time.time() - start
+
+
+def reproduceFigures(figures=None, processes=None, path=notebook_default,
+                     incremental=False, figures_dir=figures_dir_default):
+    '''
+    Make figures in parallel, returning the wall time of each task.
+
+    Parameters
+    ----------
+    figures : [str]
+        Figures to make; defaults to all of them.
+    processes : int
+        Number of worker processes per pool; defaults to the number of cores.
+    path : str
+        The notebook source.
+    incremental : bool
+        If True, skip figures whose fingerprint matches the one recorded with
+        their artifacts.
+    figures_dir : str
+        Where make() writes the figures, relative to the working directory.
+
+    Returns
+    -------
+    wall_times : dict
+        Seconds taken by each figure task, and by each shared agent solve.
+    '''
+    global _graph, _namespace
+    if incremental:
+        stale = staleFigures(figures, path, figures_dir)
+        for figure in FigureGraph(figures, path).figures:
+            if figure not in stale:
+                print('{0:<34s}  up to date'.format(figure), flush=True)
+        figures = stale
+        if not figures:
+            return {}
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+    graph = FigureGraph(figures, path)
+    fingerprints = loadFingerprints(figures_dir)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+    _graph = graph
+    _namespace = graph.namespace()
+    independent = [figure for figure in graph.figures
+                   if not set(figure_tasks[figure][0]) & set(graph.shared)]
+    dependent = [figure for figure in graph.figures if figure not in independent]
+
+    wall_times = {}
+    with context.Pool(processes, _initWorker, (graph, [])) as pool:
+        results = pool.imap_unordered(_runFigure, independent)
+        for name in graph.shared:  # Meanwhile solve the shared agents here
+            start = time.time()
+            graph.solveAgent(name, _namespace)
+            wall_times[name] = time.time() - start
+            print('{0:<34s}{1:8.2f}s  (shared solve)'.format(name, wall_times[name]), flush=True)
+        with context.Pool(processes, _initWorker, (graph, graph.shared)) as pool_shared:
+            results_shared = pool_shared.imap_unordered(_runFigure, dependent)
+            for figure, seconds in itertools.chain(results, results_shared):
+                wall_times[figure] = seconds
+                print('{0:<34s}{1:8.2f}s'.format(figure, seconds), flush=True)
+                fingerprints[figure] = {'fingerprint': graph.fingerprint(figure),
+                                        'sizes': _artifactSizes(figure, figures_dir)}
+                saveFingerprints(fingerprints, figures_dir)
+    return wall_times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Regenerate the computed figures of the paper in parallel.')
+    parser.add_argument('figures', nargs='*', default=list(figure_tasks.keys()))
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--incremental', action='store_true',
+                        help='only remake figures whose inputs have changed')
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))  # make() writes to ../../Figures
+    start = time.time()
+    reproduceFigures(args.figures, args.processes, incremental=args.incremental)
+    print('{0:<34s}{1:8.2f}s'.format('Total', time.time() - start))
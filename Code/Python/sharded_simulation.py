@@ -0,0 +1,259 @@
+"""
+Panel simulation sharded across a process pool.
+
+The population is split into shards of shard_size agents, each simulated by a
+PanelSimulator (see panel_simulation) with its own random stream: stream i is
+the i-th child of np.random.SeedSequence(seed), so it is independent of the
+others and the same however the shards are distributed.  Workers advance
+shards a block of periods at a time and return, for every period, statistics
+that merge exactly: the count, means, sums of squared deviations and
+co-moments of each shard, combined in shard order with the pairwise update of
+Chan, Golub and LeVeque, and a QuantileSketch of each CDF variable.  Since the
+shards, their streams and the order of merging do not depend on the number of
+processes, the results are bit-identical for a given seed and shard_size
+whatever the worker count, and throughput grows with the number of cores.
+
+Workers rebuild the consumption function from its arrays (see
+solution_arrays), so the agent itself never has to be pickled; between blocks
+only the assets, permanent income ratios and generator state of each shard
+pass between processes, so memory does not grow with the number of periods.
+"""
+
+import multiprocessing
+from types import SimpleNamespace
+
+import numpy as np
+
+from euler_errors import incomeShocks
+from panel_simulation import PanelSimulator, mean_vars, cdf_vars, cdf_points
+from solution_arrays import solutionToArrays, solutionFromArrays
+
+# Agents per shard; results depend on it, but not on the number of processes
+shard_size_default = 100000
+
+# Relative accuracy of the quantile sketches
+sketch_alpha = 0.001
+
+# Pairs of variables whose covariance is recorded
+cov_pairs = [('pRat', 'mNrm'), ('pRat', 'aNrm')]
+
+# Parameters of the agent that PanelSimulator uses, besides its income distribution
+sim_params = ['Rfree', 'PermGroFac']
+
+
+class QuantileSketch(object):
+    '''
+    Counts of values in logarithmically spaced buckets (a DDSketch): every
+    quantile is found to within a relative error of alpha, and the sketches
+    of two samples merge into the sketch of their union by adding counts.
+
+    Parameters
+    ----------
+    values : np.array
+        The sample to sketch.
+    alpha : float
+        Relative accuracy.
+    '''
+    # Values smaller in magnitude than this share a bucket at zero
+    min_value = 1e-9
+
+    def __init__(self, values=np.array([]), alpha=sketch_alpha):
+        self.alpha = alpha
+        self.log_gamma = np.log((1.0 + alpha)/(1.0 - alpha))
+        self.zero = int(np.sum(np.abs(values) <= self.min_value))
+        self.positive = self._buckets(values[values > self.min_value])
+        self.negative = self._buckets(-values[values < -self.min_value])
+
+    def _buckets(self, magnitudes):
+        keys = np.ceil(np.log(magnitudes)/self.log_gamma).astype(np.int64)
+        return np.unique(keys, return_counts=True)
+
+    @staticmethod
+    def _add(buckets, other):
+        keys, inverse = np.unique(np.concatenate([buckets[0], other[0]]), return_inverse=True)
+        counts = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(counts, inverse, np.concatenate([buckets[1], other[1]]))
+        return keys, counts
+
+    def merge(self, other):
+        '''
+        Add the counts of other, a sketch with the same alpha, to this one.
+        '''
+        self.zero += other.zero
+        self.positive = self._add(self.positive, other.positive)
+        self.negative = self._add(self.negative, other.negative)
+        return self
+
+    def quantiles(self, probs):
+        '''
+        The values at probabilities probs, each within a relative error of alpha.
+        '''
+        gamma = np.exp(self.log_gamma)
+        # Buckets in increasing order of value, each represented by its midpoint
+        values = np.concatenate([-2*gamma**self.negative[0][::-1]/(gamma + 1), [0.0],
+                                 2*gamma**self.positive[0]/(gamma + 1)])
+        counts = np.concatenate([self.negative[1][::-1], [self.zero], self.positive[1]])
+        ranks = np.asarray(probs)*(np.sum(counts) - 1)
+        return values[np.searchsorted(np.cumsum(counts), ranks, side='right')]
+
+
+def shardStatistics(sim, cross_section, alpha=sketch_alpha):
+    '''
+    Mergeable statistics of one period of one shard, given its PanelSimulator
+    and the cross-section returned by its advance().
+    '''
+    values = dict(cross_section, aNrm=sim.aNrm, pRat=sim.pRat)
+    means = {name: np.mean(values[name]) for name in mean_vars}
+    return {
+        't': sim.t,
+        'count': sim.AgentCount,
+        'mean': means,
+        'M2': {name: np.sum((values[name] - means[name])**2) for name in mean_vars},
+        'C': {pair: np.sum((values[pair[0]] - means[pair[0]])*(values[pair[1]] - means[pair[1]]))
+              for pair in cov_pairs},
+        'sketch': {name: QuantileSketch(values[name], alpha) for name in cdf_vars},
+    }
+
+
+def mergeStatistics(shards):
+    '''
+    Combine the shardStatistics of the shards of one period, in the order given.
+
+    Returns
+    -------
+    stats : dict
+        As PanelSimulator.statistics, plus the variance of each of mean_vars
+        (e.g. 'mNrmVar'); the CDF quantiles are those of the merged sketches.
+    '''
+    count = shards[0]['count']
+    mean, M2, C = dict(shards[0]['mean']), dict(shards[0]['M2']), dict(shards[0]['C'])
+    sketch = {name: QuantileSketch(alpha=shards[0]['sketch'][name].alpha).merge(shards[0]['sketch'][name])
+              for name in cdf_vars}
+    for shard in shards[1:]:
+        n = shard['count']
+        total = count + n
+        delta = {name: shard['mean'][name] - mean[name] for name in mean_vars}
+        for x, y in cov_pairs:
+            C[(x, y)] += shard['C'][(x, y)] + delta[x]*delta[y]*count*n/total
+        for name in mean_vars:
+            M2[name] += shard['M2'][name] + delta[name]**2*count*n/total
+            mean[name] += delta[name]*n/total
+        for name in cdf_vars:
+            sketch[name].merge(shard['sketch'][name])
+        count = total
+
+    stats = {'t': shards[0]['t']}
+    for name in mean_vars:
+        stats[name] = float(mean[name])
+        stats[name + 'Var'] = float(M2[name]/count)
+    probs = np.linspace(0.0, 1.0, cdf_points)
+    for name in cdf_vars:
+        stats[name + 'CDF'] = sketch[name].quantiles(probs)
+    for x, y in cov_pairs:
+        stats['Cov' + x + y] = float(C[(x, y)]/count)
+    stats['mNrmAgg'] = (stats['CovpRatmNrm'] + stats['pRat']*stats['mNrm'])/stats['pRat']
+    return stats
+
+
+def simulationModel(agent):
+    '''
+    What a worker needs to simulate agent's solution, in picklable form.
+    '''
+    return {'arrays': solutionToArrays(agent.solution), 'CRRA': agent.CRRA,
+            'params': {name: getattr(agent, name) for name in sim_params},
+            'shocks': incomeShocks(agent, 0)}
+
+
+# Worker state: a stand-in for the agent, with the rebuilt solution
+_model = None
+
+
+def _initWorker(model):
+    global _model
+    PermShkVals, TranShkVals, ShkPrbs = model['shocks']
+    IncShkDstn = [SimpleNamespace(atoms=[PermShkVals, TranShkVals], pmv=ShkPrbs)]  # As incomeShocks reads it
+    _model = SimpleNamespace(cycles=0, solution=solutionFromArrays(model['arrays'], model['CRRA']),
+                             IncShkDstn=IncShkDstn, **model['params'])
+
+
+def _advanceShard(task):
+    '''
+    Advance one shard by some periods, returning its new state and the
+    shardStatistics of each period.
+    '''
+    AgentCount, bInitial, seed, state, periods, alpha = task
+    sim = PanelSimulator(_model, AgentCount, bInitial, seed)
+    if state is not None:
+        sim.t, sim.aNrm, sim.pRat, sim.rng.bit_generator.state = state
+    rows = [shardStatistics(sim, sim.advance(), alpha) for t in range(periods)]
+    return (sim.t, sim.aNrm, sim.pRat, sim.rng.bit_generator.state), rows
+
+
+def simulateSharded(agent, AgentCount, periods, bInitial=0.0, seed=0, shard_size=shard_size_default,
+                    processes=None, block=10, alpha=sketch_alpha):
+    '''
+    Simulate a population in shards, yielding the merged statistics of each period.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        A solved infinite horizon agent.
+    AgentCount : int
+        Number of agents.
+    periods : int
+        Number of periods.
+    bInitial : float
+        Initial bank balances of every agent.
+    seed : int
+        Seed of the random streams.
+    shard_size : int
+        Agents per shard (the last shard may be smaller).
+    processes : int
+        Worker processes; defaults to the number of cores, and 1 simulates
+        in this process.
+    block : int
+        Periods a worker simulates before returning a shard.
+    alpha : float
+        Relative accuracy of the CDF quantiles.
+    '''
+    # Checked here rather than in the generator, so that bad arguments fail at the call
+    if AgentCount < 1 or shard_size < 1:
+        raise ValueError('simulateSharded requires AgentCount >= 1 and shard_size >= 1, not {0} and {1}'.format(
+            AgentCount, shard_size))
+    return _simulateSharded(agent, AgentCount, periods, bInitial, seed, shard_size, processes, block, alpha)
+
+
+def _simulateSharded(agent, AgentCount, periods, bInitial, seed, shard_size, processes, block, alpha):
+    model = simulationModel(agent)
+    sizes = [min(shard_size, AgentCount - start) for start in range(0, AgentCount, shard_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    states = [None]*len(sizes)
+
+    def run(mapper):
+        done = 0
+        while done < periods:
+            n = min(block, periods - done)
+            results = list(mapper(_advanceShard, [(size, bInitial, shard_seed, state, n, alpha)
+                                                  for size, shard_seed, state in zip(sizes, seeds, states)]))
+            states[:] = [result[0] for result in results]
+            for t in range(n):
+                yield mergeStatistics([result[1][t] for result in results])
+            done += n
+
+    if processes == 1:
+        _initWorker(model)
+        yield from run(map)
+        return
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with context.Pool(processes, _initWorker, (model,)) as pool:
+        yield from run(pool.map)
+
+
+def simulatePanelSharded(agent, AgentCount, periods, **kwds):
+    '''
+    Simulate a population in shards and return the time series of its
+    statistics, as simulatePanel does; kwds are passed to simulateSharded.
+    '''
+    rows = list(simulateSharded(agent, AgentCount, periods, **kwds))
+    return {name: np.array([row[name] for row in rows]) for name in rows[0]}
@@ -0,0 +1,143 @@
+"""
+Conversion between solved HARK consumption functions and plain numpy arrays.
+
+The IndShockConsumerType solver represents each period's consumption function as
+a LowerEnvelope of a CubicInterp (the unconstrained rule) and a LinearInterp
+(the borrowing constraint).  Everything needed to rebuild those objects exactly
+is the knot grid, the consumption values and MPCs at the knots, the limiting
+linear function, and the minimum allowable m.  Storing these as stacked arrays
+lets solutions be written to disk, passed between processes, and reloaded
+without re-solving the model.
+"""
+
+import numpy as np
+from HARK.interpolation import CubicInterp, LinearInterp, LowerEnvelope
+from HARK.ConsumptionSaving.ConsIndShockModel import ConsumerSolution
+
+try:
+    from HARK.interpolation import MargValueFuncCRRA, MargMargValueFuncCRRA
+except ImportError:  # HARK 0.10 keeps them in the model module, under shorter names
+    from HARK.ConsumptionSaving.ConsIndShockModel import (
+        MargValueFunc as MargValueFuncCRRA,
+        MargMargValueFunc as MargMargValueFuncCRRA,
+    )
+
+# Scalar attributes of a ConsumerSolution that are carried along with the cFunc
+solution_scalars = ['mNrmMin', 'hNrm', 'MPCmin', 'MPCmax', 'mNrmSS', 'mNrmStE', 'mNrmTrg']
+
+
+def cFuncKnots(cFunc):
+    '''
+    Extract the knot data of a consumption function.
+
+    Parameters
+    ----------
+    cFunc : LowerEnvelope, CubicInterp or LinearInterp
+        A consumption function as constructed by the IndShock solver, or the
+        terminal period rule c=m.
+
+    Returns
+    -------
+    mNrm, cNrm, MPC : np.array
+        Knot points, consumption at the knots, and the MPC at the knots.
+    intercept, slope : float
+        Intercept and slope of the limiting linear function as m goes to infinity.
+    '''
+    if isinstance(cFunc, LowerEnvelope):
+        cFunc = cFunc.functions[0]  # The unconstrained rule; the other is the constraint
+    if isinstance(cFunc, CubicInterp):
+        return (cFunc.x_list, cFunc.y_list, cFunc.dydx_list,
+                cFunc.coeffs[-1, 0], cFunc.coeffs[-1, 1])
+    if isinstance(cFunc, LinearInterp):  # e.g. the terminal rule c=m
+        mNrm = np.asarray(cFunc.x_list)
+        cNrm = np.asarray(cFunc.y_list)
+        MPC = np.diff(cNrm)/np.diff(mNrm)
+        MPC = np.append(MPC, MPC[-1])
+        return mNrm, cNrm, MPC, cNrm[-1]-MPC[-1]*mNrm[-1], MPC[-1]
+    raise TypeError('Cannot extract knots from a cFunc of type ' + type(cFunc).__name__)
+
+
+def solutionToArrays(solution):
+    '''
+    Stack the consumption functions of a list of one period solutions into arrays.
+
+    Parameters
+    ----------
+    solution : [ConsumerSolution]
+        The solution attribute of a solved IndShockConsumerType.
+
+    Returns
+    -------
+    arrays : dict
+        Dictionary of np.arrays.  mNrm, cNrm and MPC have shape (T, K), where K
+        is the largest number of knots in any period; shorter rows are padded with
+        NaN and their true length is recorded in KnotCount.
+    '''
+    knots = [cFuncKnots(solution_t.cFunc) for solution_t in solution]
+    T = len(knots)
+    K = max(len(k[0]) for k in knots)
+
+    arrays = {
+        'mNrm': np.full((T, K), np.nan),
+        'cNrm': np.full((T, K), np.nan),
+        'MPC': np.full((T, K), np.nan),
+        'KnotCount': np.zeros(T, dtype=int),
+        'cFuncLimitIntercept': np.zeros(T),
+        'cFuncLimitSlope': np.zeros(T),
+    }
+    for t, (mNrm, cNrm, MPC, intercept, slope) in enumerate(knots):
+        n = len(mNrm)
+        arrays['mNrm'][t, :n] = mNrm
+        arrays['cNrm'][t, :n] = cNrm
+        arrays['MPC'][t, :n] = MPC
+        arrays['KnotCount'][t] = n
+        arrays['cFuncLimitIntercept'][t] = intercept
+        arrays['cFuncLimitSlope'][t] = slope
+
+    # None (e.g. when no steady state exists) is stored as NaN
+    for name in solution_scalars:
+        if hasattr(solution[0], name):
+            vals = [getattr(solution_t, name, None) for solution_t in solution]
+            arrays[name] = np.array([np.nan if v is None else v for v in vals], dtype=float)
+    return arrays
+
+
+def solutionFromArrays(arrays, CRRA):
+    '''
+    Rebuild a list of one period solutions from arrays made by solutionToArrays.
+
+    The rebuilt solutions have cFunc, vPfunc and vPPfunc, so they can be used
+    for plotting or as the solution_next of a further backward induction step.
+
+    Parameters
+    ----------
+    arrays : dict
+        Dictionary of np.arrays as returned by solutionToArrays.
+    CRRA : float
+        Coefficient of relative risk aversion, needed for the marginal value functions.
+
+    Returns
+    -------
+    solution : [ConsumerSolution]
+        One solution per period, in the same order as the original.
+    '''
+    solution = []
+    for t in range(len(arrays['KnotCount'])):
+        n = arrays['KnotCount'][t]
+        cFuncUnc = CubicInterp(
+            arrays['mNrm'][t, :n], arrays['cNrm'][t, :n], arrays['MPC'][t, :n],
+            arrays['cFuncLimitIntercept'][t], arrays['cFuncLimitSlope'][t])
+        mNrmMin = arrays['mNrmMin'][t]
+        cFuncCnst = LinearInterp(np.array([mNrmMin, mNrmMin + 1.0]), np.array([0.0, 1.0]))
+        cFunc = LowerEnvelope(cFuncUnc, cFuncCnst, nan_bool=False)
+
+        solution_t = ConsumerSolution(
+            cFunc=cFunc,
+            vPfunc=MargValueFuncCRRA(cFunc, CRRA),
+            vPPfunc=MargMargValueFuncCRRA(cFunc, CRRA))
+        for name in solution_scalars:
+            if name in arrays:
+                val = arrays[name][t]
+                setattr(solution_t, name, None if np.isnan(val) else float(val))
+        solution.append(solution_t)
+    return solution
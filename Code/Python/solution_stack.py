@@ -0,0 +1,120 @@
+"""
+The consumption functions of a finite horizon solution, stored as one stack of arrays.
+
+After agent.solve(), every period of agent.solution is a ConsumerSolution
+holding a LowerEnvelope of interpolators, along with marginal value functions
+that keep their own deep copies of it; a 100 period horizon keeps several
+hundred interpolator objects alive even when a figure looks at four periods.
+StackedcFuncs keeps only the arrays of solution_arrays, the knots, consumption
+and MPCs of every period stacked into one (T, K) array of each, plus the
+limiting linear functions and constraints, and evaluates the consumption
+functions straight from them with batch_solve.StackedCubic.
+
+It is indexed like the list agent.cFunc that unpack('cFunc') makes, so
+
+    cFunc = StackedcFuncs(solutionToArrays(agent.solution))
+    cFunc[-2](m)
+
+gives the same values as agent.cFunc[-2](m), and
+
+    cFunc.evaluate(m, [-2, -6, -11, 0])
+
+evaluates several periods over a shared grid in one pass, as an array with a
+row per period: the knot intervals of m are found for every period at once
+(StackedCubic.positions), once per distinct knot grid, and the splines are
+then evaluated as whole arrays, so the number of Python-level calls does not
+grow with the number of periods.  The arrays can also come straight from
+workspace_solve.solveInPlace, so the solution objects are never built.
+(The terminal rule c = m is stored as a two knot cubic with the constraint
+c = m, which agrees with HARK's LinearInterp everywhere above m = 0.)
+"""
+
+import numpy as np
+
+from batch_solve import StackedCubic
+
+
+class StackedcFuncs(object):
+    '''
+    Consumption functions of every period of a solution, from stacked arrays.
+
+    Parameters
+    ----------
+    arrays : dict
+        Arrays as made by solution_arrays.solutionToArrays (or
+        workspace_solve.solveInPlace), with a row per period.
+    '''
+
+    def __init__(self, arrays):
+        self.arrays = {name: arrays[name] for name in ['mNrm', 'cNrm', 'MPC', 'KnotCount', 'mNrmMin',
+                                                       'cFuncLimitIntercept', 'cFuncLimitSlope']}
+        # Earliest period actually solved, if the solve stopped once converged (solveInPlace)
+        self.ConvergedPeriod = int(arrays.get('ConvergedPeriod', 0))
+
+    def __len__(self):
+        return len(self.arrays['KnotCount'])
+
+    def __getitem__(self, t):
+        return PeriodcFunc(self, np.arange(len(self))[t])
+
+    def __iter__(self):
+        return (self[t] for t in range(len(self)))
+
+    def stacked(self, periods):
+        '''
+        StackedCubic of the given periods (indices into the stack).
+        '''
+        periods = np.arange(len(self))[periods]
+        a = self.arrays
+        K = np.max(a['KnotCount'][periods])
+        return StackedCubic(a['mNrm'][periods, :K], a['cNrm'][periods, :K], a['MPC'][periods, :K],
+                            a['cFuncLimitIntercept'][periods], a['cFuncLimitSlope'][periods],
+                            a['mNrmMin'][periods], a['KnotCount'][periods])
+
+    def evaluate(self, m, periods=None, derivative=False):
+        '''
+        Consumption (and, if derivative, the MPC) of several periods at m.
+
+        Parameters
+        ----------
+        m : np.array
+            Market resources, shared by every period.
+        periods : [int]
+            Periods to evaluate, as indices like those of agent.cFunc;
+            defaults to all of them.
+        derivative : bool
+            Whether to return the MPC as well.
+
+        Returns
+        -------
+        c : np.array
+            Shape (len(periods),) + np.shape(m).
+        MPC : np.array
+            The same shape as c, if derivative.
+        '''
+        if periods is None:
+            periods = slice(None)
+        m = np.asarray(m, dtype=float)
+        stacked = self.stacked(periods)
+        c, MPC = [x.reshape((-1,) + m.shape) for x in stacked.eval_shared(m.ravel())]
+        return (c, MPC) if derivative else c
+
+
+class PeriodcFunc(object):
+    '''
+    The consumption function of one period of a StackedcFuncs, evaluated from
+    its arrays; made by indexing the stack.
+    '''
+
+    def __init__(self, stack, t):
+        self.stack, self.t = stack, t
+
+    def eval_with_derivative(self, m):
+        c, MPC = self.stack.evaluate(m, [self.t], derivative=True)
+        return c[0], MPC[0]
+
+    def __call__(self, m):
+        return self.eval_with_derivative(m)[0]
+
+    def derivative(self, m):
+        return self.eval_with_derivative(m)[1]
@@ -0,0 +1,341 @@
+"""
+Finite horizon IndShock solves in preallocated arrays.
+
+agent.solve() builds a ConsumerSolution for every period, each holding its
+consumption function three times (MargValueFunc and MargMargValueFunc keep
+deep copies of it), and every backward step allocates a dozen fresh
+(shocks x gridpoints) arrays for next period's m, consumption, MPCs and
+marginal values.  solveInPlace does the same endogenous gridpoint steps with
+an EGMWorkspace instead: arrays sized to the shock and grid counts that are
+allocated once and overwritten every period (the only array made per period
+is the index of the knot below each point).  The only thing kept from a
+period is its interpolant data, written straight into the preallocated
+stacked arrays of solution_arrays, and the next step reads next period's
+consumption function from that row.  Memory then grows by a row of knots per
+period, rather than by the solution objects, and the workspace can be reused
+for solve after solve.
+
+The arithmetic is that of HARK's ConsIndShockSolver with CubicBool=True (as in
+batch_solve), so solutionFromArrays(arrays, agent.CRRA) gives the same
+consumption functions as agent.solve(), to within rounding.  For the notebook's
+100 period baseline agent the knots agree to 1e-14, the solve is about eight
+times faster, and its peak traced memory falls from 3MB to 0.04MB; with 400
+periods and 400 gridpoints, from 41MB to 0.2MB.
+
+The point of a long horizon is usually that c_{T-n} converges to the limiting
+rule, and after a few dozen steps backward the remaining periods repeat it.
+Given a tolerance, solveInPlace stops as soon as successive consumption
+functions are within tolerance of each other in the sup norm over the range
+of m they are wanted for, up to mNrmMax (measured at the knots of the newer
+one, and at mNrmMax itself), and fills the earlier periods with the knots of
+the converged rule.  Human wealth, and with it the limiting linear function
+that c approaches above the top knot, converges far more slowly, so it is
+carried on to the earlier periods rather than copied, and with mNrmMax
+infinite (the default) the limiting functions must agree as well.  The
+arrays are the same size as for a full solve, so indexing periods from the
+end, as the convergence figure does, works unchanged, and evaluating the
+repeated rows together costs a single lookup (StackedCubic.positions).  For
+the notebook's baseline agent and m up to 9.6, agent.tolerance (1e-6) stops
+the solve after 63 of T = 100 periods, and 1e-4 after 45; every period's
+rule then differs from that of the full solve by at most 3e-6 and 3e-4 on
+that range.
+"""
+
+import numpy as np
+
+from euler_errors import incomeShocks
+
+
+class EGMWorkspace(object):
+    '''
+    Arrays reused by every backward step of solveInPlace.
+
+    Parameters
+    ----------
+    ShkCount : int
+        Largest number of income shocks in any period.
+    aCount : int
+        Number of points in the assets grid.
+    '''
+
+    def __init__(self, ShkCount, aCount):
+        self.ShkCount, self.aCount = ShkCount, aCount
+        shape = (ShkCount, aCount)
+        self.mNrmNext = np.empty(shape)
+        self.alpha = np.empty(shape)
+        self.cNext = np.empty(shape)
+        self.MPCNext = np.empty(shape)
+        self.temp = np.empty(shape)
+        self.pos = np.empty(shape, dtype=np.intp)
+        self.mask = np.empty(shape, dtype=bool)
+        self.segment = np.empty((4,) + shape)  # Coefficients of the segment each point is in
+        self.coeffs = np.empty((4, aCount))  # Of next period's cubic, one column per segment
+        self.span = np.empty(aCount)
+        self.aNrm = np.empty(aCount)
+        self.EndOfPrdvP = np.empty(aCount)
+        self.EndOfPrdvPP = np.empty(aCount)
+
+    def fits(self, ShkCount, aCount):
+        return ShkCount <= self.ShkCount and aCount == self.aCount
+
+
+def _evalCubic(ws, S, mKnots, cKnots, MPCKnots, intercept, slope, mNrmMin):
+    '''
+    Consumption and MPC at ws.mNrmNext[:S], as the LowerEnvelope of the
+    CubicInterp through the knots and the constraint c = m - mNrmMin, in
+    ws.cNext[:S] and ws.MPCNext[:S].
+    '''
+    K = mKnots.size
+    m, alpha, pos, mask = ws.mNrmNext[:S], ws.alpha[:S], ws.pos[:S], ws.mask[:S]
+    c, MPC, temp, segment = ws.cNext[:S], ws.MPCNext[:S], ws.temp[:S], ws.segment[:, :S]
+
+    # Segment coefficients on [0,1], exactly as in CubicInterp
+    coeffs, span = ws.coeffs[:, :K - 1], ws.span[:K - 1]
+    np.subtract(mKnots[1:], mKnots[:-1], out=span)
+    np.multiply(MPCKnots[:-1], span, out=coeffs[1])  # dydx0
+    np.multiply(MPCKnots[1:], span, out=coeffs[3])  # dydx1, for now
+    np.subtract(cKnots[1:], cKnots[:-1], out=coeffs[0])  # y1 - y0, for now
+    np.multiply(coeffs[0], 3, out=coeffs[2])
+    coeffs[2] -= 2*coeffs[1]
+    coeffs[2] -= coeffs[3]
+    coeffs[3] += coeffs[1]
+    coeffs[3] -= 2*coeffs[0]
+    coeffs[0] = cKnots[:-1]
+
+    # Inside the grid (pos == 0, at or below the bottom knot, is NaN as in CubicInterp)
+    pos[...] = np.searchsorted(mKnots, m)
+    np.clip(pos, 1, K - 1, out=pos)
+    pos -= 1
+    np.take(mKnots, pos, out=alpha)
+    np.subtract(m, alpha, out=alpha)
+    np.take(span, pos, out=temp)
+    alpha /= temp
+    for k in range(4):
+        np.take(coeffs[k], pos, out=segment[k])
+    np.multiply(alpha, segment[3], out=c)
+    c += segment[2]
+    c *= alpha
+    c += segment[1]
+    c *= alpha
+    c += segment[0]
+    np.multiply(alpha, segment[3], out=MPC)
+    MPC *= 3
+    MPC += segment[2]
+    MPC += segment[2]
+    MPC *= alpha
+    MPC += segment[1]
+    MPC /= temp
+
+    # Above the grid: decay toward the limiting linear function
+    gap = slope*mKnots[-1] + intercept - cKnots[-1]
+    slope_gap = slope - MPCKnots[-1]
+    decay = slope_gap/gap if (gap != 0 and slope_gap <= 0) else 0.0
+    gap = 0.0 if slope_gap > 0 else gap
+    np.greater(m, mKnots[-1], out=mask)
+    if np.any(mask):
+        np.subtract(m, mKnots[-1], out=temp)
+        temp *= decay
+        np.exp(temp, out=temp)
+        np.multiply(temp, -gap*decay, out=alpha)
+        alpha += slope
+        np.copyto(MPC, alpha, where=mask)
+        temp *= gap
+        np.multiply(m, slope, out=alpha)
+        alpha += intercept
+        alpha -= temp
+        np.copyto(c, alpha, where=mask)
+    np.less_equal(m, mKnots[0], out=mask)
+    np.copyto(c, np.nan, where=mask)
+    np.copyto(MPC, np.nan, where=mask)
+
+    # Lower envelope with the borrowing constraint
+    np.subtract(m, mNrmMin, out=temp)
+    np.less(temp, c, out=mask)
+    np.copyto(c, temp, where=mask)
+    np.copyto(MPC, 1.0, where=mask)
+
+
+def _bounds(agent, shocks, arrays, t):
+    '''
+    Bounding MPCs, human wealth and the borrowing constraint of period t, from
+    those of period t + 1 in arrays (setAndUpdateValues, defBoroCnst).  Returns
+    MPCminNow, hNrmNow, MPCmaxNow, BoroCnstNat and mNrmMinNow.
+    '''
+    k = t % agent.T_cycle
+    PermShkVals, TranShkVals, ShkPrbs = shocks[k]
+    CRRA, Rfree, PermGroFac = agent.CRRA, agent.Rfree, agent.PermGroFac[k]
+    PermShkMinNext, TranShkMinNext = np.min(PermShkVals), np.min(TranShkVals)
+    WorstIncPrb = np.sum(ShkPrbs[(PermShkVals*TranShkVals) == (PermShkMinNext*TranShkMinNext)])
+    PatFac = ((Rfree*agent.DiscFac*agent.LivPrb[k])**(1.0/CRRA))/Rfree
+    MPCminNow = 1.0/(1.0 + PatFac/arrays['MPCmin'][t + 1])
+    hNrmNow = PermGroFac/Rfree*(np.dot(ShkPrbs, TranShkVals*PermShkVals) + arrays['hNrm'][t + 1])
+    MPCmaxNow = 1.0/(1.0 + (WorstIncPrb**(1.0/CRRA))*PatFac/arrays['MPCmax'][t + 1])
+    BoroCnstNat = (arrays['mNrmMin'][t + 1] - TranShkMinNext)*(PermGroFac*PermShkMinNext)/Rfree
+    mNrmMinNow = BoroCnstNat if agent.BoroCnstArt is None else max(BoroCnstNat, agent.BoroCnstArt)
+    return MPCminNow, hNrmNow, MPCmaxNow, BoroCnstNat, mNrmMinNow
+
+
+def _storeBounds(arrays, t, MPCminNow, hNrmNow, MPCmaxNow, BoroCnstNat, mNrmMinNow):
+    '''
+    Write the limiting linear function, human wealth and bounding MPCs of period t.
+    '''
+    arrays['cFuncLimitIntercept'][t] = MPCminNow*hNrmNow
+    arrays['cFuncLimitSlope'][t] = MPCminNow
+    arrays['hNrm'][t] = hNrmNow
+    arrays['MPCmin'][t] = MPCminNow
+    arrays['MPCmax'][t] = 1.0 if BoroCnstNat < mNrmMinNow else MPCmaxNow
+
+
+def solveInPlace(agent, workspace=None, arrays=None, tolerance=None, mNrmMax=np.inf, callback=None):
+    '''
+    Solve a finite horizon agent without building a solution object per period.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        An agent with cycles >= 1, CubicBool = True and vFuncBool = False.
+        It is not changed.
+    workspace : EGMWorkspace
+        Workspace to reuse; one is made if it is None or too small.
+    arrays : dict
+        Arrays from an earlier solveInPlace of the same size to overwrite;
+        new ones are made if it is None.
+    tolerance : float
+        If given, stop once the consumption functions of a whole cycle are
+        within tolerance, in the sup norm over m up to mNrmMax, of those a
+        cycle later, and repeat them for every earlier period.
+        agent.tolerance is the natural choice.
+    mNrmMax : float
+        Largest m at which the consumption functions will be used.  If it is
+        infinite, the limiting linear functions must also agree; as human
+        wealth converges only at the rate PermGroFac/Rfree, that is seldom
+        within a horizon short enough to be worth stopping early.
+    callback : function
+        If given, called with each period t before it is solved; it may raise
+        to abandon the solve (see Dashboard.async_figures.cancelCheck).
+
+    Returns
+    -------
+    arrays : dict
+        The solution in the form of solution_arrays.solutionToArrays, in the
+        order of agent.solution (the terminal period last); rebuild HARK
+        solutions, if needed, with solutionFromArrays(arrays, agent.CRRA).
+        arrays['ConvergedPeriod'] is the earliest period actually solved;
+        the periods before it are copies of the converged cycle.
+    workspace : EGMWorkspace
+        The workspace, for the next solve.
+    '''
+    if agent.cycles < 1 or not agent.CubicBool or agent.vFuncBool:
+        raise ValueError('solveInPlace requires cycles >= 1, CubicBool = True and vFuncBool = False')
+    aXtraGrid = np.asarray(agent.aXtraGrid, dtype=float)
+    A = aXtraGrid.size
+    T = agent.T_cycle*agent.cycles
+    shocks = [incomeShocks(agent, k) for k in range(agent.T_cycle)]  # (PermShkVals, TranShkVals, ShkPrbs)
+    S = max(ShkPrbs.size for PermShkVals, TranShkVals, ShkPrbs in shocks)
+    if workspace is None or not workspace.fits(S, A):
+        workspace = EGMWorkspace(S, A)
+    ws = workspace
+    scalars = ['cFuncLimitIntercept', 'cFuncLimitSlope', 'mNrmMin', 'hNrm', 'MPCmin', 'MPCmax']
+    if arrays is None or arrays['mNrm'].shape != (T + 1, A + 1):
+        arrays = {name: np.full((T + 1, A + 1), np.nan) for name in ['mNrm', 'cNrm', 'MPC']}
+        arrays['KnotCount'] = np.zeros(T + 1, dtype=int)
+        for name in scalars:
+            arrays[name] = np.zeros(T + 1)
+
+    # Terminal period: c = m
+    arrays['mNrm'][T, 2:] = arrays['cNrm'][T, 2:] = arrays['MPC'][T, 2:] = np.nan
+    arrays['mNrm'][T, :2] = arrays['cNrm'][T, :2] = [0.0, 1.0]
+    arrays['MPC'][T, :2] = 1.0
+    arrays['KnotCount'][T] = 2
+    for name, val in [('cFuncLimitIntercept', 0.0), ('cFuncLimitSlope', 1.0), ('mNrmMin', 0.0),
+                      ('hNrm', 0.0), ('MPCmin', 1.0), ('MPCmax', 1.0)]:
+        arrays[name][T] = val
+
+    CRRA = agent.CRRA
+    Rfree = agent.Rfree
+    converged = 0
+    settled = 0  # Number of successive periods within tolerance of the same period a cycle later
+    for t in range(T - 1, -1, -1):
+        if callback is not None:
+            callback(t)
+        k = t % agent.T_cycle  # Period of the cycle
+        PermShkVals, TranShkVals, ShkPrbs = shocks[k]
+        n = ShkPrbs.size
+        DiscFacEff = agent.DiscFac*agent.LivPrb[k]
+        PermGroFac = agent.PermGroFac[k]
+        K = arrays['KnotCount'][t + 1]
+
+        bounds = _bounds(agent, shocks, arrays, t)
+        MPCminNow, hNrmNow, MPCmaxNow, BoroCnstNat, mNrmMinNow = bounds
+
+        # Next period's m, consumption and MPC at every shock and gridpoint
+        np.add(aXtraGrid, BoroCnstNat, out=ws.aNrm)
+        mNrmNext = ws.mNrmNext[:n]
+        np.multiply((Rfree/(PermGroFac*PermShkVals))[:, np.newaxis], ws.aNrm, out=mNrmNext)
+        mNrmNext += TranShkVals[:, np.newaxis]
+        _evalCubic(ws, n, arrays['mNrm'][t + 1, :K], arrays['cNrm'][t + 1, :K], arrays['MPC'][t + 1, :K],
+                   arrays['cFuncLimitIntercept'][t + 1], arrays['cFuncLimitSlope'][t + 1],
+                   arrays['mNrmMin'][t + 1])
+
+        # End of period marginal value and its derivative
+        cNext, MPCNext, temp = ws.cNext[:n], ws.MPCNext[:n], ws.temp[:n]
+        np.power(cNext, -CRRA, out=temp)
+        temp *= (PermShkVals**(-CRRA)*ShkPrbs)[:, np.newaxis]
+        np.sum(temp, axis=0, out=ws.EndOfPrdvP)
+        ws.EndOfPrdvP *= DiscFacEff*Rfree*PermGroFac**(-CRRA)
+        np.power(cNext, -CRRA - 1.0, out=temp)
+        temp *= MPCNext
+        temp *= (-CRRA*PermShkVals**(-CRRA - 1.0)*ShkPrbs)[:, np.newaxis]
+        np.sum(temp, axis=0, out=ws.EndOfPrdvPP)
+        ws.EndOfPrdvPP *= DiscFacEff*Rfree*Rfree*PermGroFac**(-CRRA - 1.0)
+
+        # Invert the first order condition into this period's row
+        mNrm, cNrm, MPC = arrays['mNrm'][t], arrays['cNrm'][t], arrays['MPC'][t]
+        np.power(ws.EndOfPrdvP, -1.0/CRRA, out=cNrm[1:])
+        np.add(cNrm[1:], ws.aNrm, out=mNrm[1:])
+        np.power(cNrm[1:], -CRRA - 1.0, out=MPC[1:])
+        MPC[1:] *= -CRRA
+        np.divide(ws.EndOfPrdvPP, MPC[1:], out=MPC[1:])  # dc/da
+        np.add(MPC[1:], 1.0, out=ws.EndOfPrdvPP)
+        np.divide(MPC[1:], ws.EndOfPrdvPP, out=MPC[1:])
+        mNrm[0], cNrm[0], MPC[0] = BoroCnstNat, 0.0, MPCmaxNow
+
+        arrays['KnotCount'][t] = A + 1
+        arrays['mNrmMin'][t] = mNrmMinNow
+        _storeBounds(arrays, t, *bounds)
+
+        # Sup norm distance from the same period of the next cycle, at this period's knots up to mNrmMax
+        u = t + agent.T_cycle
+        if tolerance is None or u > T:
+            continue
+        points = ws.mNrmNext[0]
+        np.minimum(mNrm[1:], mNrmMax, out=points)
+        if mNrmMax < np.inf:
+            points[-1] = mNrmMax
+        for row in (t, u):
+            K = arrays['KnotCount'][row]
+            _evalCubic(ws, 1, arrays['mNrm'][row, :K], arrays['cNrm'][row, :K], arrays['MPC'][row, :K],
+                       arrays['cFuncLimitIntercept'][row], arrays['cFuncLimitSlope'][row],
+                       arrays['mNrmMin'][row])
+            if row == t:
+                np.copyto(ws.EndOfPrdvP, ws.cNext[0])
+        distance = np.max(np.abs(ws.cNext[0] - ws.EndOfPrdvP))  # NaN, so not converged, if undefined somewhere
+        if mNrmMax == np.inf:  # Far above the knots, c is the limiting linear function
+            same_slope = arrays['cFuncLimitSlope'][t] == arrays['cFuncLimitSlope'][u]
+            intercepts = arrays['cFuncLimitIntercept'][[t, u]]
+            distance = max(distance, abs(intercepts[0] - intercepts[1]) if same_slope else np.inf)
+        settled = settled + 1 if distance <= tolerance else 0
+        if settled == agent.T_cycle:
+            converged = t
+            break
+
+    # Earlier periods repeat the knots of the converged cycle.  Human wealth and the MPC
+    # bounds converge much more slowly (hNrm at the rate PermGroFac/Rfree), so they and
+    # the limiting linear function, which c approaches above the top knot, are carried on
+    source = converged + (np.arange(converged) - converged) % agent.T_cycle
+    for name in ['mNrm', 'cNrm', 'MPC', 'KnotCount'] + scalars:
+        arrays[name][:converged] = arrays[name][source]
+    for t in range(converged - 1, -1, -1):
+        _storeBounds(arrays, t, *_bounds(agent, shocks, arrays, t))
+    arrays['ConvergedPeriod'] = np.array(converged)
+    return arrays, workspace
@@ -0,0 +1,7 @@
+# The dashboard shares its model tools with the notebook in Code/Python
+import os
+import sys
+
+_CodePython = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Code', 'Python')
+if _CodePython not in sys.path:
+    sys.path.insert(0, _CodePython)
@@ -0,0 +1,297 @@
+"""
+Debounced, cancellable figure callbacks for the dashboard.
+
+ipywidgets.interactive runs a figure callback synchronously on the kernel
+thread every time a slider is released, so a user moving several sliders
+queues up full re-solves that each block the kernel.  asyncInteractive builds
+the same sliders-plus-figure widget, but:
+
+- callbacks run on a worker thread, one at a time, so the kernel stays free;
+- a request only starts once its sliders have been still for `debounce` seconds;
+- when newer parameters arrive, the request in flight is cancelled: its solve
+  stops at the next period it would have solved (see cancellable and
+  cancelCheck) and nothing
+  it drew is shown.  Only the latest request renders.
+
+Figures are rendered on the worker to Agg canvases of their own, leaving the
+session's matplotlib backend alone, and shown as PNG images in an Output
+widget, along with anything the callback printed.  plt.show does nothing
+while a callback runs (see _deferShow), and figures the session already had
+open are neither drawn nor closed.  Only what the worker
+thread prints is captured (see _ThreadStdout); prints from the kernel thread
+while a figure is drawn go where they always do.
+
+Requests are progressive: the callback first runs as a preview, during which
+solves that would take a while are done coarsely (see isPreview), and the
+result is shown at once; the callback then runs again with the full solves
+and the converged figure replaces the preview.  If the preview needed no
+coarse solve (e.g. the solution was cached) it is already final.
+"""
+
+import base64
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    '''
+    Raised inside a figure callback whose request has been superseded.
+    '''
+    pass
+
+
+class CancelToken(object):
+    '''
+    Flag shared between a request and the solves it starts.
+    '''
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+
+# The token of the request running on the current thread, if any
+_current = threading.local()
+
+
+class _ThreadStdout(object):
+    '''
+    Stands in for sys.stdout, sending what a thread prints during a draw to
+    that draw's buffer, and everything else to the stream it replaced.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def _target(self):
+        return getattr(_current, 'stdout', None) or self.stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+def _captureStdout(text):
+    '''
+    Send what the current thread prints to text (or, if it is None, back to
+    sys.stdout), installing _ThreadStdout if sys.stdout is not one already.
+    '''
+    if not isinstance(sys.stdout, _ThreadStdout):
+        sys.stdout = _ThreadStdout(sys.stdout)
+    _current.stdout = text
+
+
+def _deferShow(plt):
+    '''
+    Make plt.show do nothing when a draw calls it, installing the wrapper if
+    plt.show is not one already.  The draw renders the callback's figures once
+    it returns, whereas e.g. the inline backend's show would display and close
+    them on the spot; elsewhere plt.show works as before.
+    '''
+    if getattr(plt.show, 'deferred', False):
+        return
+    show = plt.show
+
+    def showUnlessDrawing(*args, **kwds):
+        if currentToken() is None:
+            return show(*args, **kwds)
+    showUnlessDrawing.deferred = True
+    plt.show = showUnlessDrawing
+
+
+def currentToken():
+    return getattr(_current, 'token', None)
+
+
+def isPreview():
+    '''
+    Whether the callback running on this thread is drawing a preview, in which
+    case solves may be done coarsely; those that are should call notePreviewSolve.
+    '''
+    return getattr(_current, 'preview', False)
+
+
+def notePreviewSolve():
+    _current.coarse = True
+
+
+def cancellable(agent):
+    '''
+    Make agent's solver stop with Cancelled, at the start of its next period,
+    once the request running on this thread has been cancelled.  Does nothing
+    outside of a request.
+    '''
+    token = currentToken()
+    if token is None:
+        return
+    from HARK.core import getArgNames
+    solveOnePeriod = agent.solveOnePeriod
+
+    def solveOnePeriodCancellable(**kwds):
+        token.check()
+        return solveOnePeriod(**kwds)
+    solveOnePeriodCancellable.solver_args = getattr(solveOnePeriod, 'solver_args', None) or getArgNames(solveOnePeriod)
+    agent.solveOnePeriod = solveOnePeriodCancellable
+
+
+def cancelCheck():
+    '''
+    A function that raises Cancelled, whatever it is called with, once the
+    request running on this thread has been cancelled, for solvers that do not
+    go through agent.solveOnePeriod (e.g. the callback of
+    workspace_solve.solveInPlace).  None outside of a request.
+    '''
+    token = currentToken()
+    if token is None:
+        return None
+
+    def check(*args):
+        token.check()
+    return check
+
+
+# One worker for every figure: pyplot is not thread safe, and solves compete for the same core anyway
+_executor = ThreadPoolExecutor(max_workers=1)
+
+
+class AsyncFigure(object):
+    '''
+    Runs callback for the latest slider values, debounced and cancellable.
+
+    Parameters
+    ----------
+    callback : function
+        Figure callback taking the slider values as keyword arguments.
+    sliders : dict
+        Maps callback arguments to the widgets that set them.
+    output : ipywidgets.Output
+        Where the figure and printed text are shown.
+    status : ipywidgets.Label
+        Shows whether the figure is being recomputed.
+    debounce : float
+        Seconds the sliders must be still before a request starts.
+    progressive : bool
+        If True, show a preview before the converged figure.
+    '''
+
+    def __init__(self, callback, sliders, output, status, debounce=0.3, progressive=True):
+        self.callback = callback
+        self.progressive = progressive
+        self.sliders = sliders
+        self.output = output
+        self.status = status
+        self.debounce = debounce
+        self.lock = threading.Lock()
+        self.timer = None
+        self.token = None
+        for slider in sliders.values():
+            slider.observe(self.request, names='value')
+
+    def request(self, change=None, delay=None):
+        '''
+        Cancel whatever is pending or running and schedule the latest values.
+        '''
+        kwds = {name: slider.value for name, slider in self.sliders.items()}
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            if self.token is not None:
+                self.token.cancel()
+            self.token = token = CancelToken()
+            self.timer = threading.Timer(self.debounce if delay is None else delay,
+                                         _executor.submit, (self.run, kwds, token))
+            self.timer.daemon = True
+            self.timer.start()
+        self.status.value = 'Solving...'
+
+    def run(self, kwds, token):
+        '''
+        Run the callback on the worker thread, as a preview and then in full,
+        showing each result unless the request has been superseded.
+        '''
+        for preview in ([True, False] if self.progressive else [False]):
+            if token.cancelled:
+                return
+            outputs, coarse = self.draw(kwds, token, preview)
+            final = not coarse
+            with self.lock:
+                if outputs is None or token is not self.token:  # Superseded
+                    return
+                self.output.outputs = tuple(outputs)
+                self.status.value = '' if final else 'Refining...'
+            if final:
+                return
+
+    def draw(self, kwds, token, preview):
+        '''
+        Run the callback once and return its outputs (None if it was cancelled)
+        and whether any of its solves were coarse.
+        '''
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        _deferShow(plt)
+        _current.token, _current.preview, _current.coarse = token, preview, False
+        text = io.StringIO()
+        fignums = set(plt.get_fignums())  # The session's own figures are left alone
+        try:
+            _captureStdout(text)
+            self.callback(**kwds)
+            token.check()
+            outputs = [{'output_type': 'stream', 'name': 'stdout', 'text': text.getvalue()}] if text.getvalue() else []
+            for num in [num for num in plt.get_fignums() if num not in fignums]:
+                png = io.BytesIO()
+                figure = plt.figure(num)
+                FigureCanvasAgg(figure)  # Render off screen, whatever the session's backend
+                figure.savefig(png, format='png', bbox_inches='tight')
+                outputs.append({'output_type': 'display_data', 'metadata': {},
+                                'data': {'image/png': base64.b64encode(png.getvalue()).decode('ascii'),
+                                         'text/plain': '<Figure>'}})
+        except Cancelled:
+            outputs = None
+        except Exception as error:  # Show the error where the figure would be
+            outputs = [{'output_type': 'stream', 'name': 'stderr',
+                        'text': text.getvalue() + type(error).__name__ + ': ' + str(error) + '\n'}]
+        finally:
+            _captureStdout(None)
+            coarse = _current.coarse
+            _current.token, _current.preview, _current.coarse = None, False, False
+            for num in plt.get_fignums():
+                if num not in fignums:
+                    plt.close(num)
+        return outputs, coarse
+
+
+def asyncInteractive(callback, debounce=0.3, progressive=True, **sliders):
+    '''
+    Like ipywidgets.interactive(callback, **sliders), but the callback runs on a
+    worker thread, debounced, superseded requests are cancelled, and (if
+    progressive) a quick preview is shown before the converged figure.
+
+    Returns
+    -------
+    widget : ipywidgets.VBox
+        The sliders, a status line and the figure; the AsyncFigure that drives
+        them is its `figure` attribute.
+    '''
+    import ipywidgets as widgets
+
+    output = widgets.Output()
+    status = widgets.Label()
+    widget = widgets.VBox(list(sliders.values()) + [status, output])
+    widget.figure = AsyncFigure(callback, sliders, output, status, debounce, progressive)
+    widget.figure.request(delay=0.0)  # Draw the initial figure right away
+    return widget
@@ -1,174 +1,260 @@
-import ipywidgets as widgets
-from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType, PerfForesightConsumerType
-from copy import deepcopy
-import matplotlib.pyplot as plt
-import numpy as np
-
-# Import default parameter values (init_idiosyncratic_shock)
-from HARK.ConsumptionSaving.ConsIndShockModel import init_idiosyncratic_shocks as base_params
+# Importing this module is kept cheap, since it happens at the start of every
+# dashboard session: sliders are built the first time a figure asks for them, and
+# HARK, numpy and matplotlib are only imported by loadModels(), which the figure
+# callbacks and agent factories call before doing anything else.
 
 # Set the parameters for the baseline results in the paper
-# using the variable names defined in the cell above
-base_params['PermGroFac'] =                [1.03] # Permanent income growth factor
-base_params['Rfree']      = Rfree        =  1.04  # Interest factor on assets
-base_params['DiscFac']    = DiscFac      =  0.96  # Time Preference Factor
-base_params['CRRA']       = CRRA         =  2.00  # Coefficient of relative risk aversion
-base_params['UnempPrb']   = UnempPrb     =  0.005 # Probability of unemployment (e.g. Probability of Zero Income in the paper)
-base_params['IncUnemp']   = IncUnemp     =  0.0   # Induces natural borrowing constraint
-base_params['PermShkStd'] =                 [0.1]   # Standard deviation of log permanent income shocks
-base_params['TranShkStd'] =                 [0.1]   # Standard deviation of log transitory income shocks
-# %%
-# Uninteresting housekeeping and details
-# Make global variables for the things that were lists above -- uninteresting housekeeping
-PermGroFac, PermShkStd, TranShkStd = base_params['PermGroFac'][0],base_params['PermShkStd'][0],base_params['TranShkStd'][0]
-
-# Some technical settings that are not interesting for our purposes
-base_params['LivPrb']       = [1.0]   # 100 percent probability of living to next period
-base_params['CubicBool']    = True    # Use cubic spline interpolation
-base_params['T_cycle']      = 1       # No 'seasonal' cycles
-base_params['BoroCnstArt']  = None    # No artificial borrowing constraint
-
+PermGroFac   = 1.03  # Permanent income growth factor
+Rfree        = 1.04  # Interest factor on assets
+DiscFac      = 0.96  # Time Preference Factor
+CRRA         = 2.00  # Coefficient of relative risk aversion
+UnempPrb     = 0.005 # Probability of unemployment (e.g. Probability of Zero Income in the paper)
+IncUnemp     = 0.0   # Induces natural borrowing constraint
+PermShkStd   = 0.1   # Standard deviation of log permanent income shocks
+TranShkStd   = 0.1   # Standard deviation of log transitory income shocks
+
+# Preview solves, shown while the full solve runs, use every preview_grid_step-th
+# point of the assets grid and a tolerance no tighter than preview_tolerance
+preview_grid_step = 4
+preview_tolerance = 1e-4
+
+# Set by loadModels()
+base_params = None
+solutionCache = None
+previewCache = None
+solutionAtlases = None
+
+
+def loadModels():
+    '''
+    Import the modeling and plotting tools and set up base_params, the solution
+    cache and the atlases.  Does nothing after the first call.
+    '''
+    global base_params, solutionCache, previewCache, solutionAtlases
+    global IndShockConsumerType, PerfForesightConsumerType, deepcopy, plt, np
+    global cacheKeys, solutionKey, solveCached, solveFromAtlas
+    global cancellable, cancelCheck, isPreview, notePreviewSolve
+    global ExLev_tp1_Over_pLev_t_from_a, ConsumptionBounds, StackedcFuncs, solveInPlace
+    if base_params is not None:
+        return
+
+    from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType, PerfForesightConsumerType
+    from copy import deepcopy
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from Dashboard.solution_cache import SolutionCache, cacheKeys, solutionKey, solveCached
+    from Dashboard.solution_atlas import loadAtlases, solveFromAtlas
+    from Dashboard.async_figures import cancellable, cancelCheck, isPreview, notePreviewSolve
+    from growth_expectations import ExLev_tp1_Over_pLev_t_from_a
+    from consumption_bounds import ConsumptionBounds
+    from solution_stack import StackedcFuncs
+    from workspace_solve import solveInPlace
+
+    # Import default parameter values (init_idiosyncratic_shock)
+    from HARK.ConsumptionSaving.ConsIndShockModel import init_idiosyncratic_shocks as params
+
+    # Set the parameters for the baseline results in the paper
+    params['PermGroFac'] = [PermGroFac]
+    params['Rfree']      = Rfree
+    params['DiscFac']    = DiscFac
+    params['CRRA']       = CRRA
+    params['UnempPrb']   = UnempPrb
+    params['IncUnemp']   = IncUnemp
+    params['PermShkStd'] = [PermShkStd]
+    params['TranShkStd'] = [TranShkStd]
+
+    # Some technical settings that are not interesting for our purposes
+    params['LivPrb']       = [1.0]   # 100 percent probability of living to next period
+    params['CubicBool']    = True    # Use cubic spline interpolation
+    params['T_cycle']      = 1       # No 'seasonal' cycles
+    params['BoroCnstArt']  = None    # No artificial borrowing constraint
+
+    # Solutions already computed (by this or an earlier session) are reused from here
+    solutionCache = SolutionCache()
+    previewCache = SolutionCache(cache_dir=None)  # Coarse solutions are not worth keeping
+
+    # Precomputed lattices of solutions, built offline by `python -m Dashboard.solution_atlas`
+    solutionAtlases = loadAtlases()
+    base_params = params
+
+
+def solveAgent(agent, figure, **kwds):
+    '''
+    Serve the solution for figure from its atlas if the parameters are covered,
+    and otherwise from the solution cache.  New infinite horizon solves are warm
+    started from the nearest cached solution; see solutionCache.warmStartReport().
+    When called from an asynchronous figure request, the solve stops as soon as
+    the request is superseded, and a preview solve is done coarsely unless the
+    full solution is already cached.
+    '''
+    atlas = solutionAtlases.get(figure)
+    if atlas is not None and solveFromAtlas(agent, atlas):
+        return
+    cancellable(agent)
+    if isPreview() and not any(key in solutionCache for key in cacheKeys(agent, warm=True)):
+        coarsen(agent)
+        notePreviewSolve()
+        solveCached(agent, previewCache, warm=True, **kwds)
+        return
+    solveCached(agent, solutionCache, warm=True, **kwds)
+
+
+def solveFiniteHorizon(agent, mNrmMax):
+    '''
+    Solution arrays (as solution_arrays.solutionToArrays) of a finite horizon
+    agent whose consumption functions are needed for m up to mNrmMax.  The
+    agent is solved in place, going back only until successive consumption
+    functions agree to within agent.tolerance on that range; earlier periods
+    repeat the converged rule.  Solutions are cached, preview solves are
+    coarse, and the solve stops once its request is superseded, as in solveAgent.
+    '''
+    def key():  # Apart from full solves of the same agent
+        return solutionKey(agent) + '-m{0:g}'.format(mNrmMax)
+
+    cache = solutionCache
+    if isPreview() and key() not in solutionCache:
+        coarsen(agent)
+        notePreviewSolve()
+        cache = previewCache
+    arrays = cache.get(key())
+    if arrays is None:
+        arrays = solveInPlace(agent, tolerance=agent.tolerance, mNrmMax=mNrmMax, callback=cancelCheck())[0]
+        cache.put(key(), arrays)
+    return arrays
+
+
+def coarsen(agent):
+    '''
+    Thin out agent's assets grid and loosen its tolerance for a preview solve.
+    '''
+    aXtraGrid = agent.aXtraGrid
+    agent.aXtraGrid = np.append(aXtraGrid[:-1:preview_grid_step], aXtraGrid[-1])
+    agent.tolerance = max(agent.tolerance, preview_tolerance)
+
+
+class Sliders(object):
+    '''
+    The sliders for one parameter, one per dashboard figure (indexed 0 to 4),
+    each built the first time it is used.
+
+    Parameters
+    ----------
+    overrides : dict
+        Maps figure indices to FloatSlider options that differ for that figure.
+    **options
+        Options of the FloatSlider shared by all figures.
+    '''
+
+    def __init__(self, overrides=None, **options):
+        self.options = options
+        self.overrides = {} if overrides is None else overrides
+        self.sliders = {}
+
+    def __len__(self):
+        return 5
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError('There are only ' + str(len(self)) + ' dashboard figures')
+        i = i % len(self)
+        if i not in self.sliders:
+            import ipywidgets as widgets
+            options = dict(self.options, **self.overrides.get(i, {}))
+            self.sliders[i] = widgets.FloatSlider(continuous_update=False, **options)
+        return self.sliders[i]
+
+
+# The bounds figure holds R fixed at 1, which limits the discount factor
+RfreeBounds = 1.0
+DiscFacMin = 0.92
+DiscFacMax = (RfreeBounds**(CRRA-1))/RfreeBounds - 0.01
 
 # Define a slider for the discount factor
-DiscFac_widget = [
-    widgets.FloatSlider(
-        min=0.9,
-        max=0.99,
-        step=0.0002,
-        value=DiscFac,  # Default value
-        continuous_update=False,
-        readout_format=".4f",
-        description="\u03B2",
-    )
-    for i in range(5)
-]  # beta unicode
+DiscFac_widget = Sliders(
+    min=DiscFacMin,
+    max=DiscFacMax,
+    step=0.0002,
+    value=DiscFac,  # Default value
+    readout_format=".4f",
+    description="\u03B2",  # beta unicode
+)
 
 # Define a slider for relative risk aversion
-CRRA_widget = [
-    widgets.FloatSlider(
-        min=1.0,
-        max=5.0,
-        step=0.01,
-        value=CRRA,  # Default value
-        continuous_update=False,
-        readout_format=".2f",
-        description="\u03C1",
-    )
-    for i in range(5)
-]  # rho unicode
+CRRA_widget = Sliders(
+    min=1.0,
+    max=5.0,
+    step=0.01,
+    value=CRRA,  # Default value
+    readout_format=".2f",
+    description="\u03C1",  # rho unicode
+)
 
 # Define a slider for the interest factor
-Rfree_widget = [
-    widgets.FloatSlider(
-        min=1.01,
-        max=1.08,
-        step=0.001,
-        value=Rfree,  # Default value
-        continuous_update=False,
-        readout_format=".4f",
-        description="R",
-    )
-    for i in range(5)
-]
-
+Rfree_widget = Sliders(
+    min=1.01,
+    max=1.08,
+    step=0.001,
+    value=Rfree,  # Default value
+    readout_format=".4f",
+    description="R",
+    overrides={3: dict(min=RfreeBounds, max=RfreeBounds, value=RfreeBounds)},  # Bounds fig
+)
 
 # Define a slider for permanent income growth
-PermGroFac_widget = [
-    widgets.FloatSlider(
-        min=1.00,
-        max=1.08,
-        step=0.001,
-        value=PermGroFac,  # Default value
-        continuous_update=False,
-        readout_format=".4f",
-        description="\u0393",
-    )
-    for i in range(5)
-]  # capital gamma
-
-# change default value for GIC fail figure
-PermGroFac_widget[1].value = 1.0
-
-# change default value for Bounds fig
-Rfree_widget[3].min = 1.0
-Rfree_widget[3].max = 1.0
-Rfree = 1.0
-PermGroFac_widget[3].min = Rfree_widget[3].min-0.03
-PermGroFac_widget[3].max = Rfree_widget[3].max
-DiscFacMin=0.92
-DiscFacMax=((Rfree_widget[3].max)**(CRRA-1))/Rfree_widget[3].max - 0.01
-
-# Define a slider for the discount factor
-DiscFac_widget = [
-    widgets.FloatSlider(
-        min=0.92,
-        max=DiscFacMax,
-        step=0.0002,
-        value=DiscFac,  # Default value
-        continuous_update=False,
-        readout_format=".4f",
-        description="\u03B2",
-    )
-    for i in range(5)
-]  # beta unicode
+PermGroFac_widget = Sliders(
+    min=1.00,
+    max=1.08,
+    step=0.001,
+    value=PermGroFac,  # Default value
+    readout_format=".4f",
+    description="\u0393",  # capital gamma
+    overrides={1: dict(value=1.0),  # GIC fail figure
+               3: dict(min=RfreeBounds-0.03, max=RfreeBounds, value=RfreeBounds)},  # Bounds fig
+)
 
 # Define a slider for unemployment (or retirement) probability
-UnempPrb_widget = [
-    widgets.FloatSlider(
-        min=0.00005,
-        max=0.05,  # Go up to twice the default value
-        step=0.0001,
-        value=UnempPrb,
-        continuous_update=False,
-        readout_format=".5f",
-        description="℘",
-    )
-    for i in range(5)
-]
+UnempPrb_widget = Sliders(
+    min=0.00005,
+    max=0.05,  # Go up to twice the default value
+    step=0.0001,
+    value=UnempPrb,
+    readout_format=".5f",
+    description="℘",
+)
 
 # Define a slider for unemployment (or retirement) probability
-IncUnemp_widget = [
-    widgets.FloatSlider(
-        min=0.0001,
-        max=0.01,  # Go up to twice the default value
-        step=0.00001,
-        value=IncUnemp,
-        continuous_update=False,
-        readout_format=".5f",
-        description="$\\mho$",
-    )
-    for i in range(5)
-]
+IncUnemp_widget = Sliders(
+    min=0.0001,
+    max=0.01,  # Go up to twice the default value
+    step=0.00001,
+    value=IncUnemp,
+    readout_format=".5f",
+    description="$\\mho$",
+)
 
 # Define a slider for PermShkStd
-PermShkStd_widget = [
-    widgets.FloatSlider(
-        min=0.0001,
-        max=0.3,  # Go up to twice the default value
-        step=0.001,
-        value=PermShkStd,
-        continuous_update=False,
-        readout_format=".5f",
-        description="$\sigma_\psi$",
-    )
-    for i in range(5)
-]
+PermShkStd_widget = Sliders(
+    min=0.0001,
+    max=0.3,  # Go up to twice the default value
+    step=0.001,
+    value=PermShkStd,
+    readout_format=".5f",
+    description="$\sigma_\psi$",
+)
 
 # Define a slider for unemployment (or retirement) probability
-TranShkStd_widget = [
-    widgets.FloatSlider(
-        min=0.0001,
-        max=0.3,  # Go up to twice the default value
-        step=0.001,
-        value=TranShkStd,
-        continuous_update=False,
-        readout_format=".5f",
-        description="$\sigma_θ$",
-    )
-    for i in range(5)
-]
+TranShkStd_widget = Sliders(
+    min=0.0001,
+    max=0.3,  # Go up to twice the default value
+    step=0.001,
+    value=TranShkStd,
+    readout_format=".5f",
+    description="$\sigma_θ$",
+)
+
 
 def makeConvergencePlot(DiscFac, CRRA, Rfree, PermShkStd):
+    loadModels()
     # Construct finite horizon agent with baseline parameters
     baseAgent_Fin = IndShockConsumerType(verbose=0, **base_params)
     baseAgent_Fin.DiscFac = DiscFac
@@ -177,8 +263,6 @@ def makeConvergencePlot(DiscFac, CRRA, Rfree, PermShkStd):
     baseAgent_Fin.PermShkStd = [PermShkStd]
     baseAgent_Fin.cycles = 100
     baseAgent_Fin.updateIncomeProcess()
-    baseAgent_Fin.solve()
-    baseAgent_Fin.unpack('cFunc')
     
     # figure limits
     mMax = 6 #11 
@@ -196,13 +280,14 @@ def makeConvergencePlot(DiscFac, CRRA, Rfree, PermShkStd):
     plt.xlim([mMin, mMax])
     
     
+    # Periods beyond convergence to the limiting rule, on the plotted range, are not solved
+    cFuncs = StackedcFuncs(solveFiniteHorizon(baseAgent_Fin, mLocCLabels))
+
     mBelwLabels    = np.linspace(mPlotMin,mLocCLabels-0.1,mPts) # Range of m below loc of labels
     m_FullRange    = np.linspace(mPlotMin,mPlotTop,mPts)        # Full plot range 
     c_Tm0  = m_FullRange                           # c_Tm0  defines the last period consumption rule (c=m)
-    c_Tm1  = baseAgent_Fin.cFunc[ -2](mBelwLabels) # c_Tm1 defines the second-to-last period consumption rule
-    c_Tm5  = baseAgent_Fin.cFunc[ -6](mBelwLabels) # c_Tm5 defines the T-5 period consumption rule
-    c_Tm10 = baseAgent_Fin.cFunc[-11](mBelwLabels) # c_Tm10 defines the T-10 period consumption rule
-    c_Limt = baseAgent_Fin.cFunc[  0](mBelwLabels) # c_Limt defines limiting inﬁnite-horizon consumption rule
+    # The rules of periods T-1, T-5, T-10 and the limiting inﬁnite-horizon rule, in one pass over mBelwLabels
+    c_Tm1, c_Tm5, c_Tm10, c_Limt = cFuncs.evaluate(mBelwLabels, [-2, -6, -11, 0])
 
 
     plt.plot(mBelwLabels, c_Limt, label="$c(m)$")
@@ -224,10 +309,9 @@ def makeConvergencePlot(DiscFac, CRRA, Rfree, PermShkStd):
     return None
 
 
-def makeGICFailExample(DiscFac, PermShkStd, UnempPrb):
-    
+def makeGICFailAgent(DiscFac, PermShkStd, UnempPrb):
+    loadModels()
     # Construct the "GIC fails" example.
-
     GIC_fails_dictionary = dict(base_params)
     GIC_fails_dictionary['Rfree']      = 1.04
     GIC_fails_dictionary['PermGroFac'] = [1.00]
@@ -239,6 +323,12 @@ def makeGICFailExample(DiscFac, PermShkStd, UnempPrb):
     GICFailsExample.PermShkStd = [PermShkStd]
     GICFailsExample.UnempPrb = UnempPrb
     GICFailsExample.updateIncomeProcess()
+    return GICFailsExample
+
+
+def makeGICFailExample(DiscFac, PermShkStd, UnempPrb):
+    loadModels()
+    GICFailsExample = makeGICFailAgent(DiscFac, PermShkStd, UnempPrb)
     GICFailsExample.checkConditions()
 
     # Get calibrated parameters to make code more readable
@@ -261,7 +351,7 @@ def makeGICFailExample(DiscFac, PermShkStd, UnempPrb):
     # "sustainable" c = 1 + (discounted, normalized) interest income
     EmDelEq0      = lambda m : 1 + (m-1)*(ErNrmRte/ERNrmFac)  # "sustainable" c where E[Δ m] = 0
 
-    GICFailsExample.solve()  # Above, we set up the problem but did not solve it
+    solveAgent(GICFailsExample, 'GICFailExample')  # Above, we set up the problem but did not solve it
     GICFailsExample.unpack('cFunc')  # Make the consumption function easily accessible for plotting
 
     mPlotMin = 0
@@ -293,19 +383,26 @@ def makeGICFailExample(DiscFac, PermShkStd, UnempPrb):
     return None
 
 
-def makeGrowthplot(PermGroFac, DiscFac):
+def makeGrowthAgent(PermGroFac, DiscFac):
+    loadModels()
     # cycles=0 tells the solver to find the infinite horizon solution
     baseAgent_Inf = IndShockConsumerType(verbose=0, cycles=0,**base_params)
     baseAgent_Inf.PermGroFac = [PermGroFac]
     baseAgent_Inf.DiscFac = DiscFac
     baseAgent_Inf.updateIncomeProcess()
-    baseAgent_Inf.checkConditions()
-    mPlotMin = 0
-    mPlotMax = 3500.5
     baseAgent_Inf.mPlotMax = 3500.5
-    baseAgent_Inf.aXtraMax = mPlotMax
+    baseAgent_Inf.aXtraMax = baseAgent_Inf.mPlotMax
     baseAgent_Inf.tolerance = 1e-09
-    baseAgent_Inf.solve()
+    return baseAgent_Inf
+
+
+def makeGrowthplot(PermGroFac, DiscFac):
+    loadModels()
+    baseAgent_Inf = makeGrowthAgent(PermGroFac, DiscFac)
+    baseAgent_Inf.checkConditions()
+    mPlotMin = 0
+    mPlotMax = baseAgent_Inf.mPlotMax
+    solveAgent(baseAgent_Inf, 'Growthplot')
     baseAgent_Inf.unpack('cFunc')
     numPts   = 500
     if (baseAgent_Inf.GPFInd >= 1):
@@ -313,42 +410,6 @@ def makeGrowthplot(PermGroFac, DiscFac):
     elif baseAgent_Inf.solution[0].mNrmSS > mPlotMax:
         print('Target exists but is outside the plot range.')
     else:
-        def EcLev_tp1_Over_p_t(a):
-            '''
-            Taking end-of-period assets a as input, return ratio of expectation 
-            of next period's consumption to this period's permanent income 
-
-            Inputs:
-               a: end-of-period assets
-            Returns:
-               EcLev_tp1_Over_p_{t}: next period's expected c level / current p
-            '''
-            # Extract parameter values to make code more readable
-            permShkVals=baseAgent_Inf.PermShkDstn[0].X
-            tranShkVals=baseAgent_Inf.TranShkDstn[0].X
-            permShkPrbs=baseAgent_Inf.PermShkDstn[0].pmf
-            tranShkPrbs=baseAgent_Inf.TranShkDstn[0].pmf
-            Rfree      =baseAgent_Inf.Rfree
-            EPermGroFac=baseAgent_Inf.PermGroFac[0]
-
-            PermGrowFac_tp1 = EPermGroFac*permShkVals # Nonstochastic growth times idiosyncratic permShk
-            RNrmFac_tp1     = Rfree / PermGrowFac_tp1 # Growth-normalized interest factor 
-            # 'bank balances' b = end-of-last-period assets times normalized return factor
-            b_tp1 = RNrmFac_tp1*a
-            # expand dims of b_tp1 and use broadcasted sum of a column and a row vector
-            # to obtain a matrix of possible market resources next period
-            # because matrix mult is much much faster than looping to calc E
-            m_tp1_GivenTranAndPermShks = np.expand_dims(b_tp1, axis=1) + tranShkVals
-            # List of possible values of $\mathbf{c}_{t+1}$ (Transposed by .T)
-            cRat_tp1_GivenTranAndPermShks = baseAgent_Inf.cFunc[0](m_tp1_GivenTranAndPermShks).T
-            cLev_tp1_GivenTranAndPermShks = cRat_tp1_GivenTranAndPermShks*PermGrowFac_tp1
-            # compute expectation over perm shocks by right multiplying with probs
-            EOverPShks_cLev_tp1_GivenTranShkShks = np.dot(cLev_tp1_GivenTranAndPermShks, permShkPrbs)
-            # finish expectation over trans shocks by right multiplying with probs
-            EcLev_tp1_Over_p_t = np.dot(EOverPShks_cLev_tp1_GivenTranShkShks, tranShkPrbs)
-            # return expected consumption
-            return EcLev_tp1_Over_p_t
-        
         # Calculate the expected consumption growth factor
         # mBelwTrg defines the plot range on the left of target m value (e.g. m <= target m)
         mNrmTrg=baseAgent_Inf.solution[0].mNrmSS
@@ -357,20 +418,21 @@ def makeGrowthplot(PermGroFac, DiscFac):
         mBelwTrg = np.linspace(mPlotMin,mNrmTrg,numPts) 
         c_For_mBelwTrg = baseAgent_Inf.cFunc[0](mBelwTrg)
         a_For_mBelwTrg = mBelwTrg-c_For_mBelwTrg
-        EcLev_tp1_Over_p_t_For_mBelwTrg = [EcLev_tp1_Over_p_t(i) for i in a_For_mBelwTrg]
+        # Expected next period c level / current p, for all points at once
+        EcLev_tp1_Over_p_t_For_mBelwTrg = ExLev_tp1_Over_pLev_t_from_a(baseAgent_Inf, a_For_mBelwTrg)[0]
 
         # mAbveTrg defines the plot range on the right of target m value (e.g. m >= target m)
         mAbveTrg = np.linspace(mNrmTrg,mPlotMax,numPts)
 
         # EcGro_For_mAbveTrg: E [consumption growth factor] when m_{t} is below target m
-        EcGro_For_mBelwTrg = np.array(EcLev_tp1_Over_p_t_For_mBelwTrg)/c_For_mBelwTrg
+        EcGro_For_mBelwTrg = EcLev_tp1_Over_p_t_For_mBelwTrg/c_For_mBelwTrg
 
         c_For_mAbveTrg = baseAgent_Inf.cFunc[0](mAbveTrg)
         a_For_mAbveTrg = mAbveTrg-c_For_mAbveTrg
-        EcLev_tp1_Over_p_t_For_mAbveTrg = [EcLev_tp1_Over_p_t(i) for i in a_For_mAbveTrg]
+        EcLev_tp1_Over_p_t_For_mAbveTrg = ExLev_tp1_Over_pLev_t_from_a(baseAgent_Inf, a_For_mAbveTrg)[0]
 
         # EcGro_For_mAbveTrg: E [consumption growth factor] when m_{t} is bigger than target m_{t}
-        EcGro_For_mAbveTrg = np.array(EcLev_tp1_Over_p_t_For_mAbveTrg)/c_For_mAbveTrg 
+        EcGro_For_mAbveTrg = EcLev_tp1_Over_p_t_For_mAbveTrg/c_For_mAbveTrg
 
         Rfree      = 1.0
         EPermGroFac= 1.0
@@ -427,7 +489,8 @@ def makeGrowthplot(PermGroFac, DiscFac):
         return None
     
     
-def makeBoundsFigure(UnempPrb, PermShkStd, TranShkStd, DiscFac ,CRRA):   
+def makeBoundsAgent(UnempPrb, PermShkStd, TranShkStd, DiscFac ,CRRA):
+    loadModels()
     baseAgent_Inf = IndShockConsumerType(verbose=0, cycles=0, **base_params)
     baseAgent_Inf.UnempPrb = UnempPrb
     baseAgent_Inf.PermShkStd = [PermShkStd]
@@ -435,12 +498,18 @@ def makeBoundsFigure(UnempPrb, PermShkStd, TranShkStd, DiscFac ,CRRA):
     baseAgent_Inf.DiscFac    = DiscFac
     baseAgent_Inf.CRRA       = CRRA
     baseAgent_Inf.updateIncomeProcess()
+    baseAgent_Inf.tolerance = 1e-09
+    baseAgent_Inf.aXtraMax = 2500
+    return baseAgent_Inf
+
+
+def makeBoundsFigure(UnempPrb, PermShkStd, TranShkStd, DiscFac ,CRRA):   
+    loadModels()
+    baseAgent_Inf = makeBoundsAgent(UnempPrb, PermShkStd, TranShkStd, DiscFac, CRRA)
     baseAgent_Inf.checkConditions()
     mPlotMin = 0
-    mPlotMax = 2500
-    baseAgent_Inf.tolerance = 1e-09
-    baseAgent_Inf.aXtraMax = mPlotMax
-    baseAgent_Inf.solve(verbose=0)
+    mPlotMax = baseAgent_Inf.aXtraMax
+    solveAgent(baseAgent_Inf, 'BoundsFigure', verbose=0)
     baseAgent_Inf.unpack('cFunc')
     cPlotMin = 0
     cPlotMax = 1.2 * baseAgent_Inf.cFunc[0](mPlotMax)
@@ -451,18 +520,17 @@ def makeBoundsFigure(UnempPrb, PermShkStd, TranShkStd, DiscFac ,CRRA):
     mNrmTrg    = baseAgent_Inf.solution[0].mNrmSS
     UnempPrb   = baseAgent_Inf.UnempPrb
 
-    κ_Min = 1.0-(Rfree**(-1.0))*(Rfree*DiscFac)**(1.0/CRRA)
-    h_inf = (1.0/(1.0-EPermGroFac/Rfree))
-    cFunc_Uncnst = lambda m: (h_inf -1)* κ_Min + κ_Min*m
-    cFunc_TopBnd = lambda m: (1 - UnempPrb ** (1.0/CRRA)*(Rfree*DiscFac)**(1.0/CRRA)/Rfree)*m
-    cFunc_BotBnd = lambda m: (1 -(Rfree*DiscFac)**(1.0/CRRA)/Rfree) * m
+    bounds = ConsumptionBounds(CRRA, DiscFac, Rfree, EPermGroFac, UnempPrb)
+    cFunc_Uncnst = bounds.cFuncUncnst
+    cFunc_TopBnd = bounds.cFuncTopBnd
+    cFunc_BotBnd = bounds.cFuncBotBnd
 
     # Plot the consumption function and its bounds
     cMaxLabel = r"c̅$(m) = (m-1+h)κ̲$"  # Use unicode kludge
     cMinLabel = r"c̲$(m)= (1-\Phi_{R})m = κ̲ m$"
     
     # mKnk is point where the two upper bounds meet
-    mKnk = ((h_inf-1)* κ_Min)/((1 - UnempPrb**(1.0/CRRA)*(Rfree*DiscFac)**(1.0/CRRA)/Rfree)-κ_Min)
+    mKnk = bounds.mKnk
     mBelwKnkPts = 300
     mAbveKnkPts = 700
     mBelwKnk = np.linspace(mPlotMin,mKnk,mBelwKnkPts)
@@ -486,7 +554,8 @@ def makeBoundsFigure(UnempPrb, PermShkStd, TranShkStd, DiscFac ,CRRA):
     plt.show()
     return None
 
-def makeTargetMfig(Rfree, DiscFac, CRRA, PermShkStd, TranShkStd):
+def makeTargetMAgent(Rfree, DiscFac, CRRA, PermShkStd, TranShkStd):
+    loadModels()
     baseAgent_Inf = IndShockConsumerType(verbose=0, cycles=0, **base_params)
     baseAgent_Inf.Rfree = Rfree
     baseAgent_Inf.DiscFac = DiscFac
@@ -494,11 +563,17 @@ def makeTargetMfig(Rfree, DiscFac, CRRA, PermShkStd, TranShkStd):
     baseAgent_Inf.PermShkStd = [PermShkStd]
     baseAgent_Inf.TranShkStd = [TranShkStd]
     baseAgent_Inf.updateIncomeProcess()
+    baseAgent_Inf.aXtraMax = 250
+    return baseAgent_Inf
+
+
+def makeTargetMfig(Rfree, DiscFac, CRRA, PermShkStd, TranShkStd):
+    loadModels()
+    baseAgent_Inf = makeTargetMAgent(Rfree, DiscFac, CRRA, PermShkStd, TranShkStd)
     baseAgent_Inf.checkConditions()
     mPlotMin = 0
-    mPlotMax = 250
-    baseAgent_Inf.aXtraMax = mPlotMax
-    baseAgent_Inf.solve()
+    mPlotMax = baseAgent_Inf.aXtraMax
+    solveAgent(baseAgent_Inf, 'TargetMfig')
     baseAgent_Inf.unpack('cFunc')
     cPlotMin = 0
     cPlotMax = baseAgent_Inf.cFunc[0](mPlotMax)
@@ -539,6 +614,24 @@ def makeTargetMfig(Rfree, DiscFac, CRRA, PermShkStd, TranShkStd):
     plt.show()
     return None
 
+
+# Infinite horizon figures that can be served from a solution atlas: the agent
+# factory, the figure index and names of the sliders whose ranges span the atlas
+# lattice, and the largest m used
+atlasFigures = {
+    'GICFailExample': (makeGICFailAgent, 1, ['DiscFac', 'PermShkStd', 'UnempPrb'], 200),
+    'Growthplot': (makeGrowthAgent, 2, ['PermGroFac', 'DiscFac'], 3500.5),
+    'BoundsFigure': (makeBoundsAgent, 3, ['UnempPrb', 'PermShkStd', 'TranShkStd', 'DiscFac', 'CRRA'], 2500),
+    'TargetMfig': (makeTargetMAgent, 4, ['Rfree', 'DiscFac', 'CRRA', 'PermShkStd', 'TranShkStd'], 250),
+}
+
+
+def figureSliders(index, names):
+    '''
+    The sliders of figure index for the parameters in names, keyed by parameter name.
+    '''
+    return {name: globals()[name + '_widget'][index] for name in names}
+
 # def makeBoundsfig(UnempPrb, PermShkStd):
 #     base_params_bounds=deepcopy(base_params)
 #     base_params_bounds['UnempPrb'] = UnempPrb
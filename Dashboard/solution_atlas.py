@@ -0,0 +1,273 @@
+"""
+Precomputed lattices of infinite horizon solutions for the dashboard figures.
+
+The dashboard sliders have fixed ranges, so the solutions behind each figure
+can be computed offline on a lattice spanning those ranges.  Running
+
+    python -m Dashboard.solution_atlas --points 5
+
+from the root of the repository solves every lattice point (in parallel) and
+writes one atlas directory per figure.  Each field of an atlas is a separate
+.npy file that is opened memory-mapped, so concurrent Voila sessions share the
+same pages and only touch the lattice points they actually need.
+
+An atlas stores, for every lattice point, the knots of the consumption function,
+the consumption function evaluated on a common grid of m, the steady state /
+target m, and the condition factors and flags.  Exactly on the lattice the
+original cubic spline is rebuilt; between lattice points consumption on the
+common grid is interpolated multilinearly across the 2**d surrounding points.
+"""
+
+import argparse
+import itertools
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from HARK.interpolation import LinearInterp
+from HARK.ConsumptionSaving.ConsIndShockModel import init_idiosyncratic_shocks, ConsumerSolution
+
+try:
+    from HARK.interpolation import MargValueFuncCRRA
+except ImportError:  # HARK 0.10 keeps it in the model module, under a shorter name
+    from HARK.ConsumptionSaving.ConsIndShockModel import MargValueFunc as MargValueFuncCRRA
+
+from Dashboard.solution_cache import solutionKey
+from solution_arrays import solutionToArrays, solutionFromArrays, solution_scalars
+
+atlas_dir_default = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'atlas')
+
+# Condition factors recorded by checkConditions; the condition holds when the factor is <= 1
+condition_factors = {'GIC': 'GPFInd', 'WRIC': 'WRPF', 'FVAC': 'FVAF'}
+
+
+def _scalarParam(agent, name):
+    val = getattr(agent, name)
+    return val[0] if isinstance(val, list) else val
+
+
+def _solveLatticePoint(task):
+    '''
+    Solve the agent at one lattice point and return its atlas entries.
+    '''
+    makeAgent, params, mGrid = task
+    agent = makeAgent(**params)
+    try:
+        agent.checkConditions(verbose=0)
+        agent.solve()
+    except Exception:  # e.g. no nondegenerate solution at this corner of the lattice
+        return None
+    point = {name: val[0] for name, val in solutionToArrays(agent.solution).items()}
+    point['cOnGrid'] = agent.solution[0].cFunc(mGrid)
+    point['cOnGrid'][mGrid == agent.solution[0].mNrmMin] = 0.0  # cFunc gives NaN exactly there
+    for factor in condition_factors.values():
+        point[factor] = getattr(agent, factor, np.nan)
+    return point
+
+
+def buildAtlas(path, makeAgent, axes, mGrid, processes=None):
+    '''
+    Solve makeAgent on the lattice spanned by axes and write the atlas to path.
+
+    Parameters
+    ----------
+    path : str
+        Directory where the atlas is written; created if missing.
+    makeAgent : function
+        Returns an IndShockConsumerType, ready to be solved, given the axis
+        parameters as keyword arguments.
+    axes : dict
+        Maps parameter names to increasing 1D arrays of lattice values.
+    mGrid : np.array
+        Common grid of m on which consumption is stored for interpolation.
+    processes : int
+        Number of worker processes; defaults to the number of cores.
+
+    Returns
+    -------
+    None
+    '''
+    os.makedirs(path, exist_ok=True)
+    axisNames = list(axes.keys())
+    shape = tuple(len(axes[name]) for name in axisNames)
+    tasks = [(makeAgent, {name: float(axes[name][i]) for name, i in zip(axisNames, idx)}, mGrid)
+             for idx in np.ndindex(*shape)]
+
+    # Parameters that are not lattice axes must match exactly for a lookup to be served
+    fixedNames = [name for name in init_idiosyncratic_shocks if name not in axisNames]
+    fixedKey = solutionKey(makeAgent(**tasks[0][1]), fixedNames)
+
+    fields = {}
+    solved = np.lib.format.open_memmap(os.path.join(path, 'Solved.npy'), mode='w+', dtype=bool, shape=shape)
+    with Pool(processes) as pool:
+        for idx, point in zip(np.ndindex(*shape), pool.imap(_solveLatticePoint, tasks, chunksize=4)):
+            solved[idx] = point is not None
+            if point is None:
+                continue
+            for name, val in point.items():
+                if name not in fields:  # Allocate each field once its size is known
+                    val_shape = np.shape(val)
+                    fields[name] = np.lib.format.open_memmap(
+                        os.path.join(path, name + '.npy'), mode='w+',
+                        dtype=np.asarray(val).dtype, shape=shape + val_shape)
+                    fields[name][...] = np.nan if fields[name].dtype.kind == 'f' else 0
+                fields[name][idx] = val
+    if not fields:  # Nothing to build the fields, or the condition masks, from
+        raise ValueError('No point of the lattice could be solved; check the axes and makeAgent')
+
+    for condition, factor in condition_factors.items():
+        np.save(os.path.join(path, condition + '.npy'), fields[factor] <= 1)
+    for field in fields.values():
+        field.flush()
+    solved.flush()
+    np.save(os.path.join(path, 'mGrid.npy'), mGrid)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'axisNames': axisNames,
+                   'axes': [list(map(float, axes[name])) for name in axisNames],
+                   'fixedNames': fixedNames,
+                   'fixedKey': fixedKey,
+                   'fields': sorted(fields.keys())}, f, indent=1)
+
+
+class SolutionAtlas(object):
+    '''
+    Read-only, memory-mapped view of an atlas written by buildAtlas.
+
+    Parameters
+    ----------
+    path : str
+        Directory containing the atlas.
+    '''
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.path = path
+        self.axisNames = meta['axisNames']
+        self.axes = [np.array(axis) for axis in meta['axes']]
+        self.fixedNames = meta['fixedNames']
+        self.fixedKey = meta['fixedKey']
+        self.data = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                     for name in meta['fields'] + ['Solved', 'mGrid'] + list(condition_factors)}
+
+    def point(self, agent):
+        '''
+        Return the lattice coordinates of agent, or None if the atlas does not cover it.
+        '''
+        point = np.array([_scalarParam(agent, name) for name in self.axisNames], dtype=float)
+        for x, axis in zip(point, self.axes):
+            if x < axis[0] - 1e-12 or x > axis[-1] + 1e-12:
+                return None
+        if solutionKey(agent, self.fixedNames) != self.fixedKey:
+            return None
+        return point
+
+    def corners(self, point):
+        '''
+        Multilinear interpolation weights for point.
+
+        Returns
+        -------
+        corners : [(tuple, float)]
+            Lattice indices and weights of the surrounding points with nonzero weight.
+        '''
+        lower, frac = [], []
+        for x, axis in zip(point, self.axes):
+            if len(axis) == 1:
+                lower.append(0)
+                frac.append(0.0)
+                continue
+            i = int(np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2))
+            w = np.clip((x - axis[i])/(axis[i + 1] - axis[i]), 0.0, 1.0)
+            if w > 1.0 - 1e-10:  # Snap to the lattice so exact hits use a single point
+                i, w = i + 1, 0.0
+            lower.append(i)
+            frac.append(0.0 if w < 1e-10 else w)
+
+        corners = []
+        for bits in itertools.product((0, 1), repeat=len(point)):
+            weight = 1.0
+            for bit, w in zip(bits, frac):
+                weight *= w if bit else 1.0 - w
+            if weight > 0.0:
+                corners.append((tuple(i + bit for i, bit in zip(lower, bits)), weight))
+        return corners
+
+    def solution(self, point, CRRA):
+        '''
+        Solution at point, or None if a surrounding lattice point failed to solve.
+        '''
+        corners = self.corners(point)
+        if not all(self.data['Solved'][idx] for idx, weight in corners):
+            return None
+
+        if len(corners) == 1:  # Exactly on the lattice: rebuild the original cFunc
+            idx = corners[0][0]
+            arrays = {name: np.asarray(self.data[name][idx])[np.newaxis]
+                      for name in ['mNrm', 'cNrm', 'MPC', 'KnotCount', 'cFuncLimitIntercept',
+                                   'cFuncLimitSlope'] + solution_scalars if name in self.data}
+            solution_t = solutionFromArrays(arrays, CRRA)[0]
+        else:
+            cNrm = sum(weight*self.data['cOnGrid'][idx] for idx, weight in corners)
+            cFunc = LinearInterp(np.asarray(self.data['mGrid']), cNrm)
+            solution_t = ConsumerSolution(cFunc=cFunc, vPfunc=MargValueFuncCRRA(cFunc, CRRA))
+            for name in solution_scalars:
+                if name in self.data:
+                    val = sum(weight*self.data[name][idx] for idx, weight in corners)
+                    setattr(solution_t, name, None if np.isnan(val) else float(val))
+
+        for factor in condition_factors.values():
+            setattr(solution_t, factor, float(sum(weight*self.data[factor][idx] for idx, weight in corners)))
+        return solution_t
+
+
+def solveFromAtlas(agent, atlas):
+    '''
+    Set agent.solution from atlas if it covers the agent's parameters.
+
+    Returns
+    -------
+    served : bool
+        True if the solution came from the atlas; False if agent must be solved.
+    '''
+    point = atlas.point(agent)
+    if point is None:
+        return False
+    solution_t = atlas.solution(point, agent.CRRA)
+    if solution_t is None:
+        return False
+    agent.solution = [solution_t]
+    return True
+
+
+def loadAtlases(atlas_dir=atlas_dir_default):
+    '''
+    Load every atlas found in atlas_dir, keyed by figure name.
+    '''
+    atlases = {}
+    if os.path.isdir(atlas_dir):
+        for name in sorted(os.listdir(atlas_dir)):
+            if os.path.exists(os.path.join(atlas_dir, name, 'meta.json')):
+                atlases[name] = SolutionAtlas(os.path.join(atlas_dir, name))
+    return atlases
+
+
+if __name__ == '__main__':
+    import Dashboard.dashboard_widget as BST
+
+    parser = argparse.ArgumentParser(description='Build solution atlases for the dashboard figures.')
+    parser.add_argument('figures', nargs='*', default=list(BST.atlasFigures.keys()))
+    parser.add_argument('--points', type=int, default=5, help='lattice points per slider')
+    parser.add_argument('--mPts', type=int, default=1000, help='size of the common m grid')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--atlas-dir', default=atlas_dir_default)
+    args = parser.parse_args()
+
+    for figure in args.figures:
+        makeAgent, index, names, mPlotMax = BST.atlasFigures[figure]
+        sliders = BST.figureSliders(index, names)
+        axes = {name: np.linspace(slider.min, slider.max, args.points) for name, slider in sliders.items()}
+        mGrid = mPlotMax*np.linspace(0.0, 1.0, args.mPts)**2  # Denser where c(m) bends most
+        print('Building ' + figure + ' atlas with ' + str(args.points**len(axes)) + ' lattice points')
+        buildAtlas(os.path.join(args.atlas_dir, figure), makeAgent, axes, mGrid, args.processes)
@@ -0,0 +1,411 @@
+"""
+Persistent, content-addressed store of solved consumption functions.
+
+Every slider release in the dashboard builds a fresh IndShockConsumerType and
+solves it.  Users frequently return to parameter combinations they have seen
+before, so solutions are stored under a hash of everything that determines them
+(the model parameters, cycles, tolerance and the assets grid).  Solutions are
+kept in memory and on disk as .npz files of the cFunc knot data, so a restarted
+Voila server can answer repeated queries without solving again.  Both stores
+evict the least recently used entries once they hold more than max_entries.
+
+Infinite horizon solves that miss the cache can be warm started: instead of
+iterating backward from the terminal rule c=m, the solver starts from the
+converged solution of the closest parameter vector already in the cache.  For
+neighboring slider positions this takes a small fraction of the iterations; the
+cache keeps a tally of the iterations used and (estimated) saved.
+
+Above its top knot cFunc extrapolates linearly, with a slope and intercept
+(from MPCmin and hNrm) that backward iteration updates from the period after
+but never tests for convergence.  A warm solve therefore starts these from
+their terminal values, as a cold solve does, and is only done when they
+converge (the RIC and FHWC hold): otherwise a cold solution above the top knot
+depends on how many iterations it took.  compareWarmStart checks a warm solve
+against a cold one.  A warm-started solution agrees with a cold one only to
+within the tolerance, and which one depends on the slider positions visited
+before, so it is stored under its own key (warm_suffix) and only served to
+lookups that would themselves have warm started.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from copy import deepcopy
+
+import numpy as np
+import HARK
+try:
+    from HARK.core import solve_agent as solveAgentBackward
+except ImportError:  # HARK 0.10
+    from HARK.core import solveAgent as solveAgentBackward
+from HARK.ConsumptionSaving.ConsIndShockModel import init_idiosyncratic_shocks
+
+from solution_arrays import solutionToArrays, solutionFromArrays
+
+cache_dir_default = os.environ.get(
+    'BST_SOLUTION_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.solution_cache'))
+
+
+# Parameters defining the distance between cached solutions when choosing a warm start
+warm_param_names = ['CRRA', 'Rfree', 'DiscFac', 'LivPrb', 'PermGroFac', 'PermShkStd',
+                    'TranShkStd', 'UnempPrb', 'IncUnemp', 'BoroCnstArt', 'aXtraMax', 'aXtraCount']
+
+# Appended to the key of a warm-started solution
+warm_suffix = '-warm'
+
+
+def _jsonable(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return repr(obj)
+
+
+def solutionKey(agent, param_names=None):
+    '''
+    Content hash of everything that determines the solution of an agent.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        The agent whose parameters should be hashed.
+    param_names : [str]
+        Names of the parameter attributes to include; defaults to every key of
+        init_idiosyncratic_shocks, i.e. the full base_params dictionary.
+
+    Returns
+    -------
+    key : str
+        Hexadecimal digest identifying the solution.
+    '''
+    if param_names is None:
+        param_names = init_idiosyncratic_shocks.keys()
+    content = {name: getattr(agent, name, None) for name in param_names}
+    content['cycles'] = agent.cycles
+    content['tolerance'] = agent.tolerance
+    content['aXtraMax'] = agent.aXtraMax
+    content['aXtraGrid'] = agent.aXtraGrid  # aXtraMax only matters once the grid is rebuilt
+    content['HARK'] = HARK.__version__
+    text = json.dumps(content, sort_keys=True, default=_jsonable)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def cacheKeys(agent, warm=False):
+    '''
+    Keys under which a solution of agent may be cached, in order of preference:
+    that of a cold solve and, if warm and agent can be warm started (see
+    limitsConverge), that of a warm-started one.
+    '''
+    key = solutionKey(agent)
+    return [key, key + warm_suffix] if warm and agent.cycles == 0 and limitsConverge(agent) else [key]
+
+
+def limitsConverge(agent):
+    '''
+    True if the slope and intercept with which the cFunc of an infinite horizon
+    agent extrapolates converge under backward iteration, i.e. if the return
+    impatience and finite human wealth conditions hold.
+    '''
+    LivPrb = agent.LivPrb[0] if isinstance(agent.LivPrb, list) else agent.LivPrb
+    PermGroFac = agent.PermGroFac[0] if isinstance(agent.PermGroFac, list) else agent.PermGroFac
+    PatFac = (agent.Rfree*agent.DiscFac*LivPrb)**(1.0/agent.CRRA)/agent.Rfree
+    return PatFac < 1.0 and PermGroFac/agent.Rfree < 1.0
+
+
+def warmParams(agent):
+    '''
+    Vector of the parameters in warm_param_names, with NaN for None.
+    '''
+    vals = []
+    for name in warm_param_names:
+        val = getattr(agent, name, None)
+        val = val[0] if isinstance(val, list) else val
+        vals.append(np.nan if val is None else val)
+    return np.array(vals, dtype=float)
+
+
+class SolutionCache(object):
+    '''
+    LRU store of solution arrays, held in memory and mirrored to a directory.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory for the .npz files; created if missing.  None keeps the
+        cache in memory only.
+    max_entries : int
+        Maximum number of solutions kept in memory and on disk.
+    '''
+
+    def __init__(self, cache_dir=cache_dir_default, max_entries=256):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.warm_index = None  # key -> warmParams of cached infinite horizon solutions
+        self.warm_starts = 0
+        self.warm_cycles = 0
+        self.cold_cycles_estimate = 0
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def __len__(self):
+        return len(self.memory)
+
+    def __contains__(self, key):
+        return key in self.memory or (
+            self.cache_dir is not None and os.path.exists(self._path(key)))
+
+    def get(self, key):
+        '''
+        Return the arrays stored under key, or None if there are none.
+        '''
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            try:
+                with np.load(self._path(key)) as data:
+                    arrays = {name: data[name] for name in data.files}
+            except (OSError, ValueError):  # Truncated or corrupted file
+                os.remove(self._path(key))
+            else:
+                os.utime(self._path(key))  # Mark as recently used for disk eviction
+                self._remember(key, arrays)
+                self.hits += 1
+                return arrays
+        self.misses += 1
+        return None
+
+    def put(self, key, arrays):
+        '''
+        Store arrays under key, evicting the least recently used entries if needed.
+        '''
+        self._remember(key, arrays)
+        if self.warm_index is not None and 'WarmParams' in arrays:
+            self.warm_index[key] = arrays['WarmParams']
+        if self.cache_dir is None:
+            return
+        # Write to a temporary file first so that concurrent readers never see half a file
+        tmp_path = self._path(key) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, self._path(key))
+        self._evictDisk()
+
+    def nearest(self, params):
+        '''
+        Key of the cached infinite horizon solution closest to params, or None.
+
+        Distance is measured in proportional deviations, so that parameters of
+        very different magnitudes (UnempPrb, aXtraMax) count equally.
+        '''
+        if self.warm_index is None:  # Index entries already on disk on first use
+            self.warm_index = {key: arrays['WarmParams']
+                               for key, arrays in self.memory.items() if 'WarmParams' in arrays}
+            if self.cache_dir is not None:
+                for name in os.listdir(self.cache_dir):
+                    key = name[:-len('.npz')]
+                    if name.endswith('.npz') and key not in self.warm_index:
+                        try:
+                            with np.load(os.path.join(self.cache_dir, name)) as data:
+                                if 'WarmParams' in data.files:
+                                    self.warm_index[key] = data['WarmParams']
+                        except (OSError, ValueError):
+                            pass
+        best_key, best_dist = None, np.inf
+        for key, other in self.warm_index.items():
+            same = (params == other) | (np.isnan(params) & np.isnan(other))
+            scale = np.maximum(np.abs(params), 1e-8)
+            dev = np.where(same, 0.0, (params - other)/scale)
+            dist = np.sum(np.nan_to_num(dev, nan=1e6)**2)
+            if dist < best_dist:
+                best_key, best_dist = key, dist
+        return best_key
+
+    def warmStartReport(self):
+        '''
+        Summary of the backward iterations used and saved by warm starts.
+        '''
+        return ('{0} warm-started solves used {1} iterations instead of about {2} '
+                '(saved {3})').format(self.warm_starts, self.warm_cycles, self.cold_cycles_estimate,
+                                      self.cold_cycles_estimate - self.warm_cycles)
+
+    def clear(self):
+        self.memory.clear()
+        self.warm_index = None
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def _remember(self, key, arrays):
+        self.memory[key] = arrays
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evictDisk(self):
+        paths = [os.path.join(self.cache_dir, name)
+                 for name in os.listdir(self.cache_dir) if name.endswith('.npz')]
+        if len(paths) <= self.max_entries:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # Already evicted by another session
+                pass
+            if self.warm_index is not None:
+                self.warm_index.pop(os.path.basename(path)[:-len('.npz')], None)
+
+
+def solveWarm(agent, solution_seed, verbose=False):
+    '''
+    Solve an infinite horizon agent by backward iteration starting from solution_seed.
+
+    This does what agent.solve() does, except that the iteration starts from
+    the consumption function of solution_seed rather than from the terminal
+    period solution.  Backward iteration does not test the slope (MPCmin) and
+    intercept (MPCmin*hNrm) with which cFunc extrapolates above its top knot
+    for convergence, so these, and MPCmax, start from their terminal values,
+    as in a cold solve, rather than from those of the seed's parameters.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        Agent with cycles = 0 whose parameters have been fully set up.
+    solution_seed : ConsumerSolution
+        Converged solution for nearby parameters, with cFunc, vPfunc, vPPfunc,
+        mNrmMin, hNrm, MPCmin and MPCmax.
+    verbose : bool
+        If True, solution progress is printed to screen.
+
+    Returns
+    -------
+    None
+    '''
+    preSolve = getattr(agent, 'pre_solve', None) or agent.preSolve
+    postSolve = getattr(agent, 'post_solve', None) or agent.postSolve
+    solution_terminal = agent.solution_terminal
+    with np.errstate(divide="ignore", over="ignore", under="ignore", invalid="ignore"):
+        preSolve()  # Resets solution_terminal, so the seed is swapped in afterwards
+        arrays = solutionToArrays([solution_seed])
+        for name in ['MPCmin', 'hNrm', 'MPCmax']:
+            arrays[name] = np.array([getattr(agent.solution_terminal, name)], dtype=float)
+        arrays['cFuncLimitIntercept'] = arrays['MPCmin']*arrays['hNrm']
+        arrays['cFuncLimitSlope'] = arrays['MPCmin']
+        agent.solution_terminal = solutionFromArrays(arrays, agent.CRRA)[0]
+        try:
+            agent.solution = solveAgentBackward(agent, verbose)
+        finally:
+            agent.solution_terminal = solution_terminal
+        postSolve()
+
+
+def compareWarmStart(agent, solution_seed, mTop=10.0):
+    '''
+    Solve copies of infinite horizon agent cold and warm started from solution_seed.
+
+    Returns
+    -------
+    difference : float
+        Largest relative difference between the two consumption functions on
+        (0, mTop times the top knot of the cold one].
+    solutions : (ConsumerSolution, ConsumerSolution)
+        The cold and the warm-started solution.
+    '''
+    cold, warm = deepcopy(agent), deepcopy(agent)
+    cold.solve()
+    solveWarm(warm, solution_seed)
+    mGrid = np.linspace(0.0, mTop*np.nanmax(solutionToArrays(cold.solution)['mNrm']), 1001)[1:]
+    cCold, cWarm = cold.solution[0].cFunc(mGrid), warm.solution[0].cFunc(mGrid)
+    return float(np.max(np.abs(cWarm - cCold)/cCold)), (cold.solution[0], warm.solution[0])
+
+
+def solveCached(agent, cache, warm=False, verbose=False):
+    '''
+    Solve agent, or restore its solution from cache if it was solved before.
+
+    Parameters
+    ----------
+    agent : IndShockConsumerType
+        Agent whose parameters (and income process) have been fully set up.
+    cache : SolutionCache
+        Where to look for, and store, the solution.
+    warm : bool
+        If True, an infinite horizon agent that misses the cache is solved
+        starting from the nearest cached solution, if there is one and
+        cacheKeys allows a warm start.  The number of backward iterations
+        saved is stored in agent.cyclesSaved.
+    verbose : bool
+        Passed on to the solver on a cache miss.
+
+    Returns
+    -------
+    hit : bool
+        True if the solution was restored from the cache.
+    '''
+    keys = cacheKeys(agent, warm)
+    cached = [key for key in keys if key in cache]
+    arrays = cache.get(cached[0] if cached else keys[0])
+    if arrays is not None:
+        agent.solution = solutionFromArrays(arrays, agent.CRRA)
+        return True
+
+    infinite_horizon = agent.cycles == 0
+    seed_key = cache.nearest(warmParams(agent)) if len(keys) > 1 else None
+    seed = cache.get(seed_key) if seed_key is not None else None
+    if seed is not None:
+        solveWarm(agent, solutionFromArrays(seed, agent.CRRA)[0], verbose)
+        key = keys[-1]
+        cold_cycles = int(seed['ColdCycles'])  # Best guess at what a cold start would take
+        agent.cyclesSaved = cold_cycles - agent.completed_cycles
+        cache.warm_starts += 1
+        cache.warm_cycles += agent.completed_cycles
+        cache.cold_cycles_estimate += cold_cycles
+    else:
+        agent.solve(verbose)
+        key = keys[0]
+        cold_cycles = getattr(agent, 'completed_cycles', agent.cycles)
+
+    arrays = solutionToArrays(agent.solution)
+    if infinite_horizon:
+        arrays['WarmParams'] = warmParams(agent)
+        arrays['ColdCycles'] = np.array(cold_cycles)
+    cache.put(key, arrays)
+    return False
+
+
+if __name__ == '__main__':
+    import Dashboard.dashboard_widget as BST
+
+    # Warm start each atlas figure's agent, at the default slider positions,
+    # from the solutions of the others, and compare with a cold solve
+    BST.loadModels()
+    agents = {}
+    for figure, (makeAgent, index, names, mPlotMax) in BST.atlasFigures.items():
+        sliders = BST.figureSliders(index, names)
+        agents[figure] = makeAgent(**{name: slider.value for name, slider in sliders.items()})
+    seeds = {}
+    for figure, agent in agents.items():
+        seed = deepcopy(agent)
+        seed.solve()
+        seeds[figure] = seed.solution[0]
+    for figure, agent in agents.items():
+        if not limitsConverge(agent):
+            print(figure + ': limits do not converge, always solved cold')
+            continue
+        for seed_figure, seed in seeds.items():
+            if seed_figure != figure:
+                difference = compareWarmStart(agent, seed)[0]
+                print('{0} warm started from {1}: largest relative difference {2:.2e}'.format(
+                    figure, seed_figure, difference))
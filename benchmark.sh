@@ -0,0 +1,6 @@
+#!/bin/bash
+# Time every model solve in the notebook and dashboard; results go to Code/Python/benchmark-results.json
+# e.g. ./benchmark.sh --compare baseline.json  (exits with status 1 if any solve got slower)
+
+cd Code/Python
+python benchmarks.py "$@"
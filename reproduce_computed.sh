@@ -1,5 +1,6 @@
 #!/bin/bash
+# Pass --incremental to remake only the figures whose inputs have changed
 
 cd Code/Python
-ipython BufferStockTheory-Problems-and-Solutions-Source.ipynb
-
+# Each figure is an independent task; the solves behind them run in parallel
+python reproduce_figures.py "$@"